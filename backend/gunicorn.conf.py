@@ -0,0 +1,70 @@
+"""gunicorn設定（本番用）
+
+起動: gunicorn -c gunicorn.conf.py（backendディレクトリで実行）
+ローカル開発は従来通り python src/app/logic/api.py（Flask開発サーバー）を使う。
+
+- ワーカープロセス × スレッド（gthread）: Gemini / PubMed呼び出しは待ち時間が大半のため、
+  1プロセス内の複数スレッドで並行に処理し、プロセス数でマルチコアを使う
+- preload_app: アプリのimportをマスターで1回だけ行い、ワーカーはforkで共有する（重いSDKは各ワーカーで初回利用時にimport）
+- post_fork: gRPCチャネル・HTTP接続プールはfork後に共有できないため、ワーカーごとに作り直す
+"""
+import multiprocessing
+import os
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+# アプリ（src/app/logic/api.py の app）
+wsgi_app = 'app.logic.api:app'
+pythonpath = 'src'
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# ワーカー数 × スレッド数（WEB_CONCURRENCY / GUNICORN_THREADS で調整可能）
+# メモリ消費はプロセス数に比例するため、ワーカー数は控えめにしてスレッドで並行数を稼ぐ
+workers = _env_int('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4))
+worker_class = 'gthread'
+threads = _env_int('GUNICORN_THREADS', 8)
+
+# E-utilitiesのレート制限（トークンバケット）はワーカーごとのため、NCBIの制限をワーカー数で分割する
+os.environ.setdefault('EUTILS_PROCESSES', str(workers))
+
+preload_app = True
+
+# タイムアウト
+# - timeout: 応答しないワーカーの強制再起動（gthreadではリクエスト処理中もハートビートは継続する）
+# - graceful_timeout: 再起動・停止時（max_requestsによる入れ替えを含む）に処理中のリクエストを待つ時間
+#   （SSEのAI応答が途中で切れないよう、Geminiストリーミングの最大秒数 + 余裕）
+# - keepalive: リバースプロキシとの接続を維持する秒数
+# Geminiストリーミングの最大秒数（upstream_service.UPSTREAM_DEFAULTSのstream_timeoutと同じ既定値）
+GEMINI_STREAM_TIMEOUT = _env_int('UPSTREAM_GEMINI_STREAM_TIMEOUT', 120)
+GRACEFUL_TIMEOUT_MARGIN = 30
+
+timeout = _env_int('GUNICORN_TIMEOUT', 120)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', GEMINI_STREAM_TIMEOUT + GRACEFUL_TIMEOUT_MARGIN)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+# 一定リクエストごとにワーカーを入れ替える（メモリ断片化・リーク対策、jitterで同時再起動を避ける）
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """マスターでの起動完了時: preload中に作られた接続を閉じてからワーカーをforkする"""
+    from app.services import eutils_client, firestore_client
+
+    firestore_client.reset_client()
+    eutils_client.reset_client()
+
+
+def post_fork(server, worker):
+    """ワーカー起動時: Firestore / E-utilitiesクライアントをワーカー内で作り直す"""
+    from app.services import eutils_client, firestore_client
+
+    firestore_client.reset_client()
+    eutils_client.reset_client()
+    server.log.info(f"Worker {worker.pid}: clients reset after fork")
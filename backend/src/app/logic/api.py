@@ -1,11 +1,12 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import firebase_admin
-from firebase_admin import credentials
+import gzip
+import hashlib
 import os
 import json
 import re
 import sys
+import zlib
 from dotenv import load_dotenv
 
 # .envファイルから環境変数を読み込み（サービスインポート前に実行）
@@ -16,24 +17,9 @@ load_dotenv(dotenv_path=env_path)
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 
 # サービスモジュールのインポート（.env読み込み後）
-from app.services import customer_service, weight_service, ai_service, research_service, training_service, meal_service, user_service
-
-# Firebase認証情報の読み込み（ローカル/本番環境対応）
-if 'GOOGLE_CREDENTIALS' in os.environ:
-    # 本番環境（Render.com）: 環境変数から読み込み
-    cred_dict = json.loads(os.environ['GOOGLE_CREDENTIALS'])
-    cred = credentials.Certificate(cred_dict)
-else:
-    # ローカル環境: JSONファイルから読み込み
-    key_path = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'keys', 'michela-481217-ca8c2322cbd0.json')
-    cred = credentials.Certificate(key_path)
-
-if not firebase_admin._apps:
-    firebase_admin.initialize_app(cred)
-    print("Firebase initialized")
-    # デフォルトユーザーを初期化（初回のみ）
-    user_service.initialize_default_users()
+from app.services import customer_service, weight_service, ai_service, research_service, training_service, meal_service, user_service, backup_service, cache_service, advice_service, upstream_service, overview_service, firestore_client
 
+# Firebaseの初期化は初回のFirestoreアクセス時に行う（firestore_client）
 app = Flask(__name__)
 
 # CORS設定
@@ -47,9 +33,100 @@ CORS(app,
          "https://michela-git-main.vercel.app",
          re.compile(r"^https://michela-.*\.vercel\.app$")
      ],
+     expose_headers=["X-Next-Cursor", "X-Catalog-Version"],
      supports_credentials=True)
 
 
+# ==================== レスポンス圧縮・ETag ====================
+
+# 圧縮する最小サイズ（小さいレスポンスは圧縮の効果よりCPUコストが大きい）
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+
+
+def _gzip_stream(chunks):
+    """ストリーミング出力をgzipで逐次圧縮"""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip形式
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _accepts_gzip():
+    """クライアントがgzipを受け付けるか（"gzip;q=0"は拒否の指定）"""
+    return request.accept_encodings['gzip'] > 0
+
+
+@app.after_request
+def compress_and_tag(response):
+    """GETのJSONレスポンスにETagを付与し（If-None-Match一致で304）、一定サイズ以上はgzip圧縮
+
+    ETagは本文のハッシュ（強いETag）、エンドポイントで設定済みの場合はそれを使う。
+    圧縮時は表現が異なるため"-gzip"を付けて区別する。
+    SSE（text/event-stream）は逐次配信を妨げないため対象外。
+    """
+    if (request.method not in ('GET', 'HEAD') or response.status_code != 200
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+
+    accepts_gzip = _accepts_gzip()
+    response.vary.add('Accept-Encoding')
+
+    # ストリーミング（/backup_all）: 全体を読まずに逐次圧縮のみ行う
+    if response.is_streamed:
+        if accepts_gzip:
+            response.response = _gzip_stream(response.iter_encoded())
+            response.headers['Content-Encoding'] = 'gzip'
+            response.headers.pop('Content-Length', None)
+        return response
+
+    body = response.get_data()
+    compress = accepts_gzip and len(body) >= COMPRESS_MIN_BYTES
+    # 事前計算済みのETag（_catalog_response）があればハッシュ計算を省略
+    etag = response.get_etag()[0] or hashlib.sha256(body).hexdigest()[:32]
+    etag += '-gzip' if compress else ''
+    response.set_etag(etag)
+    if 'Cache-Control' not in response.headers:
+        # ブラウザに保存させつつ、毎回ETagで再検証させる
+        response.headers['Cache-Control'] = 'private, no-cache'
+
+    if request.if_none_match.contains(etag):
+        response.status_code = 304
+        response.set_data(b'')
+        response.headers.pop('Content-Length', None)
+        return response
+
+    if compress:
+        response.set_data(gzip.compress(body, compresslevel=COMPRESS_LEVEL, mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def _catalog_response(fingerprint, build_body, version=None):
+    """内容のハッシュを事前計算済みのカタログをETag付きで返す
+
+    If-None-Matchが一致すれば本文をシリアライズせずに304を返す。
+    圧縮版のETag（"-gzip"付き）は、gzipを受け付けるクライアントの場合のみ比較する
+    （サイズがCOMPRESS_MIN_BYTES未満なら圧縮されないため、圧縮なしのETagは常に比較する）。
+    """
+    etags = (fingerprint + '-gzip', fingerprint) if _accepts_gzip() else (fingerprint,)
+    for etag in etags:
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            break
+    else:
+        etag = fingerprint
+        response = jsonify(build_body())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    if version is not None:
+        response.headers['X-Catalog-Version'] = str(version)
+    return response
+
+
 # ==================== 認証・ユーザー管理エンドポイント ====================
 
 @app.route('/login', methods=['POST'])
@@ -59,6 +136,8 @@ def login():
     if not data or 'username' not in data or 'password' not in data:
         return jsonify({"error": "Username and password are required"}), 400
     
+    # デフォルトユーザーの初期化（プロセスごとに初回のログイン時のみ）
+    user_service.ensure_default_users()
     user_data, error = user_service.authenticate_user(data['username'], data['password'])
     if error:
         return jsonify({'error': error}), 401
@@ -167,12 +246,43 @@ def update_customer(id):
 @app.route('/delete_customer/<id>', methods=['DELETE'])
 def delete_customer(id):
     try:
+        # ?background=true: 履歴の多い顧客向けにバックグラウンドで削除
+        if request.args.get('background', '').lower() in ('1', 'true'):
+            job = customer_service.start_delete_customer_job(id)
+            return jsonify({"message": "accepted", "job": job}), 202
+        
         customer_service.delete_customer(id)
         return jsonify({"message": "ok"}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/delete_customer_status/<id>', methods=['GET'])
+def delete_customer_status(id):
+    """バックグラウンド削除ジョブの進捗を取得"""
+    job = customer_service.get_delete_customer_job(id)
+    if job is None:
+        return jsonify({'error': 'Delete job not found'}), 404
+    return jsonify(job), 200
+
+
+@app.route('/customer_overview/<customer_id>', methods=['GET'])
+def customer_overview(customer_id):
+    """顧客詳細ページのデータ（顧客情報・体重履歴・トレーニング・食事記録・栄養目標）をまとめて取得"""
+    try:
+        overview, error = overview_service.get_customer_overview(
+            customer_id,
+            weight_limit=request.args.get('weight_limit', overview_service.DEFAULT_WEIGHT_LIMIT, type=int),
+            training_limit=request.args.get('training_limit', overview_service.DEFAULT_TRAINING_LIMIT, type=int),
+            meal_limit=request.args.get('meal_limit', overview_service.DEFAULT_MEAL_LIMIT, type=int)
+        )
+        if error:
+            return jsonify({'error': error}), 404 if error == 'Customer not found' else 500
+        return jsonify(overview), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # ==================== 体重履歴エンドポイント ====================
 
 @app.route('/get_weight_history/<customer_id>', methods=['GET'])
@@ -180,8 +290,30 @@ def get_weight_history(customer_id):
     """顧客IDに基づく体重履歴を取得"""
     try:
         limit = request.args.get('limit', 10, type=int)
-        history = weight_service.get_weight_history(customer_id, limit)
+        start_after = request.args.get('start_after')
+        history = weight_service.get_weight_history(customer_id, limit, start_after)
         return jsonify(history), 200
+    except firestore_client.InvalidCursorError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/get_latest_weights', methods=['POST'])
+def get_latest_weights():
+    """複数顧客の最新体重と最初の体重をまとめて取得（ダッシュボード用）"""
+    data = request.json
+    if not data or not isinstance(data.get('customer_ids'), list):
+        return jsonify({"error": "customer_ids is required"}), 400
+    if not all(firestore_client.is_valid_document_id(cid) for cid in data['customer_ids']):
+        return jsonify({"error": "Invalid customer_id"}), 400
+    try:
+        limit = int(data.get('limit', 1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "limit must be an integer"}), 400
+    try:
+        weights = weight_service.get_latest_weights(data['customer_ids'], limit)
+        return jsonify(weights), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -209,12 +341,18 @@ def add_weight_record(customer_id):
 
 @app.route('/ai_chat', methods=['POST'])
 def ai_chat():
-    """Gemini AIチャット"""
+    """Gemini AIチャット（?stream=true または Accept: text/event-stream でSSE配信）"""
     data = request.json
     if not data or 'message' not in data:
         return jsonify({"error": "Message is required"}), 400
     
-    response_text, error = ai_service.chat_with_ai(data['message'])
+    if _wants_stream():
+        chunks, error, cached_until = ai_service.stream_chat_with_ai(data['message'])
+        if error:
+            return jsonify({"error": error}), 500
+        return _sse_response(chunks, cached_until)
+    
+    response_text, error, _ = ai_service.chat_with_ai(data['message'])
     if error:
         return jsonify({"error": error}), 500
     
@@ -224,129 +362,195 @@ def ai_chat():
     }), 200
 
 
-@app.route('/get_training_advice/<customer_id>', methods=['GET'])
-def get_training_advice(customer_id):
-    """トレーニング記録に基づくAIアドバイス"""
-    try:
-        # 最新のトレーニングセッションを取得（最大10件）
-        sessions = training_service.get_training_sessions_by_customer(customer_id, limit=10)
-        
-        if not sessions:
-            return jsonify({"advice": "まだトレーニング記録がありません。まずはトレーニングを記録してみましょう！"}), 200
-        
-        # 最新1件（今回）と過去3件をまとめる
-        latest_session = sessions[0] if sessions else None
-        past_sessions = sessions[1:4] if len(sessions) > 1 else []
-        
-        # 今回のトレーニング
-        current_summary = "Today:\n"
-        if latest_session:
-            current_summary += f"{latest_session.get('date', '')}\n"
-            for ex in latest_session.get('exercises', []):
-                sets = ", ".join([f"{s.get('reps')}×{s.get('weight')}kg" for s in ex.get('sets', [])])
-                current_summary += f"- {ex.get('exercise_name')}: {sets}\n"
-        
-        # 過去3回の簡潔な記録（進捗比較用）
-        past_summary = "Past 3 sessions:\n"
-        for session in past_sessions:
-            date = session.get('date', '')
-            for ex in session.get('exercises', []):
-                # 最大重量を取得
-                max_weight = max([s.get('weight', 0) for s in ex.get('sets', [])]) if ex.get('sets') else 0
-                sets_count = len(ex.get('sets', []))
-                past_summary += f"{date}: {ex.get('exercise_name')} {sets_count}sets, max {max_weight}kg\n"
+def _wants_stream():
+    """SSEでのストリーミング応答が要求されているか"""
+    return request.args.get('stream') == 'true' or request.accept_mimetypes.best == 'text/event-stream'
+
+
+def _sse_event(data, event=None):
+    """SSEイベントを1件分の文字列に整形"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(chunks, cached_until=None):
+    """テキスト断片をSSEで順次送信（受信した断片はそのまま流し、サーバー側で全文を組み立てない）
+
+    イベント: data {"text": 断片} → event: done {"is_cached", "cached_until"}
+    生成途中のエラーは event: error {"error"} で通知する。
+    """
+    def generate():
+        try:
+            for text in chunks:
+                yield _sse_event({"text": text})
+        except Exception as e:
+            yield _sse_event({"error": str(e)}, event="error")
+            return
         
-        # AIにアドバイスを求める（英語プロンプト、日本語回答）
-        prompt = f"""{current_summary}
+        done = {"is_cached": cached_until is not None}
+        if cached_until:
+            done["cached_until"] = cached_until.isoformat()
+        yield _sse_event(done, event="done")
+    
+    # プロキシ（nginx等）のバッファリングを無効化して断片を即時に届ける
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def _advice_response(customer_id, kind, build_prompt):
+    """AIアドバイスの応答を生成（データ更新がなければキャッシュを返す、SSE配信にも対応）
+
+    Args:
+        build_prompt: 顧客IDからプロンプトを生成する関数
+            （記録がない場合は(None, 案内メッセージ)を返す）
+    """
+    stream = _wants_stream()
+    
+    # データ更新がなければキャッシュ済みアドバイスを返す（記録の取得・AI呼び出しを省略）
+    fingerprint = advice_service.get_fingerprint(customer_id, kind)
+    cached_advice, cached_until = advice_service.get_cached_advice(customer_id, kind, fingerprint)
+    if cached_advice is not None:
+        if stream:
+            return _sse_response(iter([cached_advice]), cached_until)
+        return jsonify({"advice": cached_advice, "cached_until": cached_until.isoformat(), "is_cached": True}), 200
+    
+    prompt, empty_message = build_prompt(customer_id)
+    if prompt is None:
+        if stream:
+            return _sse_response(iter([empty_message]))
+        return jsonify({"advice": empty_message}), 200
+    
+    if stream:
+        # 全文の受信完了時にアドバイスキャッシュへ保存
+        chunks, error, cached_until = ai_service.stream_chat_with_ai(
+            prompt,
+            on_complete=lambda text: advice_service.save_advice(customer_id, kind, fingerprint, text)
+        )
+        if error:
+            return jsonify({"error": error}), 500
+        return _sse_response(chunks, cached_until)
+    
+    advice_text, error, cached_until = ai_service.chat_with_ai(prompt)
+    if error:
+        return jsonify({"error": error}), 500
+    advice_service.save_advice(customer_id, kind, fingerprint, advice_text)
+    
+    response = {"advice": advice_text}
+    if cached_until:
+        response["cached_until"] = cached_until.isoformat()
+        response["is_cached"] = True
+    else:
+        response["is_cached"] = False
+    
+    return jsonify(response), 200
+
+
+def _build_training_advice_prompt(customer_id):
+    """トレーニングアドバイス用のプロンプトを生成（最新セッション + 過去3回）"""
+    # 最新のトレーニングセッションを取得（最大10件）
+    sessions = training_service.get_training_sessions_by_customer(customer_id, limit=10)
+    
+    if not sessions:
+        return None, "まだトレーニング記録がありません。まずはトレーニングを記録してみましょう！"
+    
+    # 最新1件（今回）と過去3件をまとめる
+    latest_session = sessions[0] if sessions else None
+    past_sessions = sessions[1:4] if len(sessions) > 1 else []
+    
+    # 今回のトレーニング
+    current_summary = "Today:\n"
+    if latest_session:
+        current_summary += f"{latest_session.get('date', '')}\n"
+        for ex in latest_session.get('exercises', []):
+            sets = ", ".join([f"{s.get('reps')}×{s.get('weight')}kg" for s in ex.get('sets', [])])
+            current_summary += f"- {ex.get('exercise_name')}: {sets}\n"
+    
+    # 過去3回の簡潔な記録（進捗比較用）
+    past_summary = "Past 3 sessions:\n"
+    for session in past_sessions:
+        date = session.get('date', '')
+        for ex in session.get('exercises', []):
+            # 最大重量を取得
+            max_weight = max([s.get('weight', 0) for s in ex.get('sets', [])]) if ex.get('sets') else 0
+            sets_count = len(ex.get('sets', []))
+            past_summary += f"{date}: {ex.get('exercise_name')} {sets_count}sets, max {max_weight}kg\n"
+    
+    # AIにアドバイスを求める（英語プロンプト、日本語回答）
+    prompt = f"""{current_summary}
 {past_summary}
 
 Context: Warmed up, trainer support, intermediate level, 0kg=bodyweight.
 Compare with past 3 sessions, evaluate progress in 3 points, and advise for next session.
 Please respond in Japanese."""
-        
-        advice_text, error, cached_until = ai_service.chat_with_ai(prompt)
-        if error:
-            return jsonify({"error": error}), 500
-        
-        response = {"advice": advice_text}
-        if cached_until:
-            response["cached_until"] = cached_until.isoformat()
-            response["is_cached"] = True
-        else:
-            response["is_cached"] = False
-        
-        return jsonify(response), 200
+    return prompt, None
+
+
+def _build_meal_advice_prompt(customer_id):
+    """食事アドバイス用のプロンプトを生成（直近3日 + 7日平均 + 目標）"""
+    # 直近7日分の日次ロールアップを取得（記録のある日のみ、新しい順）
+    daily_summaries = meal_service.get_daily_nutrition_range(customer_id, limit=7)
+    
+    if not daily_summaries:
+        return None, "まだ食事記録がありません。まずは食事を記録してみましょう！"
+    
+    # 栄養目標を取得
+    goal, _ = meal_service.get_nutrition_goal(customer_id)
+    
+    total_days = len(daily_summaries)
+    
+    # 最新3日分の記録
+    recent_summary = "【直近3日】\n"
+    for day_data in daily_summaries[:3]:
+        recent_summary += f"{day_data['date']}: {round(day_data['total_calories'])}kcal (P{round(day_data['total_protein'])}g/F{round(day_data['total_fat'])}g/C{round(day_data['total_carbs'])}g)\n"
+    
+    # 7日間平均
+    avg_calories = sum(d['total_calories'] for d in daily_summaries) / total_days
+    avg_protein = sum(d['total_protein'] for d in daily_summaries) / total_days
+    avg_fat = sum(d['total_fat'] for d in daily_summaries) / total_days
+    avg_carbs = sum(d['total_carbs'] for d in daily_summaries) / total_days
+    
+    avg_summary = f"\n【7日平均】\n{round(avg_calories)}kcal (P{round(avg_protein)}g/F{round(avg_fat)}g/C{round(avg_carbs)}g)\n"
+    
+    # 目標との比較
+    goal_summary = f"\n【目標】\n{goal.get('target_calories', 0)}kcal (P{goal.get('target_protein', 0)}g/F{goal.get('target_fat', 0)}g/C{goal.get('target_carbs', 0)}g)\n"
+    
+    # AIにアドバイスを求める（簡潔なプロンプト）
+    prompt = f"""{recent_summary}{avg_summary}{goal_summary}
+前提：目標値設定済。
+直近3日と平均を踏まえ、目標達成度とPFCバランスの総評3点。"""
+    return prompt, None
+
+
+@app.route('/get_training_advice/<customer_id>', methods=['GET'])
+def get_training_advice(customer_id):
+    """トレーニング記録に基づくAIアドバイス（?stream=trueでSSE配信）"""
+    try:
+        return _advice_response(customer_id, advice_service.TRAINING, _build_training_advice_prompt)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/get_meal_advice/<customer_id>', methods=['GET'])
 def get_meal_advice(customer_id):
-    """食事記録に基づくAIアドバイス"""
+    """食事記録に基づくAIアドバイス（?stream=trueでSSE配信）"""
     try:
-        # 最新の食事記録を取得（最大30件、約1週間分）
-        records = meal_service.get_meal_records_by_customer(customer_id, limit=30)
-        
-        if not records:
-            return jsonify({"advice": "まだ食事記録がありません。まずは食事を記録してみましょう！"}), 200
-        
-        # 栄養目標を取得
-        goal, _ = meal_service.get_nutrition_goal(customer_id)
-        
-        # 直近7日間の平均を計算
-        from collections import defaultdict
-        daily_nutrition = defaultdict(lambda: {'calories': 0, 'protein': 0, 'fat': 0, 'carbs': 0, 'count': 0})
-        
-        for record in records:
-            date = record.get('date', '')
-            daily_nutrition[date]['calories'] += record.get('total_calories', 0)
-            daily_nutrition[date]['protein'] += record.get('total_protein', 0)
-            daily_nutrition[date]['fat'] += record.get('total_fat', 0)
-            daily_nutrition[date]['carbs'] += record.get('total_carbs', 0)
-            daily_nutrition[date]['count'] += 1
-        
-        # 直近3日分と平均
-        sorted_dates = sorted(daily_nutrition.keys(), reverse=True)[:7]
-        total_days = len(sorted_dates)
-        
-        # 最新3日分の記録
-        recent_summary = "【直近3日】\n"
-        for date in sorted_dates[:3]:
-            day_data = daily_nutrition[date]
-            recent_summary += f"{date}: {round(day_data['calories'])}kcal (P{round(day_data['protein'])}g/F{round(day_data['fat'])}g/C{round(day_data['carbs'])}g)\n"
-        
-        # 7日間平均
-        avg_calories = sum(daily_nutrition[d]['calories'] for d in sorted_dates) / total_days if total_days > 0 else 0
-        avg_protein = sum(daily_nutrition[d]['protein'] for d in sorted_dates) / total_days if total_days > 0 else 0
-        avg_fat = sum(daily_nutrition[d]['fat'] for d in sorted_dates) / total_days if total_days > 0 else 0
-        avg_carbs = sum(daily_nutrition[d]['carbs'] for d in sorted_dates) / total_days if total_days > 0 else 0
-        
-        avg_summary = f"\n【7日平均】\n{round(avg_calories)}kcal (P{round(avg_protein)}g/F{round(avg_fat)}g/C{round(avg_carbs)}g)\n"
-        
-        # 目標との比較
-        goal_summary = f"\n【目標】\n{goal.get('target_calories', 0)}kcal (P{goal.get('target_protein', 0)}g/F{goal.get('target_fat', 0)}g/C{goal.get('target_carbs', 0)}g)\n"
-        
-        # AIにアドバイスを求める（簡潔なプロンプト）
-        prompt = f"""{recent_summary}{avg_summary}{goal_summary}
-前提：目標値設定済。
-直近3日と平均を踏まえ、目標達成度とPFCバランスの総評3点。"""
-        
-        advice_text, error, cached_until = ai_service.chat_with_ai(prompt)
-        if error:
-            return jsonify({"error": error}), 500
-        
-        response = {"advice": advice_text}
-        if cached_until:
-            response["cached_until"] = cached_until.isoformat()
-            response["is_cached"] = True
-        else:
-            response["is_cached"] = False
-        
-        return jsonify(response), 200
+        return _advice_response(customer_id, advice_service.MEAL, _build_meal_advice_prompt)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """キャッシュのヒット・ミス・追い出し件数を取得"""
+    return jsonify(cache_service.get_all_stats()), 200
+
+
+@app.route('/upstream_stats', methods=['GET'])
+def upstream_stats():
+    """外部API（Gemini / PubMed / 翻訳）の同時実行数・タイムアウト件数を取得"""
+    return jsonify(upstream_service.get_all_stats()), 200
+
+
 # ==================== 研究記事エンドポイント ====================
 
 @app.route('/get_latest_research', methods=['GET'])
@@ -383,7 +587,7 @@ def research_summary(pmid):
     summary, error = research_service.get_research_summary(pmid)
     
     if error:
-        return jsonify({'error': error}), 500
+        return jsonify({'error': error}), 404 if error == 'Article not found' else 500
     
     return jsonify(summary), 200
 
@@ -392,9 +596,17 @@ def research_summary(pmid):
 
 @app.route('/get_exercise_presets', methods=['GET'])
 def get_exercise_presets():
-    """トレーニング種目プリセット一覧を取得"""
-    presets = training_service.get_exercise_presets()
-    return jsonify(presets), 200
+    """トレーニング種目プリセット一覧を取得
+
+    ?since=<版番号> を指定すると、その版以降の変更（追加された種目と削除された種目ID）のみ返す。
+    全件取得時は現在の版番号をX-Catalog-Versionヘッダーで返す。
+    """
+    since = request.args.get('since', type=int)
+    if since is not None:
+        return jsonify(training_service.get_exercise_preset_changes(since)), 200
+
+    catalog = training_service.get_exercise_catalog()
+    return _catalog_response(catalog['fingerprint'], lambda: catalog['presets'], catalog['version'])
 
 
 @app.route('/add_exercise_preset', methods=['POST'])
@@ -446,8 +658,16 @@ def get_training_sessions(customer_id):
     """顧客のトレーニングセッション一覧を取得"""
     try:
         limit = request.args.get('limit', 20, type=int)
-        sessions = training_service.get_training_sessions_by_customer(customer_id, limit)
-        return jsonify(sessions), 200
+        cursor = request.args.get('cursor')
+        sessions, next_cursor = training_service.get_training_sessions_page(customer_id, limit, cursor)
+        
+        # 次ページのカーソルはヘッダーで返す（レスポンス本体は従来通り配列）
+        response = jsonify(sessions)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
+    except firestore_client.InvalidCursorError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -503,8 +723,7 @@ def get_exercise_history(customer_id, exercise_id):
 @app.route('/get_food_presets', methods=['GET'])
 def get_food_presets():
     """食品プリセット一覧を取得"""
-    presets = meal_service.get_food_presets()
-    return jsonify(presets), 200
+    return _catalog_response(meal_service.FOOD_PRESETS_FINGERPRINT, meal_service.get_food_presets)
 
 
 @app.route('/add_meal_record', methods=['POST'])
@@ -608,124 +827,82 @@ def set_nutrition_goal(customer_id):
 
 @app.route('/backup_all', methods=['GET'])
 def backup_all():
-    """全データをJSON形式でバックアップ"""
+    """全データをJSON形式でバックアップ（ストリーミング出力）"""
+    # 各コレクションをページ単位で走査し、ドキュメントごとにレスポンスへ書き出す
+    # 最初のページの取得はここで行うため、開始前のエラーは500で返す
     try:
-        from datetime import datetime
-        
-        # 全コレクションからデータを取得
-        backup_data = {
-            'timestamp': datetime.now().isoformat(),
-            'version': '1.0',
-            'collections': {
-                'customers': customer_service.get_all_customers(),
-                'weight_history': [],
-                'training_sessions': [],
-                'meal_records': [],
-                'nutrition_goals': []
-            }
-        }
-        
-        # 全顧客の関連データを取得
-        customers = customer_service.get_all_customers()
-        for customer in customers:
-            customer_id = customer['id']
-            
-            # 体重履歴
-            weight_history = weight_service.get_weight_history(customer_id, limit=1000)
-            for record in weight_history:
-                record['customer_id'] = customer_id
-            backup_data['collections']['weight_history'].extend(weight_history)
-            
-            # トレーニングセッション
-            training_sessions = training_service.get_training_sessions_by_customer(customer_id, limit=1000)
-            backup_data['collections']['training_sessions'].extend(training_sessions)
-            
-            # 食事記録
-            meal_records = meal_service.get_meal_records_by_customer(customer_id, limit=1000)
-            backup_data['collections']['meal_records'].extend(meal_records)
-            
-            # 栄養目標
-            goal, _ = meal_service.get_nutrition_goal(customer_id)
-            if goal:
-                backup_data['collections']['nutrition_goals'].append(goal)
-        
-        return jsonify(backup_data), 200
+        chunks = backup_service.stream_backup()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    return Response(chunks, mimetype='application/json')
 
 
 @app.route('/restore_backup', methods=['POST'])
 def restore_backup():
     """バックアップデータを復元"""
-    try:
-        from firebase_admin import firestore
-        db = firestore.client()
-        
-        data = request.json
-        if not data or 'collections' not in data:
-            return jsonify({"error": "Invalid backup data"}), 400
-        
-        collections = data['collections']
-        restored_counts = {
-            'customers': 0,
-            'weight_history': 0,
-            'training_sessions': 0,
-            'meal_records': 0,
-            'nutrition_goals': 0
-        }
-        
-        # 顧客データを復元
-        if 'customers' in collections:
-            for customer_data in collections['customers']:
-                customer_id = customer_data.get('id')
-                if customer_id:
-                    # IDを除外してデータを更新
-                    update_data = {k: v for k, v in customer_data.items() if k != 'id'}
-                    db.collection('customer').document(customer_id).set(update_data)
-                    restored_counts['customers'] += 1
-        
-        # 体重履歴を復元
-        if 'weight_history' in collections:
-            for record in collections['weight_history']:
-                record_id = record.get('id')
-                if record_id:
-                    update_data = {k: v for k, v in record.items() if k != 'id'}
-                    db.collection('weight_history').document(record_id).set(update_data)
-                    restored_counts['weight_history'] += 1
-        
-        # トレーニングセッションを復元
-        if 'training_sessions' in collections:
-            for session in collections['training_sessions']:
-                session_id = session.get('id')
-                if session_id:
-                    update_data = {k: v for k, v in session.items() if k != 'id'}
-                    db.collection('training_sessions').document(session_id).set(update_data)
-                    restored_counts['training_sessions'] += 1
-        
-        # 食事記録を復元
-        if 'meal_records' in collections:
-            for record in collections['meal_records']:
-                record_id = record.get('id')
-                if record_id:
-                    update_data = {k: v for k, v in record.items() if k != 'id'}
-                    db.collection('meal_records').document(record_id).set(update_data)
-                    restored_counts['meal_records'] += 1
-        
-        # 栄養目標を復元
-        if 'nutrition_goals' in collections:
-            for goal in collections['nutrition_goals']:
-                customer_id = goal.get('customer_id')
-                if customer_id:
-                    update_data = {k: v for k, v in goal.items() if k != 'customer_id'}
-                    db.collection('nutrition_goals').document(customer_id).set(update_data)
-                    restored_counts['nutrition_goals'] += 1
-        
+    data = request.json
+    if not data or 'collections' not in data:
+        return jsonify({"error": "Invalid backup data"}), 400
+    if not backup_service.is_complete_backup(data):
+        return jsonify({"error": "Incomplete backup data"}), 400
+    
+    # resume_from: 前回失敗時のレスポンスの'resume_from'を渡すと続きから再開
+    # restore_id: クライアントで生成して渡すと、復元中に/restore_progress/<restore_id>で進捗を確認できる
+    result, error = backup_service.restore_backup(
+        data['collections'], data.get('resume_from'), restore_id=data.get('restore_id')
+    )
+    if error:
         return jsonify({
-            "message": "Backup restored successfully",
-            "restored_counts": restored_counts
-        }), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+            'error': error,
+            'restore_id': result['restore_id'],
+            'restored_counts': result['restored_counts'],
+            'resume_from': result['committed']
+        }), 500
+    
+    return jsonify({
+        "message": "Backup restored successfully",
+        "restore_id": result['restore_id'],
+        "restored_counts": result['restored_counts'],
+        "resume_from": result['committed']
+    }), 200
+
+
+@app.route('/restore_progress/<restore_id>', methods=['GET'])
+def restore_progress(restore_id):
+    """復元の進捗（状態とコレクションごとの件数）を取得"""
+    progress, error = backup_service.get_restore_progress(restore_id)
+    if error == 'Restore not found':
+        return jsonify({'error': error}), 404
+    if error:
+        return jsonify({'error': error}), 500
+    return jsonify(progress), 200
+
+
+@app.cli.command('init-users')
+def init_users_command():
+    """デフォルトユーザーを初期化（flask --app src/app/logic/api.py init-users）"""
+    user_service.initialize_default_users()
+
+
+@app.cli.command('backfill-exercise-ids')
+def backfill_exercise_ids_command():
+    """既存セッションに種目インデックス（exercise_ids）を付与（flask --app src/app/logic/api.py backfill-exercise-ids）"""
+    updated = training_service.backfill_exercise_ids()
+    print(f"Backfilled exercise_ids for {updated} training sessions")
+
+
+@app.cli.command('rebuild-daily-nutrition')
+def rebuild_daily_nutrition_command():
+    """食事記録から日次ロールアップを再構築（flask --app src/app/logic/api.py rebuild-daily-nutrition）"""
+    count = meal_service.rebuild_daily_nutrition()
+    print(f"Rebuilt {count} daily nutrition rollups")
+
+
+@app.cli.command('rebuild-weight-summaries')
+def rebuild_weight_summaries_command():
+    """体重履歴から最新体重サマリーを再構築（flask --app src/app/logic/api.py rebuild-weight-summaries）"""
+    count = weight_service.rebuild_weight_summaries()
+    print(f"Rebuilt {count} weight summaries")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,68 @@
+"""AIアドバイスのキャッシュ管理サービス
+
+アドバイスは(顧客ID, データの最終更新日時)をキーにキャッシュする。
+トレーニング・食事の書き込み時にadvice_fingerprints/{customer_id}の更新日時を進めることで、
+古いアドバイスは自動的に参照されなくなる（全ワーカー共通で無効化される）。
+"""
+from datetime import datetime
+
+from app.services import cache_service, firestore_client
+
+# アドバイスの種類
+TRAINING = 'training'
+MEAL = 'meal'
+
+ADVICE_CACHE_MINUTES = 60  # アドバイスキャッシュの有効期限（60分）
+
+_cache = cache_service.create_cache('advice', ttl_seconds=ADVICE_CACHE_MINUTES * 60, max_entries=512)
+
+
+def get_db():
+    """Firestoreクライアントを取得（プロセス内で共有）"""
+    return firestore_client.get_client()
+
+
+def _fingerprint_ref(db, customer_id):
+    return db.collection('advice_fingerprints').document(customer_id)
+
+
+def touch(db, customer_id, kind, writer=None):
+    """顧客データの更新を記録（該当種類のアドバイスキャッシュを無効化）
+
+    Args:
+        writer: バッチ/トランザクション（指定時はその中で書き込む）
+    """
+    if not customer_id:
+        return
+    data = {f'{kind}_updated_at': datetime.now().isoformat()}
+    ref = _fingerprint_ref(db, customer_id)
+    if writer is not None:
+        writer.set(ref, data, merge=True)
+    else:
+        ref.set(data, merge=True)
+
+
+def get_fingerprint(customer_id, kind):
+    """顧客データの最終更新日時を取得（記録がなければNone）"""
+    doc = _fingerprint_ref(get_db(), customer_id).get()
+    if not doc.exists:
+        return None
+    return doc.to_dict().get(f'{kind}_updated_at')
+
+
+def _cache_key(customer_id, kind, fingerprint):
+    return f'{kind}:{customer_id}:{fingerprint}'
+
+
+def get_cached_advice(customer_id, kind, fingerprint):
+    """キャッシュ済みアドバイスを取得
+
+    Returns:
+        tuple: (advice, cached_until) キャッシュがなければ(None, None)
+    """
+    return _cache.get(_cache_key(customer_id, kind, fingerprint))
+
+
+def save_advice(customer_id, kind, fingerprint, advice):
+    """アドバイスをキャッシュに保存"""
+    _cache.set(_cache_key(customer_id, kind, fingerprint), advice)
@@ -1,19 +1,31 @@
 """AI機能サービス（Gemini API）"""
 import os
-import google.generativeai as genai
-from datetime import datetime, timedelta
 import hashlib
 
+from app.services import cache_service, gemini_client, upstream_service
+
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
 if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
     print(f"Gemini API configured: {GEMINI_API_KEY[:10]}...")
 else:
     print("WARNING: GEMINI_API_KEY not found in environment variables")
 
-# キャッシュ（メモリ内）
-_cache = {}
+MODEL_NAME = 'gemini-2.5-flash'
 CACHE_DURATION_MINUTES = 60  # キャッシュの有効期限（60分）
+CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', 256))
+CACHE_MAX_BYTES = int(os.environ.get('AI_CACHE_MAX_BYTES', 4 * 1024 * 1024))
+
+# キャッシュ（LRU + TTL、CACHE_BACKEND=sqliteでワーカー間共有）
+_cache = cache_service.create_cache(
+    'ai_chat',
+    ttl_seconds=CACHE_DURATION_MINUTES * 60,
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES
+)
+
+
+# 同一プロンプトの同時リクエストを1回のAPI呼び出しにまとめる
+_inflight = cache_service.SingleFlight()
 
 
 def _get_cache_key(message):
@@ -23,24 +35,15 @@ def _get_cache_key(message):
 
 def _get_from_cache(cache_key):
     """キャッシュから取得（レスポンスと有効期限を返す）"""
-    if cache_key in _cache:
-        cached_data = _cache[cache_key]
-        if datetime.now() < cached_data['expires_at']:
-            print(f"Cache HIT: {cache_key[:10]}...")
-            return cached_data['response'], cached_data['expires_at']
-        else:
-            # 期限切れのキャッシュを削除
-            del _cache[cache_key]
-            print(f"Cache EXPIRED: {cache_key[:10]}...")
-    return None, None
+    response, expires_at = _cache.get(cache_key)
+    if response is not None:
+        print(f"Cache HIT: {cache_key[:10]}...")
+    return response, expires_at
 
 
 def _save_to_cache(cache_key, response):
     """キャッシュに保存"""
-    _cache[cache_key] = {
-        'response': response,
-        'expires_at': datetime.now() + timedelta(minutes=CACHE_DURATION_MINUTES)
-    }
+    _cache.set(cache_key, response)
     print(f"Cache SAVED: {cache_key[:10]}...")
 
 
@@ -65,23 +68,108 @@ def chat_with_ai(message, use_cache=True):
             return cached_response, None, expires_at
     
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
+        if not use_cache:
+            return _generate(message), None, None
         
-        # システムプロンプトを追加
-        prompt = f"""あなたは筋トレ・ダイエット・栄養科学の専門家アシスタントです。
+        # 同じプロンプトを生成中なら、その結果を待って共有する
+        response_text, shared = _inflight.do(cache_key, lambda: _generate(message, cache_key))
+        if shared:
+            print(f"Single-flight SHARED: {cache_key[:10]}...")
+        return response_text, None, None
+    except Exception as e:
+        print(f"ERROR in chat_with_ai: {str(e)}")
+        return None, str(e), None
+
+
+def stream_chat_with_ai(message, use_cache=True, on_complete=None):
+    """Gemini AIとチャット（ストリーミング、キャッシュ機能付き）
+    
+    応答は生成された断片から順に返す。全文は最後まで受信した時点でキャッシュに保存する
+    （同時リクエストのsingle-flightはストリーミングでは行わない）。
+    
+    Args:
+        on_complete: 全文受信後に呼ばれるコールバック（引数: 全文）
+    
+    Returns:
+        tuple: (chunks, error, cached_until)
+            - chunks: 応答テキストの断片を順に返すイテレータ
+            - error: エラーメッセージ（エラーがない場合はNone）
+            - cached_until: キャッシュ有効期限（datetime、キャッシュヒット時のみ）
+    """
+    if not GEMINI_API_KEY:
+        print("ERROR: Gemini API key not configured")
+        return None, 'Gemini API key not configured. Please set GEMINI_API_KEY environment variable.', None
+    
+    cache_key = _get_cache_key(message) if use_cache else None
+    if cache_key:
+        cached_response, expires_at = _get_from_cache(cache_key)
+        if cached_response:
+            if on_complete:
+                on_complete(cached_response)
+            return iter([cached_response]), None, expires_at
+    
+    try:
+        model = gemini_client.generative_model(MODEL_NAME)
+        print("API REQUEST: Streaming content...")
+        # 断片の受信もGeminiの同時実行数の枠内で行い、断片ごと・全体のタイムアウトを適用する
+        response = upstream_service.stream('gemini', model.generate_content, _build_prompt(message), stream=True)
+    except Exception as e:
+        print(f"ERROR in stream_chat_with_ai: {str(e)}")
+        return None, str(e), None
+    
+    return _iter_stream(response, cache_key, on_complete), None, None
+
+
+def _iter_stream(response, cache_key, on_complete):
+    """ストリーミング応答の断片を返し、完了時にキャッシュ保存・コールバックを行う"""
+    # 全文はキャッシュ保存用にのみ保持（上限を超えたら保存を諦めて破棄）
+    keep = cache_key is not None or on_complete is not None
+    parts = []
+    size = 0
+    
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # テキストを含まない断片（セーフティ判定等）は読み飛ばす
+            continue
+        if not text:
+            continue
+        if keep:
+            size += len(text.encode('utf-8'))
+            if size > CACHE_MAX_BYTES:
+                keep = False
+                parts = []
+            else:
+                parts.append(text)
+        yield text
+    
+    if keep:
+        full_text = ''.join(parts)
+        if cache_key:
+            _save_to_cache(cache_key, full_text)
+        if on_complete:
+            on_complete(full_text)
+
+
+def _build_prompt(message):
+    """システムプロンプトを付与したプロンプトを生成"""
+    return f"""あなたは筋トレ・ダイエット・栄養科学の専門家アシスタントです。
 科学的根拠に基づいた最新の情報を提供してください。
 可能な限り具体的な研究や論文を参照してください。
 
 ユーザーの質問: {message}"""
-        
-        print("API REQUEST: Generating content...")
-        response = model.generate_content(prompt)
-        
-        # キャッシュに保存
-        if use_cache:
-            _save_to_cache(cache_key, response.text)
-        
-        return response.text, None, None
-    except Exception as e:
-        print(f"ERROR in chat_with_ai: {str(e)}")
-        return None, str(e), None
+
+
+def _generate(message, cache_key=None):
+    """Gemini APIで応答を生成（cache_key指定時はキャッシュに保存）"""
+    model = gemini_client.generative_model(MODEL_NAME)
+    
+    print("API REQUEST: Generating content...")
+    response = upstream_service.call('gemini', model.generate_content, _build_prompt(message))
+    
+    # キャッシュに保存
+    if cache_key:
+        _save_to_cache(cache_key, response.text)
+    
+    return response.text
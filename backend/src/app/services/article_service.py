@@ -0,0 +1,46 @@
+"""研究論文ストア（PMIDをキーに論文情報をFirestoreへ永続化）
+
+research_articles/{pmid} に以下を保存し、同じ論文を再度検索・表示した際の外部API呼び出しを省略する。
+- title / title_ja: 英語タイトル / 日本語訳タイトル
+- authors / pubdate: 著者名一覧 / 出版日（E-Summary）
+- abstract / summary_ja: Abstract（E-Fetch） / AI生成の日本語要約
+"""
+from datetime import datetime
+
+from app.services import firestore_client
+
+COLLECTION = 'research_articles'
+
+
+def get_db():
+    """Firestoreクライアントを取得（プロセス内で共有）"""
+    return firestore_client.get_client()
+
+
+def get_articles(pmids):
+    """保存済みの論文情報をまとめて取得
+
+    Returns:
+        dict: {pmid: 論文情報}（保存されていないPMIDは含まない）
+    """
+    if not pmids:
+        return {}
+    db = get_db()
+    refs = [db.collection(COLLECTION).document(pmid) for pmid in pmids]
+    return {doc.id: doc.to_dict() for doc in db.get_all(refs) if doc.exists}
+
+
+def save_articles(articles):
+    """論文情報を保存（既存のフィールドにマージ）
+
+    Args:
+        articles: {pmid: 保存するフィールド}
+    """
+    if not articles:
+        return
+    db = get_db()
+    batch = db.batch()
+    now = datetime.now().isoformat()
+    for pmid, fields in articles.items():
+        batch.set(db.collection(COLLECTION).document(pmid), {**fields, 'pmid': pmid, 'updated_at': now}, merge=True)
+    batch.commit()
@@ -0,0 +1,293 @@
+"""バックアップ・復元サービス"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import itertools
+import json
+import threading
+import uuid
+
+from app.services import advice_service, firestore_client, meal_service, training_service, weight_service
+
+# 1ページあたりの取得件数（コレクションスキャン）
+PAGE_SIZE = 500
+
+# 復元時のバッチサイズ（Firestoreのバッチ書き込み上限: 500件）
+RESTORE_BATCH_SIZE = 500
+# 復元時に並行処理するコレクション数
+RESTORE_MAX_WORKERS = 3
+
+# 1.1: 末尾に完了マーカー（"complete": true）を付与。1.0のファイルはマーカーなしで復元可能
+BACKUP_VERSION = '1.1'
+LEGACY_BACKUP_VERSIONS = ('1.0',)
+
+# バックアップ対象: (バックアップ上のキー, Firestoreコレクション名, IDを格納するフィールド)
+BACKUP_COLLECTIONS = [
+    ('customers', 'customer', 'id'),
+    ('weight_history', 'weight_history', 'id'),
+    ('training_sessions', 'training_sessions', 'id'),
+    ('meal_records', 'meal_records', 'id'),
+    ('nutrition_goals', 'nutrition_goals', 'customer_id'),
+]
+
+
+def get_db():
+    """Firestoreクライアントを取得（プロセス内で共有）"""
+    return firestore_client.get_client()
+
+
+def iter_collection(collection_name, page_size=PAGE_SIZE):
+    """コレクション全体をドキュメントID順にページ単位で走査"""
+    db = get_db()
+    last_doc = None
+
+    while True:
+        query = db.collection(collection_name).order_by('__name__').limit(page_size)
+        if last_doc is not None:
+            query = query.start_after(last_doc)
+
+        docs = list(query.stream())
+        for doc in docs:
+            yield doc
+
+        if len(docs) < page_size:
+            break
+        last_doc = docs[-1]
+
+
+def _dump(value):
+    """JSONシリアライズ（Firestoreのタイムスタンプ等は文字列化）"""
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def stream_backup(page_size=PAGE_SIZE):
+    """全データをJSONとして逐次生成（各コレクションを1回ずつスキャン）
+
+    出力形式:
+        {"timestamp": ..., "version": ..., "collections": {"customers": [...], ...}, "complete": true}
+    全件をメモリに保持せず、ドキュメント単位でチャンクを返す。
+    最初のページは呼び出し時に取得するため、接続・認証エラーはレスポンス開始前に例外になる。
+    途中で失敗した場合は完了マーカーを出力せずに中断する（is_complete_backupで検出できる）。
+
+    Returns:
+        generator: JSONのチャンク
+    """
+    first_key, first_collection, _ = BACKUP_COLLECTIONS[0]
+    first_docs = iter_collection(first_collection, page_size)
+    prefetched = list(itertools.islice(first_docs, 1))
+    return _generate_backup(itertools.chain(prefetched, first_docs), page_size)
+
+
+def _generate_backup(first_docs, page_size):
+    yield '{"timestamp": %s, "version": %s, "collections": {' % (
+        _dump(datetime.now().isoformat()), _dump(BACKUP_VERSION)
+    )
+
+    try:
+        for index, (key, collection_name, id_field) in enumerate(BACKUP_COLLECTIONS):
+            if index > 0:
+                yield ', '
+            yield '%s: [' % _dump(key)
+
+            docs = first_docs if index == 0 else iter_collection(collection_name, page_size)
+            first = True
+            for doc in docs:
+                data = doc.to_dict()
+                data[id_field] = doc.id
+                yield ('' if first else ', ') + _dump(data)
+                first = False
+
+            yield ']'
+    except Exception as e:
+        print(f"backup stream error: {str(e)}")
+        raise
+
+    yield '}, "complete": true}'
+
+
+def is_complete_backup(data):
+    """バックアップが最後まで出力されたものかを判定（旧形式は完了マーカーなしで可）"""
+    if data.get('version') in LEGACY_BACKUP_VERSIONS:
+        return True
+    return data.get('complete') is True
+
+
+# 復元の進捗（restore_progress/{restore_id}）: どのワーカーからも参照でき、同時に実行した復元同士で干渉しない
+RESTORE_PROGRESS_COLLECTION = 'restore_progress'
+
+
+class RestoreProgress:
+    """1回の復元の進捗（コレクションごと: {'total', 'committed', 'restored'}）"""
+
+    def __init__(self, db, restore_id):
+        self.restore_id = restore_id
+        self.ref = db.collection(RESTORE_PROGRESS_COLLECTION).document(restore_id)
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._save({'status': 'running', 'collections': {}, 'started_at': datetime.now().isoformat()}, merge=False)
+
+    def update(self, key, **values):
+        with self._lock:
+            self._collections.setdefault(key, {}).update(values)
+            progress = dict(self._collections[key])
+        self._save({'collections': {key: progress}})
+
+    def finish(self, error=None):
+        self._save({
+            'status': 'failed' if error else 'completed',
+            'error': error,
+            'finished_at': datetime.now().isoformat()
+        })
+
+    def committed(self, key):
+        with self._lock:
+            return self._collections.get(key, {}).get('committed', 0)
+
+    def _save(self, data, merge=True):
+        """進捗を保存（保存に失敗しても復元は続ける）"""
+        try:
+            self.ref.set({**data, 'updated_at': datetime.now().isoformat()}, merge=merge)
+        except Exception as e:
+            print(f"restore progress {self.restore_id} error: {str(e)}")
+
+
+def get_restore_progress(restore_id):
+    """復元の進捗を取得
+
+    Returns:
+        tuple: ({'status', 'collections': {key: {'total', 'committed', 'restored'}}, ...}, error)
+    """
+    try:
+        doc = get_db().collection(RESTORE_PROGRESS_COLLECTION).document(restore_id).get()
+        if not doc.exists:
+            return None, 'Restore not found'
+        return doc.to_dict(), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _restore_collection(progress, key, collection_name, id_field, records, start_index, batch_size):
+    """1コレクション分をバッチ書き込みで復元
+
+    Returns:
+        tuple: (restored_count, error)
+    """
+    db = get_db()
+    collection = db.collection(collection_name)
+    restored = 0
+    progress.update(key, total=len(records), committed=start_index, restored=0)
+
+    try:
+        batch = db.batch()
+        pending = 0
+        for position in range(start_index, len(records)):
+            record = records[position]
+            doc_id = record.get(id_field)
+            if doc_id:
+                # IDフィールドを除外してデータを書き込む
+                data = {k: v for k, v in record.items() if k != id_field}
+                if collection_name == 'training_sessions' and 'exercise_ids' not in data:
+                    # 種目インデックスのない古いバックアップは復元時に付与（全セッションのスキャンを避ける）
+                    data['exercise_ids'] = training_service.extract_exercise_ids(data.get('exercises'))
+                batch.set(collection.document(doc_id), data)
+                pending += 1
+
+            if pending >= batch_size:
+                batch.commit()
+                restored += pending
+                progress.update(key, committed=position + 1, restored=restored)
+                batch = db.batch()
+                pending = 0
+
+        if pending:
+            batch.commit()
+            restored += pending
+        progress.update(key, committed=len(records), restored=restored)
+        return restored, None
+    except Exception as e:
+        print(f"restore {key} error: {str(e)}")
+        return restored, str(e)
+
+
+def _restored_customer_ids(collections, key):
+    return sorted({record.get('customer_id') for record in collections.get(key) or [] if record.get('customer_id')})
+
+
+def _rebuild_derived_data(collections, batch_size=RESTORE_BATCH_SIZE):
+    """復元した顧客の派生データ（日次ロールアップ・体重サマリー）を再構築し、アドバイスキャッシュを無効化
+
+    処理はバックアップに含まれる顧客の分だけ行う（データベース全体は走査しない）。
+    種目インデックスは_restore_collectionで書き込み時に付与済み。
+    """
+    meal_customer_ids = _restored_customer_ids(collections, 'meal_records')
+    weight_customer_ids = _restored_customer_ids(collections, 'weight_history')
+
+    with ThreadPoolExecutor(max_workers=RESTORE_MAX_WORKERS) as executor:
+        futures = [executor.submit(meal_service.rebuild_daily_nutrition, cid) for cid in meal_customer_ids]
+        futures += [executor.submit(weight_service.rebuild_weight_summaries, cid) for cid in weight_customer_ids]
+        for future in futures:
+            future.result()
+
+    touches = [(cid, advice_service.TRAINING) for cid in _restored_customer_ids(collections, 'training_sessions')]
+    touches += [
+        (cid, advice_service.MEAL)
+        for cid in sorted(set(meal_customer_ids) | set(_restored_customer_ids(collections, 'nutrition_goals')))
+    ]
+    db = get_db()
+    for i in range(0, len(touches), batch_size):
+        batch = db.batch()
+        for customer_id, kind in touches[i:i + batch_size]:
+            advice_service.touch(db, customer_id, kind, writer=batch)
+        batch.commit()
+
+
+def restore_backup(collections, resume_from=None, batch_size=RESTORE_BATCH_SIZE, restore_id=None):
+    """バックアップデータを復元（バッチ書き込み + コレクション並行処理）
+
+    Args:
+        collections: バックアップの'collections'部分
+        resume_from: {key: 開始位置} 前回中断時の'committed'を渡すとその続きから再開
+        restore_id: 進捗の参照用ID（省略時は生成）。クライアントが生成して渡すと、
+            復元の完了を待たずにget_restore_progressで進捗を確認できる
+
+    Returns:
+        tuple: ({'restore_id', 'restored_counts': {...}, 'committed': {...}}, error)
+            - committed: コレクションごとのコミット済み位置（再開時にresume_fromとして渡す）
+    """
+    resume_from = resume_from or {}
+    progress = RestoreProgress(get_db(), restore_id or uuid.uuid4().hex)
+    progress.start()
+
+    targets = [
+        (key, collection_name, id_field, collections.get(key) or [])
+        for key, collection_name, id_field in BACKUP_COLLECTIONS
+    ]
+
+    with ThreadPoolExecutor(max_workers=RESTORE_MAX_WORKERS) as executor:
+        futures = {
+            key: executor.submit(
+                _restore_collection, progress, key, collection_name, id_field, records,
+                min(int(resume_from.get(key, 0)), len(records)), batch_size
+            )
+            for key, collection_name, id_field, records in targets
+        }
+        results = {key: future.result() for key, future in futures.items()}
+
+    restored_counts = {key: restored for key, (restored, _) in results.items()}
+    errors = [f"{key}: {error}" for key, (_, error) in results.items() if error]
+
+    if not errors:
+        try:
+            _rebuild_derived_data(collections)
+        except Exception as e:
+            errors.append(f"rebuild: {str(e)}")
+
+    error = '; '.join(errors) if errors else None
+    progress.finish(error)
+    result = {
+        'restore_id': progress.restore_id,
+        'restored_counts': restored_counts,
+        'committed': {key: progress.committed(key) for key, _, _, _ in targets}
+    }
+    return result, error
@@ -0,0 +1,435 @@
+"""キャッシュサービス（LRU + TTL、SQLiteによるワーカー間共有、stale-while-revalidateに対応）"""
+import os
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# バックエンド選択: memory（プロセス内LRU） / sqlite（ファイル共有、gunicornワーカー間でヒットを共有）
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH', '/tmp/michela_cache.sqlite3')
+
+# 作成済みキャッシュ（統計取得用）
+_caches = {}
+_registry_lock = threading.Lock()
+
+
+def _size_of(value):
+    """値のおおよそのバイト数"""
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+class _CacheStats:
+    """ヒット・ミス・追い出しのカウンタ"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def to_dict(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0
+        }
+
+
+class LRUCache:
+    """プロセス内LRUキャッシュ（件数・バイト数上限 + TTL）"""
+
+    backend = 'memory'
+
+    def __init__(self, ttl_seconds, max_entries=256, max_bytes=8 * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = _CacheStats()
+
+    def get(self, key):
+        """取得（ヒット時は(value, expires_at)、ミス時は(None, None)）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats.misses += 1
+                return None, None
+
+            value, expires_at, size = entry
+            if time.time() >= expires_at:
+                # 期限切れのエントリを削除
+                del self._entries[key]
+                self._bytes -= size
+                self._stats.expirations += 1
+                self._stats.misses += 1
+                return None, None
+
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return value, datetime.fromtimestamp(expires_at)
+
+    def set(self, key, value, ttl_seconds=None):
+        """保存（上限を超えた分は古いものから追い出す）"""
+        size = _size_of(value)
+        if size > self.max_bytes:
+            return
+
+        expires_at = time.time() + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats.evictions += 1
+
+    def delete(self, key):
+        """削除"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def clear(self):
+        """全削除"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """統計を取得"""
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                **self._stats.to_dict()
+            }
+
+
+class SQLiteCache:
+    """SQLiteファイルによる共有キャッシュ（同一ホストの全ワーカーでヒットを共有）"""
+
+    backend = 'sqlite'
+
+    def __init__(self, name, ttl_seconds, max_entries=1024, path=None):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.path = path or CACHE_SQLITE_PATH
+        self._lock = threading.Lock()
+        self._stats = _CacheStats()
+        self._local = threading.local()
+
+        # モジュールのimport時（preload_appではfork前のマスター）に呼ばれるため、
+        # テーブル作成の接続はすぐに閉じ、fork先に接続を引き継がない
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS cache ('
+                    ' name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,'
+                    ' expires_at REAL NOT NULL, accessed_at REAL NOT NULL,'
+                    ' PRIMARY KEY (name, key))'
+                )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        """スレッドごとの接続を取得（fork後のプロセスでは作り直す）"""
+        pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != pid:
+            # fork元の接続はfork元のプロセスのものなので閉じずに置き換える
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = pid
+        return conn
+
+    def get(self, key):
+        """取得（ヒット時は(value, expires_at)、ミス時は(None, None)）"""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT value, expires_at FROM cache WHERE name = ? AND key = ?', (self.name, key)
+        ).fetchone()
+
+        with self._lock:
+            if row is None:
+                self._stats.misses += 1
+                return None, None
+            if now >= row[1]:
+                self._stats.expirations += 1
+                self._stats.misses += 1
+            else:
+                self._stats.hits += 1
+
+        if now >= row[1]:
+            with conn:
+                conn.execute('DELETE FROM cache WHERE name = ? AND key = ?', (self.name, key))
+            return None, None
+
+        with conn:
+            conn.execute(
+                'UPDATE cache SET accessed_at = ? WHERE name = ? AND key = ?', (now, self.name, key)
+            )
+        return json.loads(row[0]), datetime.fromtimestamp(row[1])
+
+    def set(self, key, value, ttl_seconds=None):
+        """保存（上限を超えた分はアクセスの古いものから追い出す）"""
+        now = time.time()
+        expires_at = now + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO cache (name, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (self.name, key, json.dumps(value, ensure_ascii=False, default=str), expires_at, now)
+            )
+            conn.execute('DELETE FROM cache WHERE name = ? AND expires_at <= ?', (self.name, now))
+            evicted = conn.execute(
+                'DELETE FROM cache WHERE name = ? AND key IN ('
+                ' SELECT key FROM cache WHERE name = ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                (self.name, self.name, self.max_entries)
+            ).rowcount
+
+        if evicted > 0:
+            with self._lock:
+                self._stats.evictions += evicted
+
+    def delete(self, key):
+        """削除"""
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM cache WHERE name = ? AND key = ?', (self.name, key))
+
+    def clear(self):
+        """全削除"""
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM cache WHERE name = ?', (self.name,))
+
+    def __len__(self):
+        row = self._connect().execute('SELECT COUNT(*) FROM cache WHERE name = ?', (self.name,)).fetchone()
+        return row[0]
+
+    def stats(self):
+        """統計を取得（カウンタはこのワーカーの分のみ）"""
+        with self._lock:
+            counters = self._stats.to_dict()
+        return {
+            'backend': self.backend,
+            'entries': len(self),
+            'max_entries': self.max_entries,
+            **counters
+        }
+
+
+class _Call:
+    """実行中の呼び出し（結果を待機中の呼び出し元と共有する）"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """同じキーの同時呼び出しを1回の実行にまとめる（single-flight）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """keyに対してfnを実行（実行中なら完了を待って同じ結果を返す）
+
+        Returns:
+            tuple: (result, shared)
+                - shared: 他の呼び出しの結果を共有した場合True
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+    def stats(self):
+        """統計を取得"""
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executed': self.executed,
+                'coalesced': self.coalesced
+            }
+
+
+class StaleWhileRevalidateCache:
+    """期限切れ後も一定期間は古い値を返し、裏で再取得するキャッシュ（stale-while-revalidate）
+
+    - fresh_seconds以内: そのまま返す
+    - それ以降（内部キャッシュのTTLまで）: 古い値を即座に返し、バックグラウンドで再取得
+    - キャッシュなし: 同期で取得（同じキーの同時取得は1回にまとめる）
+    取得関数が例外を送出した場合はキャッシュしない。
+    """
+
+    def __init__(self, cache, fresh_seconds, max_workers=2):
+        self.cache = cache
+        self.fresh_seconds = fresh_seconds
+        self.max_workers = max_workers
+        self.backend = cache.backend
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._refreshing = set()
+        self._counters = {'fresh_hits': 0, 'stale_hits': 0, 'loads': 0, 'refreshes': 0, 'refresh_errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get_or_load(self, key, loader):
+        """取得（なければloaderで取得して保存）
+
+        Returns:
+            tuple: (value, state)
+                - state: 'fresh' / 'stale'（古い値、裏で再取得中） / 'miss'（今回取得）
+        """
+        entry, _ = self.cache.get(key)
+        if entry is not None:
+            if time.time() < entry['fresh_until']:
+                self._count('fresh_hits')
+                return entry['value'], 'fresh'
+            self._count('stale_hits')
+            self._refresh_in_background(key, loader)
+            return entry['value'], 'stale'
+
+        value, _ = self._flight.do(key, lambda: self._load(key, loader))
+        return value, 'miss'
+
+    def _load(self, key, loader):
+        value = loader()
+        self._count('loads')
+        self.cache.set(key, {'value': value, 'fresh_until': time.time() + self.fresh_seconds})
+        return value
+
+    def _refresh_in_background(self, key, loader):
+        """バックグラウンドで再取得（同じキーの再取得は1件のみ）"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='cache-refresh')
+        self._executor.submit(self._refresh, key, loader)
+
+    def _refresh(self, key, loader):
+        try:
+            self._flight.do(key, lambda: self._load(key, loader))
+            self._count('refreshes')
+        except Exception as e:
+            self._count('refresh_errors')
+            print(f"Cache REFRESH FAILED: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def delete(self, key):
+        """削除"""
+        self.cache.delete(key)
+
+    def clear(self):
+        """全削除"""
+        self.cache.clear()
+
+    def __len__(self):
+        return len(self.cache)
+
+    def stats(self):
+        """統計を取得（内部キャッシュの統計 + 新鮮/古い値のヒット数・再取得数）"""
+        with self._lock:
+            counters = dict(self._counters)
+            counters['refreshing'] = len(self._refreshing)
+        return {**self.cache.stats(), 'fresh_seconds': self.fresh_seconds, **counters}
+
+
+def create_cache(name, ttl_seconds, max_entries=256, max_bytes=8 * 1024 * 1024, backend=None):
+    """キャッシュを生成して登録（backend未指定時はCACHE_BACKEND環境変数に従う）"""
+    backend = backend or CACHE_BACKEND
+    if backend == 'sqlite':
+        cache = SQLiteCache(name, ttl_seconds, max_entries=max_entries)
+    else:
+        cache = LRUCache(ttl_seconds, max_entries=max_entries, max_bytes=max_bytes)
+
+    with _registry_lock:
+        _caches[name] = cache
+    return cache
+
+
+def create_swr_cache(name, fresh_seconds, stale_seconds, max_entries=256, max_bytes=8 * 1024 * 1024, backend=None):
+    """stale-while-revalidateキャッシュを生成して登録
+
+    Args:
+        fresh_seconds: 古い値とみなすまでの秒数
+        stale_seconds: 古い値を返し続ける最大秒数（これを過ぎると同期で取得）
+    """
+    cache = create_cache(name, ttl_seconds=fresh_seconds + stale_seconds,
+                         max_entries=max_entries, max_bytes=max_bytes, backend=backend)
+    swr_cache = StaleWhileRevalidateCache(cache, fresh_seconds)
+
+    with _registry_lock:
+        _caches[name] = swr_cache
+    return swr_cache
+
+
+def get_all_stats():
+    """登録済みキャッシュの統計を取得"""
+    with _registry_lock:
+        caches = dict(_caches)
+    return {name: cache.stats() for name, cache in caches.items()}
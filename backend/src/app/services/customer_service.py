@@ -1,11 +1,26 @@
 """顧客管理サービス"""
-from firebase_admin import firestore
+from app.services import firestore_client, meal_service, weight_service
 from datetime import datetime
+import os
+import threading
+
+# カスケード削除のバッチサイズ（Firestoreのバッチ書き込み上限: 500件）
+DELETE_BATCH_SIZE = 500
+
+# 顧客に紐づくコレクション（customer_idフィールドで検索）
+RELATED_COLLECTIONS = ['weight_history', 'training_sessions', 'meal_records', 'daily_nutrition']
+
+# バックグラウンド削除ジョブの状態（delete_jobs/{customer_id}）: どのワーカーからも進捗を参照できる
+DELETE_JOB_COLLECTION = 'delete_jobs'
+# 進捗の更新がこの秒数途絶えた実行中ジョブは中断（ワーカーの再起動等）とみなし、再実行を許可する
+DELETE_JOB_STALE_SECONDS = int(os.environ.get('DELETE_JOB_STALE_SECONDS', 300))
+# 中断されたジョブを進捗の参照時に自動で再開する回数の上限（毎回途中で落ちるジョブの無限再実行を防ぐ）
+DELETE_JOB_MAX_ATTEMPTS = int(os.environ.get('DELETE_JOB_MAX_ATTEMPTS', 3))
 
 
 def get_db():
-    """Firestoreクライアントを取得"""
-    return firestore.client()
+    """Firestoreクライアントを取得（プロセス内で共有）"""
+    return firestore_client.get_client()
 
 
 def register_customer(data):
@@ -29,13 +44,7 @@ def register_customer(data):
         })
         
         # 初回の体重履歴を登録
-        weight_history_ref = db.collection('weight_history').document()
-        weight_history_ref.set({
-            'customer_id': customer_id,
-            'weight': float(data['weight']),
-            'recorded_at': datetime.now().isoformat(),
-            'note': '初回登録'
-        })
+        weight_service.record_weight(db, customer_id, data['weight'], note='初回登録', update_customer=False)
 
         return customer_id, None
     except Exception as e:
@@ -76,25 +85,168 @@ def update_customer(customer_id, data):
     
     # 体重が更新された場合は履歴に記録
     if 'weight' in data:
-        weight_history_ref = db.collection('weight_history').document()
-        weight_history_ref.set({
-            'customer_id': customer_id,
-            'weight': float(data['weight']),
-            'recorded_at': datetime.now().isoformat(),
-            'note': '体重更新'
-        })
+        weight_service.record_weight(db, customer_id, data['weight'], note='体重更新', update_customer=False)
+
+
+def _delete_query_in_batches(db, query, batch_size, on_progress=None):
+    """クエリに一致するドキュメントをページ単位でバッチ削除
+
+    削除済みのドキュメントは次のクエリに現れないため、同じクエリを繰り返すだけで次のページになる。
+    """
+    deleted = 0
+    while True:
+        docs = list(query.limit(batch_size).stream())
+        if not docs:
+            break
+        
+        batch = db.batch()
+        for doc in docs:
+            batch.delete(doc.reference)
+        batch.commit()
+        
+        deleted += len(docs)
+        if on_progress:
+            on_progress(deleted)
+        
+        if len(docs) < batch_size:
+            break
+    return deleted
+
 
+def delete_customer(customer_id, on_progress=None, batch_size=DELETE_BATCH_SIZE):
+    """顧客を削除（体重履歴・トレーニング・食事記録・栄養目標・日次集計もカスケード削除）
 
-def delete_customer(customer_id):
-    """顧客を削除（関連する体重履歴も削除）"""
+    Args:
+        on_progress: 進捗コールバック on_progress(collection_name, deleted_count)
+    """
     db = get_db()
     
-    # 体重履歴を削除
-    weight_history_query = db.collection('weight_history').where('customer_id', '==', customer_id)
-    for doc in weight_history_query.stream():
-        doc.reference.delete()
+    # 関連データを先に削除（途中で失敗しても顧客が残り、再実行できる）
+    for collection_name in RELATED_COLLECTIONS:
+        query = db.collection(collection_name).where('customer_id', '==', customer_id)
+        callback = (lambda count, name=collection_name: on_progress(name, count)) if on_progress else None
+        _delete_query_in_batches(db, query, batch_size, callback)
     
-    # 顧客を削除
-    db.collection('customer').document(customer_id).delete()
+    # 栄養目標・アドバイス更新記録・体重サマリー（ドキュメントID = 顧客ID）と顧客本体を削除
+    batch = db.batch()
+    batch.delete(db.collection('nutrition_goals').document(customer_id))
+    batch.delete(db.collection('advice_fingerprints').document(customer_id))
+    batch.delete(db.collection(weight_service.SUMMARY_COLLECTION).document(customer_id))
+    batch.delete(db.collection(meal_service.ROLLUP_STATUS_COLLECTION).document(customer_id))
+    batch.delete(db.collection('customer').document(customer_id))
+    batch.commit()
     
     return True
+
+
+def _delete_job_ref(db, customer_id):
+    return db.collection(DELETE_JOB_COLLECTION).document(customer_id)
+
+
+def _is_interrupted(job):
+    """実行中のまま進捗の更新が途絶えたジョブか"""
+    if job.get('status') != 'running':
+        return False
+    updated_at = datetime.fromisoformat(job.get('updated_at') or job['started_at'])
+    return (datetime.now() - updated_at).total_seconds() > DELETE_JOB_STALE_SECONDS
+
+
+def _update_delete_job(ref, data):
+    """ジョブの状態を更新（保存に失敗しても削除は続ける）"""
+    try:
+        ref.update({**data, 'updated_at': datetime.now().isoformat()})
+    except Exception as e:
+        print(f"delete_customer job update error: {str(e)}")
+
+
+def _run_delete_job(customer_id):
+    """バックグラウンド削除ジョブ本体"""
+    ref = _delete_job_ref(get_db(), customer_id)
+    
+    def on_progress(collection_name, count):
+        _update_delete_job(ref, {f'deleted.{collection_name}': count})
+    
+    try:
+        delete_customer(customer_id, on_progress=on_progress)
+        status, error = 'done', None
+    except Exception as e:
+        print(f"delete_customer job error: {str(e)}")
+        status, error = 'error', str(e)
+    
+    _update_delete_job(ref, {
+        'status': status,
+        'error': error,
+        'finished_at': datetime.now().isoformat()
+    })
+
+
+@firestore_client.transactional
+def _claim_delete_job(transaction, db, customer_id, resume=False):
+    """実行中のジョブがなければ新しいジョブを登録
+
+    Args:
+        resume: 中断されたジョブの自動再開のみ行う（試行回数がDELETE_JOB_MAX_ATTEMPTS未満の場合）
+
+    Returns:
+        tuple: (job, created)
+    """
+    ref = _delete_job_ref(db, customer_id)
+    snapshot = ref.get(transaction=transaction)
+    job = snapshot.to_dict() if snapshot.exists else None
+    if job is not None and job.get('status') == 'running' and not _is_interrupted(job):
+        return job, False
+    
+    attempts = 1
+    if resume:
+        if job is None or not _is_interrupted(job) or job.get('attempts', 1) >= DELETE_JOB_MAX_ATTEMPTS:
+            return job, False
+        attempts = job.get('attempts', 1) + 1
+    
+    now = datetime.now().isoformat()
+    job = {
+        'customer_id': customer_id,
+        'status': 'running',
+        'deleted': {name: 0 for name in RELATED_COLLECTIONS},
+        'error': None,
+        'attempts': attempts,
+        'started_at': now,
+        'updated_at': now,
+        'finished_at': None
+    }
+    transaction.set(ref, job)
+    return job, True
+
+
+def _start_delete_job(customer_id, resume=False):
+    db = get_db()
+    job, created = _claim_delete_job(db.transaction(), db, customer_id, resume)
+    if created:
+        threading.Thread(target=_run_delete_job, args=(customer_id,), daemon=True).start()
+    return job
+
+
+def start_delete_customer_job(customer_id):
+    """顧客のカスケード削除をバックグラウンドで開始（実行中なら既存ジョブを返す）
+
+    中断されたジョブ（DELETE_JOB_STALE_SECONDS以上進捗がない）は再実行する。
+    削除は冪等なため、残っているデータから削除を続ける。
+    """
+    return _start_delete_job(customer_id)
+
+
+def get_delete_customer_job(customer_id):
+    """バックグラウンド削除ジョブの進捗を取得（ジョブがなければNone）
+
+    実行中のまま進捗が途絶えたジョブ（ワーカーの再起動等で削除スレッドが終了したもの）は
+    このワーカーで自動的に再開する。再開の上限（DELETE_JOB_MAX_ATTEMPTS）に達した場合は
+    status='interrupted'として返す（再度削除を開始すると再実行）。
+    """
+    doc = _delete_job_ref(get_db(), customer_id).get()
+    if not doc.exists:
+        return None
+    job = doc.to_dict()
+    if _is_interrupted(job):
+        job = _start_delete_job(customer_id, resume=True)
+        if job is not None and _is_interrupted(job):
+            job['status'] = 'interrupted'
+    return job
@@ -0,0 +1,188 @@
+"""NCBI E-utilities（PubMed API）クライアント
+
+- keep-aliveの接続プールを共有（リクエストごとのTCP/TLSハンドシェイクを省略）
+- トークンバケットでNCBIの制限（3リクエスト/秒、APIキーありで10リクエスト/秒）を守る
+  （バケットはプロセスごとのため、EUTILS_PROCESSESで制限をプロセス数で分割する）
+- 429・5xx・接続エラーは指数バックオフで再試行
+- esummary / efetch は複数PMIDをまとめて1リクエストで取得
+- EUTILS_BASE_URLでテスト用のローカルサーバーに向けられる
+- requestsは初回のクライアント生成時にimportする（起動時間の短縮）
+"""
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+from app.services import upstream_service
+
+DEFAULT_BASE_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils'
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+BATCH_SIZE = 200  # 1リクエストあたりのPMID数（NCBI推奨の上限）
+
+
+class TokenBucket:
+    """トークンバケットによるレート制限（スレッドセーフ）"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)  # 1未満だとトークンが貯まらず取得できない
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """トークンを1つ取得（なければ補充されるまで待機）"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class EutilsClient:
+    """E-utilitiesクライアント"""
+
+    def __init__(self, base_url=None, api_key=None, tool='michela', email=None,
+                 rate_limit=None, timeout=10, max_retries=3, backoff_seconds=0.5, processes=1):
+        """
+        Args:
+            rate_limit: 全プロセス合計のリクエスト数/秒（省略時はNCBIの制限）
+            processes: 制限を共有するプロセス数（gunicornのワーカー数）
+        """
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip('/')
+        self.api_key = api_key
+        self.tool = tool
+        self.email = email
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.rate_limiter = TokenBucket((rate_limit or (10 if api_key else 3)) / max(1, processes))
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=upstream_service.get('pubmed').concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _get(self, endpoint, params):
+        """GETリクエスト（レート制限・再試行付き）"""
+        import requests
+
+        params = {**params, 'tool': self.tool}
+        if self.api_key:
+            params['api_key'] = self.api_key
+        if self.email:
+            params['email'] = self.email
+        url = f'{self.base_url}/{endpoint}'
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = upstream_service.call('pubmed', self.session.get, url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout, upstream_service.UpstreamTimeout):
+                if attempt == self.max_retries:
+                    raise
+                self._backoff(attempt)
+                continue
+
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                self._backoff(attempt, response.headers.get('Retry-After'))
+                continue
+            response.raise_for_status()
+            return response
+
+    def _backoff(self, attempt, retry_after=None):
+        """再試行までの待機（Retry-Afterがあれば優先）"""
+        try:
+            wait = float(retry_after) if retry_after else self.backoff_seconds * (2 ** attempt)
+        except (TypeError, ValueError):
+            wait = self.backoff_seconds * (2 ** attempt)
+        print(f"[eutils] Retrying in {wait:.1f}s (attempt {attempt + 1})")
+        time.sleep(wait)
+
+    def esearch(self, term, retmax=20, retstart=0, sort=None):
+        """論文IDを検索（JSONのesearchresultを含むdictを返す）"""
+        params = {'db': 'pubmed', 'term': term, 'retmax': retmax, 'retstart': retstart, 'retmode': 'json'}
+        if sort:
+            params['sort'] = sort
+        return self._get('esearch.fcgi', params).json()
+
+    def esummary(self, pmids):
+        """論文の概要をまとめて取得
+
+        Returns:
+            dict: {pmid: 概要}（存在しないPMIDは含まない）
+        """
+        summaries = {}
+        for batch in _chunks(pmids, BATCH_SIZE):
+            data = self._get('esummary.fcgi', {'db': 'pubmed', 'id': ','.join(batch), 'retmode': 'json'}).json()
+            result = data.get('result', {})
+            summaries.update({pmid: result[pmid] for pmid in batch if pmid in result})
+        return summaries
+
+    def efetch_abstracts(self, pmids):
+        """論文のタイトルとAbstractをまとめて取得
+
+        Returns:
+            dict: {pmid: {'title', 'abstract'}}（存在しないPMIDは含まない、欠けている項目はNone）
+        """
+        articles = {}
+        for batch in _chunks(pmids, BATCH_SIZE):
+            response = self._get('efetch.fcgi', {'db': 'pubmed', 'id': ','.join(batch), 'retmode': 'xml'})
+            root = ET.fromstring(response.content)
+            for article in root.iter('PubmedArticle'):
+                pmid = article.findtext('.//PMID')
+                if pmid:
+                    articles[pmid] = {
+                        'title': article.findtext('.//ArticleTitle'),
+                        'abstract': article.findtext('.//Abstract/AbstractText')
+                    }
+        return articles
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def get_client():
+    """共有クライアントを取得（環境変数の設定で初回生成、fork後は作り直す）"""
+    global _client, _client_pid
+
+    pid = os.getpid()
+    with _lock:
+        if _client is None or _client_pid != pid:
+            rate_limit = os.environ.get('EUTILS_RATE_LIMIT')
+            _client = EutilsClient(
+                base_url=os.environ.get('EUTILS_BASE_URL'),
+                api_key=os.environ.get('NCBI_API_KEY'),
+                email=os.environ.get('NCBI_EMAIL'),
+                rate_limit=float(rate_limit) if rate_limit else None,
+                processes=int(os.environ.get('EUTILS_PROCESSES', 1))
+            )
+            _client_pid = pid
+        return _client
+
+
+def reset_client():
+    """共有クライアントを破棄（次回のget_clientで再生成、このプロセスで開いた接続は閉じる）"""
+    global _client, _client_pid
+
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.session.close()
+        _client = None
+        _client_pid = None
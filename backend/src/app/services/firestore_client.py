@@ -0,0 +1,158 @@
+"""Firestoreクライアント管理（プロセス内で1つを共有）
+
+firebase_admin / google.cloud.firestore のimportとFirebaseの初期化は初回のget_clientまで遅らせる
+（起動時間の短縮）。サービス層はSDKを直接importせず、このモジュールの定数・ヘルパーを使う。
+"""
+import functools
+import json
+import os
+import threading
+
+# 認証情報: 環境変数GOOGLE_CREDENTIALS（本番）、なければkeys/配下のJSONファイル（ローカル）
+CREDENTIALS_PATH = os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', 'keys', 'michela-481217-ca8c2322cbd0.json'
+)
+
+# クエリの並び順（firestore.Query.ASCENDING / DESCENDING と同じ値）
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+
+# gRPCチャネル設定（環境変数で調整可能）
+GRPC_KEEPALIVE_TIME_MS = int(os.environ.get('FIRESTORE_KEEPALIVE_TIME_MS', 30000))
+GRPC_KEEPALIVE_TIMEOUT_MS = int(os.environ.get('FIRESTORE_KEEPALIVE_TIMEOUT_MS', 10000))
+GRPC_KEEPALIVE_PERMIT_WITHOUT_CALLS = int(os.environ.get('FIRESTORE_KEEPALIVE_PERMIT_WITHOUT_CALLS', 1))
+GRPC_MAX_RECEIVE_MESSAGE_MB = int(os.environ.get('FIRESTORE_MAX_RECEIVE_MESSAGE_MB', 32))
+
+
+
+class InvalidCursorError(ValueError):
+    """ページングのカーソルが不正（存在しない・別の顧客のドキュメントを指している）"""
+
+
+def is_valid_document_id(doc_id):
+    """ドキュメントIDとして使える文字列か（"/"を含む・"."や"__x__"などの予約IDはdocument()が例外になる）"""
+    return (isinstance(doc_id, str) and 0 < len(doc_id.encode()) <= 1500 and '/' not in doc_id
+            and doc_id not in ('.', '..') and not (doc_id.startswith('__') and doc_id.endswith('__')))
+
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def get_channel_options():
+    """gRPCチャネルオプションを取得"""
+    return {
+        'grpc.keepalive_time_ms': GRPC_KEEPALIVE_TIME_MS,
+        'grpc.keepalive_timeout_ms': GRPC_KEEPALIVE_TIMEOUT_MS,
+        'grpc.keepalive_permit_without_calls': GRPC_KEEPALIVE_PERMIT_WITHOUT_CALLS,
+        'grpc.max_receive_message_length': GRPC_MAX_RECEIVE_MESSAGE_MB * 1024 * 1024,
+    }
+
+
+def _initialize_app():
+    """Firebaseアプリを取得（未初期化の場合は認証情報を読み込んで初期化）"""
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if not firebase_admin._apps:
+        if 'GOOGLE_CREDENTIALS' in os.environ:
+            cred = credentials.Certificate(json.loads(os.environ['GOOGLE_CREDENTIALS']))
+        else:
+            cred = credentials.Certificate(CREDENTIALS_PATH)
+        firebase_admin.initialize_app(cred)
+        print("Firebase initialized")
+    return firebase_admin.get_app()
+
+
+def _client_class():
+    """gRPCチャネル設定を適用したFirestoreクライアントのクラスを生成
+
+    SDKのClientはチャネルオプションを受け取る引数がないため、SDKの非公開API
+    （Client._firestore_api プロパティと Client._firestore_api_helper）に依存している:
+    _firestore_api をサブクラスで上書きし、_firestore_api_helper にオプションを渡すトランスポートを渡す。
+    SDK標準でもkeepalive_time_ms=30000は設定されるため、これで追加されるのは
+    keepalive_timeout・permit_without_calls・最大受信サイズの3つ（と環境変数による調整）。
+    非公開APIはSDKの更新で変わりうるため、requirements.txtでバージョンを固定し、
+    test_firestore_client.pyで動作を検証している（SDK更新時はテストを通してから固定を上げる）。
+    """
+    from google.cloud import firestore
+    from google.cloud.firestore_v1.services.firestore import client as firestore_api_module
+    from google.cloud.firestore_v1.services.firestore.transports.grpc import FirestoreGrpcTransport
+
+    class TunedGrpcTransport(FirestoreGrpcTransport):
+        @classmethod
+        def create_channel(cls, host, credentials=None, **kwargs):
+            kwargs['options'] = list(get_channel_options().items())
+            return super().create_channel(host, credentials=credentials, **kwargs)
+
+    class TunedClient(firestore.Client):
+        @property
+        def _firestore_api(self):
+            # エミュレータ接続時はSDK標準のチャネルを使う（_firestore_api_helper内で分岐）
+            return self._firestore_api_helper(
+                TunedGrpcTransport, firestore_api_module.FirestoreClient, firestore_api_module
+            )
+
+    return TunedClient
+
+
+def _create_client():
+    """Firebaseアプリの認証情報でFirestoreクライアントを生成（gRPCチャネル設定を適用）"""
+    app = _initialize_app()
+    return _client_class()(credentials=app.credential.get_credential(), project=app.project_id)
+
+
+def get_client():
+    """共有Firestoreクライアントを取得（初回呼び出し時に生成）
+
+    gRPCチャネルはfork後のプロセスで共有できないため、
+    プロセスIDが変わった場合（gunicornワーカー等）は作り直す。
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _lock:
+        if _client is None or _client_pid != pid:
+            _client = _create_client()
+            _client_pid = pid
+    return _client
+
+
+def reset_client():
+    """共有クライアントを破棄（次回のget_clientで再生成）
+
+    このプロセスで生成したクライアントはgRPCチャネルを閉じる
+    （fork前のマスターで呼ぶ想定。fork元から引き継いだチャネルには触れない）。
+    """
+    global _client, _client_pid
+
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def transactional(fn):
+    """firestore.transactionalと同じ（SDKのimportを初回呼び出しまで遅らせる）"""
+    wrapped = None
+
+    @functools.wraps(fn)
+    def wrapper(transaction, *args, **kwargs):
+        nonlocal wrapped
+        if wrapped is None:
+            from firebase_admin import firestore
+            wrapped = firestore.transactional(fn)
+        return wrapped(transaction, *args, **kwargs)
+
+    return wrapper
+
+
+def increment(value):
+    """firestore.Increment（フィールド値の加算）"""
+    from firebase_admin import firestore
+    return firestore.Increment(value)
@@ -0,0 +1,27 @@
+"""Gemini SDK管理（google.generativeaiのimportとAPIキー設定を初回利用時にプロセス内で1回だけ行う）"""
+import os
+import threading
+
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+
+_genai = None
+_lock = threading.Lock()
+
+
+def _get_genai():
+    """google.generativeaiを取得（初回のみimportしてAPIキーを設定）"""
+    global _genai
+
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                import google.generativeai as genai
+                if GEMINI_API_KEY:
+                    genai.configure(api_key=GEMINI_API_KEY)
+                _genai = genai
+    return _genai
+
+
+def generative_model(model_name):
+    """生成モデルを取得"""
+    return _get_genai().GenerativeModel(model_name)
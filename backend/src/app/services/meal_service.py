@@ -1,11 +1,14 @@
 """食事記録サービス"""
-from firebase_admin import firestore
+from app.services import advice_service, firestore_client
 from datetime import datetime
+import hashlib
+import json
+import threading
 
 
 def get_db():
-    """Firestoreクライアントを取得"""
-    return firestore.client()
+    """Firestoreクライアントを取得（プロセス内で共有）"""
+    return firestore_client.get_client()
 
 
 # 食品プリセット（カロリー・PFC）
@@ -43,13 +46,74 @@ FOOD_PRESETS = [
 ]
 
 
+# 食品プリセットはコード内の固定値のため、内容のハッシュをimport時に1回だけ計算して版として使う
+FOOD_PRESETS_FINGERPRINT = hashlib.sha256(
+    json.dumps(FOOD_PRESETS, ensure_ascii=False, sort_keys=True).encode('utf-8')
+).hexdigest()[:32]
+
+
 def get_food_presets():
     """食品プリセット一覧を取得"""
     return FOOD_PRESETS
 
 
+# 日次ロールアップ（daily_nutrition）で集計する項目
+ROLLUP_FIELDS = ['total_calories', 'total_protein', 'total_fat', 'total_carbs']
+
+# ロールアップ作成済みの顧客（daily_nutrition_status/{customer_id}）
+# ロールアップ導入前の食事記録は、顧客ごとに初回の参照時に集計して書き込む
+ROLLUP_STATUS_COLLECTION = 'daily_nutrition_status'
+_rollup_ready_customers = set()
+_rollup_ready_lock = threading.Lock()
+
+
+def _calculate_totals(foods):
+    """食品リストから合計カロリー・PFCを計算"""
+    return {
+        'total_calories': sum(food.get('calories', 0) * food.get('quantity', 1) for food in foods),
+        'total_protein': sum(food.get('protein', 0) * food.get('quantity', 1) for food in foods),
+        'total_fat': sum(food.get('fat', 0) * food.get('quantity', 1) for food in foods),
+        'total_carbs': sum(food.get('carbs', 0) * food.get('quantity', 1) for food in foods),
+    }
+
+
+def _daily_nutrition_ref(db, customer_id, date):
+    """日次ロールアップのドキュメント参照（ID: {customer_id}_{date}）"""
+    return db.collection('daily_nutrition').document(f'{customer_id}_{date}')
+
+
+def _apply_rollup_deltas(transaction, db, deltas):
+    """トランザクション内で日次ロールアップに差分を反映
+
+    Args:
+        deltas: {(customer_id, date): (totals, count_delta)}
+    """
+    # トランザクションでは読み取りを全ての書き込みより先に行う
+    refs = {key: _daily_nutrition_ref(db, *key) for key in deltas}
+    snapshots = {key: ref.get(transaction=transaction) for key, ref in refs.items()}
+    
+    for key, (totals, count_delta) in deltas.items():
+        current = snapshots[key].to_dict() if snapshots[key].exists else {}
+        meal_count = current.get('meal_count', 0) + count_delta
+        
+        # 記録がなくなった日はロールアップごと削除
+        if meal_count <= 0:
+            transaction.delete(refs[key])
+            continue
+        
+        rollup = {
+            'customer_id': key[0],
+            'date': key[1],
+            'meal_count': meal_count,
+            'updated_at': datetime.now().isoformat()
+        }
+        for field in ROLLUP_FIELDS:
+            rollup[field] = current.get(field, 0) + totals.get(field, 0)
+        transaction.set(refs[key], rollup)
+
+
 def add_meal_record(data):
-    """食事記録を登録"""
+    """食事記録を登録（日次ロールアップも同時に加算）"""
     try:
         db = get_db()
         required = ['customer_id', 'date', 'meal_type', 'foods']
@@ -57,54 +121,69 @@ def add_meal_record(data):
             return None, 'Missing required fields'
         
         # 合計カロリー・PFCを計算
-        total_calories = sum(food.get('calories', 0) * food.get('quantity', 1) for food in data['foods'])
-        total_protein = sum(food.get('protein', 0) * food.get('quantity', 1) for food in data['foods'])
-        total_fat = sum(food.get('fat', 0) * food.get('quantity', 1) for food in data['foods'])
-        total_carbs = sum(food.get('carbs', 0) * food.get('quantity', 1) for food in data['foods'])
+        totals = _calculate_totals(data['foods'])
         
         doc_ref = db.collection('meal_records').document()
         record_id = doc_ref.id
         
-        doc_ref.set({
+        # 記録の作成とロールアップの加算を1つのバッチでアトミックに書き込む
+        batch = db.batch()
+        batch.set(doc_ref, {
             'customer_id': data['customer_id'],
             'date': data['date'],
             'meal_type': data['meal_type'],  # breakfast, lunch, dinner, snack
             'foods': data['foods'],  # [{ food_id, name, calories, protein, fat, carbs, quantity }]
-            'total_calories': total_calories,
-            'total_protein': total_protein,
-            'total_fat': total_fat,
-            'total_carbs': total_carbs,
+            **totals,
             'notes': data.get('notes', ''),
             'photo_url': data.get('photo_url', ''),
             'created_at': datetime.now().isoformat()
         })
         
+        rollup = {
+            'customer_id': data['customer_id'],
+            'date': data['date'],
+            'meal_count': firestore_client.increment(1),
+            'updated_at': datetime.now().isoformat()
+        }
+        for field in ROLLUP_FIELDS:
+            rollup[field] = firestore_client.increment(totals[field])
+        batch.set(_daily_nutrition_ref(db, data['customer_id'], data['date']), rollup, merge=True)
+        advice_service.touch(db, data['customer_id'], advice_service.MEAL, writer=batch)
+        
+        batch.commit()
+        
         return record_id, None
     except Exception as e:
         return None, str(e)
 
 
 def get_meal_records_by_customer(customer_id, start_date=None, end_date=None, limit=30):
-    """顧客の食事記録一覧を取得"""
+    """顧客の食事記録一覧を取得（新しい順）
+
+    日付範囲・ソート・limitはFirestore側で実行する
+    （複合インデックス: customer_id ASC + date DESC + created_at DESC）。
+    """
     db = get_db()
     query = db.collection('meal_records').where('customer_id', '==', customer_id)
     
+    # 日付範囲フィルタ（Firestoreの範囲クエリ）
+    if start_date:
+        query = query.where('date', '>=', start_date)
+    if end_date:
+        query = query.where('date', '<=', end_date)
+    
+    # 日付 → 登録日時でソート（新しい順）
+    query = query.order_by('date', direction=firestore_client.DESCENDING)\
+                 .order_by('created_at', direction=firestore_client.DESCENDING)\
+                 .limit(limit)
+    
     records = []
     for doc in query.stream():
         record = doc.to_dict()
         record['id'] = doc.id
-        
-        # 日付フィルタリング（Pythonで実施）
-        if start_date and record.get('date', '') < start_date:
-            continue
-        if end_date and record.get('date', '') > end_date:
-            continue
-        
         records.append(record)
     
-    # 日付でソート（新しい順）
-    records.sort(key=lambda x: (x.get('date', ''), x.get('created_at', '')), reverse=True)
-    return records[:limit]
+    return records
 
 
 def get_meal_record_by_id(record_id):
@@ -120,54 +199,182 @@ def get_meal_record_by_id(record_id):
     return None, 'Meal record not found'
 
 
+@firestore_client.transactional
+def _update_meal_record_in_transaction(transaction, db, record_id, data):
+    """食事記録の更新とロールアップの差分反映をトランザクションで実行"""
+    doc_ref = db.collection('meal_records').document(record_id)
+    snapshot = doc_ref.get(transaction=transaction)
+    
+    if snapshot.exists:
+        old_record = snapshot.to_dict()
+        new_record = {**old_record, **data}
+        old_key = (old_record.get('customer_id'), old_record.get('date'))
+        new_key = (new_record.get('customer_id'), new_record.get('date'))
+        
+        old_totals = {field: old_record.get(field, 0) for field in ROLLUP_FIELDS}
+        new_totals = {field: new_record.get(field, 0) for field in ROLLUP_FIELDS}
+        
+        if old_key == new_key:
+            deltas = {new_key: ({f: new_totals[f] - old_totals[f] for f in ROLLUP_FIELDS}, 0)}
+        else:
+            # 日付（または顧客）が変わった場合は旧日付から減算し新日付に加算
+            deltas = {
+                old_key: ({f: -old_totals[f] for f in ROLLUP_FIELDS}, -1),
+                new_key: (new_totals, 1)
+            }
+        _apply_rollup_deltas(transaction, db, deltas)
+        for customer_id in {old_key[0], new_key[0]}:
+            advice_service.touch(db, customer_id, advice_service.MEAL, writer=transaction)
+    
+    # 存在しない場合はコミット時にエラー（従来のupdateと同じ挙動）
+    transaction.update(doc_ref, data)
+
+
 def update_meal_record(record_id, data):
-    """食事記録を更新"""
+    """食事記録を更新（日次ロールアップも差分更新）"""
     db = get_db()
     
     # foodsが更新される場合は合計値を再計算
     if 'foods' in data:
-        data['total_calories'] = sum(food.get('calories', 0) * food.get('quantity', 1) for food in data['foods'])
-        data['total_protein'] = sum(food.get('protein', 0) * food.get('quantity', 1) for food in data['foods'])
-        data['total_fat'] = sum(food.get('fat', 0) * food.get('quantity', 1) for food in data['foods'])
-        data['total_carbs'] = sum(food.get('carbs', 0) * food.get('quantity', 1) for food in data['foods'])
+        data.update(_calculate_totals(data['foods']))
     
+    _update_meal_record_in_transaction(db.transaction(), db, record_id, data)
+
+
+@firestore_client.transactional
+def _delete_meal_record_in_transaction(transaction, db, record_id):
+    """食事記録の削除とロールアップの減算をトランザクションで実行"""
     doc_ref = db.collection('meal_records').document(record_id)
-    doc_ref.update(data)
+    snapshot = doc_ref.get(transaction=transaction)
+    
+    if snapshot.exists:
+        record = snapshot.to_dict()
+        key = (record.get('customer_id'), record.get('date'))
+        _apply_rollup_deltas(transaction, db, {
+            key: ({f: -record.get(f, 0) for f in ROLLUP_FIELDS}, -1)
+        })
+        advice_service.touch(db, key[0], advice_service.MEAL, writer=transaction)
+    
+    transaction.delete(doc_ref)
 
 
 def delete_meal_record(record_id):
-    """食事記録を削除"""
+    """食事記録を削除（日次ロールアップも減算）"""
     db = get_db()
-    db.collection('meal_records').document(record_id).delete()
+    _delete_meal_record_in_transaction(db.transaction(), db, record_id)
+
+
+def _format_daily_summary(date, rollup):
+    """ロールアップをAPIレスポンス形式に整形"""
+    return {
+        'date': date,
+        'total_calories': round(rollup.get('total_calories', 0), 1),
+        'total_protein': round(rollup.get('total_protein', 0), 1),
+        'total_fat': round(rollup.get('total_fat', 0), 1),
+        'total_carbs': round(rollup.get('total_carbs', 0), 1),
+        'meal_count': rollup.get('meal_count', 0)
+    }
+
+
+def _rollup_status_ref(db, customer_id):
+    return db.collection(ROLLUP_STATUS_COLLECTION).document(customer_id)
+
+
+def _ensure_daily_nutrition(db, customer_id):
+    """顧客の日次ロールアップが作成済みであることを保証
+
+    作成済みの記録がない顧客（ロールアップ導入前のデータ）は食事記録から集計して書き込む。
+    確認済みの顧客はプロセス内で記憶し、以降はFirestoreを読まない。
+    導入前に追加・更新された日のロールアップ（その記録分だけの値）もここで作り直される。
+    """
+    if customer_id in _rollup_ready_customers:
+        return
+    if not _rollup_status_ref(db, customer_id).get().exists:
+        rebuild_daily_nutrition(customer_id)
+    with _rollup_ready_lock:
+        _rollup_ready_customers.add(customer_id)
 
 
 def get_daily_nutrition_summary(customer_id, date):
-    """1日の栄養素サマリーを取得"""
+    """1日の栄養素サマリーを取得（日次ロールアップを1件読むだけ）"""
     db = get_db()
-    query = db.collection('meal_records').where('customer_id', '==', customer_id).where('date', '==', date)
+    _ensure_daily_nutrition(db, customer_id)
+    doc = _daily_nutrition_ref(db, customer_id, date).get()
+    rollup = doc.to_dict() if doc.exists else {}
+    return _format_daily_summary(date, rollup)
+
+
+def get_daily_nutrition_range(customer_id, limit=7):
+    """記録のある直近の日次サマリーを新しい順に取得
+
+    複合インデックス: customer_id ASC + date DESC（daily_nutrition）
+    """
+    db = get_db()
+    _ensure_daily_nutrition(db, customer_id)
+    query = db.collection('daily_nutrition')\
+              .where('customer_id', '==', customer_id)\
+              .order_by('date', direction=firestore_client.DESCENDING)\
+              .limit(limit)
     
-    total_calories = 0
-    total_protein = 0
-    total_fat = 0
-    total_carbs = 0
-    meal_count = 0
+    summaries = []
+    for doc in query.stream():
+        rollup = doc.to_dict()
+        summaries.append(_format_daily_summary(rollup.get('date'), rollup))
+    return summaries
+
+
+def rebuild_daily_nutrition(customer_id=None, batch_size=500):
+    """食事記録から日次ロールアップを再構築（初回移行・復元後の整合用）
+
+    集計した顧客（customer_id指定時はその顧客）をロールアップ作成済みとして記録する。
+
+    Returns:
+        int: 書き込んだロールアップ数
+    """
+    db = get_db()
+    query = db.collection('meal_records')
+    if customer_id:
+        query = query.where('customer_id', '==', customer_id)
     
+    rollups = {}
     for doc in query.stream():
         record = doc.to_dict()
-        total_calories += record.get('total_calories', 0)
-        total_protein += record.get('total_protein', 0)
-        total_fat += record.get('total_fat', 0)
-        total_carbs += record.get('total_carbs', 0)
-        meal_count += 1
+        key = (record.get('customer_id'), record.get('date'))
+        rollup = rollups.setdefault(key, {field: 0 for field in ROLLUP_FIELDS + ['meal_count']})
+        for field in ROLLUP_FIELDS:
+            rollup[field] += record.get(field, 0)
+        rollup['meal_count'] += 1
     
-    return {
-        'date': date,
-        'total_calories': round(total_calories, 1),
-        'total_protein': round(total_protein, 1),
-        'total_fat': round(total_fat, 1),
-        'total_carbs': round(total_carbs, 1),
-        'meal_count': meal_count
-    }
+    writes = [
+        (_daily_nutrition_ref(db, rollup_customer_id, date), {
+            'customer_id': rollup_customer_id,
+            'date': date,
+            **rollup,
+            'updated_at': datetime.now().isoformat()
+        })
+        for (rollup_customer_id, date), rollup in rollups.items()
+    ]
+    # ロールアップの後に書き込む（途中で失敗した顧客は次回の参照時に再集計される）
+    customer_ids = {customer_id} if customer_id else {key[0] for key in rollups}
+    writes.extend(
+        (_rollup_status_ref(db, status_customer_id), {'rebuilt_at': datetime.now().isoformat()})
+        for status_customer_id in customer_ids
+    )
+    
+    batch = db.batch()
+    pending = 0
+    for ref, data in writes:
+        batch.set(ref, data)
+        pending += 1
+        if pending >= batch_size:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    
+    if pending:
+        batch.commit()
+    
+    return len(rollups)
 
 
 def get_nutrition_goal(customer_id):
@@ -206,5 +413,8 @@ def set_nutrition_goal(customer_id, data):
         'updated_at': datetime.now().isoformat()
     }
     
-    doc_ref.set(goal_data)
+    batch = db.batch()
+    batch.set(doc_ref, goal_data)
+    advice_service.touch(db, customer_id, advice_service.MEAL, writer=batch)
+    batch.commit()
     return goal_data
@@ -0,0 +1,79 @@
+"""顧客詳細ページ用の集約サービス
+
+顧客情報・体重履歴・トレーニング・食事記録・栄養目標をサーバー側で並行取得し、
+1回のHTTPリクエストで顧客詳細ページに必要なデータを返す。
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services import customer_service, meal_service, training_service, weight_service
+
+OVERVIEW_MAX_WORKERS = int(os.environ.get('OVERVIEW_MAX_WORKERS', 8))
+
+# 各セクションの取得件数（デフォルト）
+DEFAULT_WEIGHT_LIMIT = 30
+DEFAULT_TRAINING_LIMIT = 30
+DEFAULT_MEAL_LIMIT = 30
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    """スレッドプールを取得（fork後のプロセスでは作り直す）"""
+    global _executor, _executor_pid
+
+    pid = os.getpid()
+    with _lock:
+        if _executor is None or _executor_pid != pid:
+            _executor = ThreadPoolExecutor(max_workers=OVERVIEW_MAX_WORKERS, thread_name_prefix='overview')
+            _executor_pid = pid
+        return _executor
+
+
+def get_customer_overview(customer_id, weight_limit=DEFAULT_WEIGHT_LIMIT,
+                          training_limit=DEFAULT_TRAINING_LIMIT, meal_limit=DEFAULT_MEAL_LIMIT):
+    """顧客詳細ページのデータをまとめて取得（各セクションのFirestoreクエリを並行実行）
+
+    各limitに0以下を指定したセクションは取得せず空配列を返す。
+
+    Returns:
+        tuple: (overview, error)
+    """
+    executor = _get_executor()
+    customer_future = executor.submit(customer_service.get_customer_by_id, customer_id)
+    goal_future = executor.submit(meal_service.get_nutrition_goal, customer_id)
+    section_futures = {}
+    if weight_limit > 0:
+        section_futures['weight_history'] = executor.submit(
+            weight_service.get_weight_history, customer_id, weight_limit
+        )
+    if training_limit > 0:
+        section_futures['training_sessions'] = executor.submit(
+            training_service.get_training_sessions_by_customer, customer_id, training_limit
+        )
+    if meal_limit > 0:
+        section_futures['meal_records'] = executor.submit(
+            meal_service.get_meal_records_by_customer, customer_id, None, None, meal_limit
+        )
+
+    customer, error = customer_future.result()
+    if error:
+        return None, error
+
+    nutrition_goal, error = goal_future.result()
+    if error:
+        return None, error
+
+    overview = {
+        'customer': customer,
+        'weight_history': [],
+        'training_sessions': [],
+        'meal_records': [],
+        'nutrition_goal': nutrition_goal
+    }
+    for name, future in section_futures.items():
+        overview[name] = future.result()
+    return overview, None
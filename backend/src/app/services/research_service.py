@@ -1,186 +1,434 @@
 """研究記事検索サービス（PubMed API）"""
 import os
-import requests
-import google.generativeai as genai
+import random
+import socket
+import threading
+import time
+import unicodedata
 from datetime import datetime, timedelta
-import xml.etree.ElementTree as ET
+
+from app.services import article_service, cache_service, eutils_client, firestore_client, gemini_client, upstream_service
 
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
 
 # 定数
 DEFAULT_TITLE = 'No title'
+TITLE_TRANSLATION_ATTEMPTS = 2  # タイトル翻訳の試行回数（失敗分のみ並行で再試行）
+QUERY_TRANSLATION_ATTEMPTS = 2  # 検索語翻訳の試行回数（待たずに再試行、1回ごとにupstreamのタイムアウトで打ち切る）
+
+# 検索結果キャッシュ（新鮮な期間を過ぎても古い結果を返しつつ裏で再検索）
+SEARCH_CACHE_FRESH_MINUTES = int(os.environ.get('RESEARCH_SEARCH_CACHE_FRESH_MINUTES', 60))
+SEARCH_CACHE_STALE_HOURS = int(os.environ.get('RESEARCH_SEARCH_CACHE_STALE_HOURS', 24))
+_search_cache = cache_service.create_swr_cache(
+    'research_search',
+    fresh_seconds=SEARCH_CACHE_FRESH_MINUTES * 60,
+    stale_seconds=SEARCH_CACHE_STALE_HOURS * 3600,
+    max_entries=int(os.environ.get('RESEARCH_SEARCH_CACHE_MAX_ENTRIES', 256))
+)
 
-# 研究記事のキャッシュ
+# 翻訳クライアント（プロセス内で共有）
+_translator = None
+_translator_lock = threading.Lock()
+
+# 研究記事のキャッシュ（メモリ上、research_cache/latestの共有キャッシュをバックグラウンドで同期）
 research_cache = {
     'data': None,
     'timestamp': None
 }
 
+# バックグラウンド更新の設定
+REFRESH_INTERVAL_MINUTES = int(os.environ.get('RESEARCH_REFRESH_INTERVAL_MINUTES', 60))  # PubMedから取り直す間隔
+REFRESH_CHECK_SECONDS = int(os.environ.get('RESEARCH_REFRESH_CHECK_SECONDS', 300))  # 共有キャッシュを確認する間隔
+REFRESH_JITTER = 0.2  # 確認間隔のゆらぎ（±20%）
+REFRESH_LOCK_SECONDS = 120  # 更新ロックの有効期限
 
-def fetch_latest_research():
-    """PubMed APIから最新の筋トレ・ダイエット研究を取得"""
-    try:
-        from googletrans import Translator
-        translator = Translator()
-        
-        # PubMed E-Search APIで論文IDを検索（人間対象のトレーニング研究のみ）
-        search_terms = "(((muscle hypertrophy[Title] OR resistance training[Title] OR strength training[Title]) OR (weight loss[Title] OR protein intake[Title])) AND (humans[MeSH Terms] OR human[Title/Abstract] OR adults[Title/Abstract]) AND (training[Title/Abstract] OR exercise[Title/Abstract]) AND (2024[PDAT] OR 2025[PDAT])) NOT (disease[Title] OR cancer[Title] OR diabetes[Title] OR hypertension[Title] OR stroke[Title] OR injury[Title] OR rehabilitation[Title] OR surgery[Title] OR elderly[Title] OR aging[Title] OR children[Title] OR pediatric[Title] OR rat[Title] OR mouse[Title] OR mice[Title] OR animal[Title] OR in vitro[Title] OR cell[Title] OR chemical[Title] OR toxicity[Title] OR hormone disruption[Title] OR molecular[Title] OR pathway[Title] OR gene[Title] OR review[Publication Type])"
-        search_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-        search_params = {
-            'db': 'pubmed',
-            'term': search_terms,
-            'retmax': 5,
-            'sort': 'pub_date',
-            'retmode': 'json'
-        }
-        
-        search_response = requests.get(search_url, params=search_params, timeout=10)
-        search_data = search_response.json()
-        
-        if 'esearchresult' not in search_data or 'idlist' not in search_data['esearchresult']:
-            return []
-        
-        pmids = search_data['esearchresult']['idlist']
-        
-        if not pmids:
-            return []
-        
-        # PubMed E-Summary APIで論文詳細を取得
-        summary_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
-        summary_params = {
-            'db': 'pubmed',
-            'id': ','.join(pmids),
-            'retmode': 'json'
+_refresher_pid = None
+_refresher_lock = threading.Lock()
+_cold_start_lock = threading.Lock()
+
+
+def _clean_title(article_data):
+    """E-Summaryの英語タイトルを取得（末尾のピリオドを除去）"""
+    english_title = article_data.get('title', DEFAULT_TITLE)
+    if english_title.endswith('.'):
+        english_title = english_title[:-1]
+    return english_title
+
+
+def _get_translator():
+    """googletransの翻訳クライアントを取得（初回のみ生成して使い回す）"""
+    global _translator
+    with _translator_lock:
+        if _translator is None:
+            from googletrans import Translator
+            _translator = Translator()
+        return _translator
+
+
+def translate_titles(titles):
+    """英語タイトルを日本語にまとめて翻訳（並行実行）
+
+    Args:
+        titles: {pmid: 英語タイトル}
+    
+    Returns:
+        dict: {pmid: 日本語タイトル}（翻訳に失敗したPMIDは含まない）
+    """
+    translator = _get_translator()
+    translate = upstream_service.get('translate')
+    translated = {}
+    pending = dict(titles)
+    
+    for attempt in range(TITLE_TRANSLATION_ATTEMPTS):
+        futures = {
+            pmid: translate.submit(translator.translate, title, src='en', dest='ja')
+            for pmid, title in pending.items()
         }
-        
-        summary_response = requests.get(summary_url, params=summary_params, timeout=10)
-        summary_data = summary_response.json()
-        
-        articles = []
-        if 'result' in summary_data:
-            for pmid in pmids:
-                if pmid in summary_data['result']:
-                    article_data = summary_data['result'][pmid]
-                    
-                    # 英語タイトル取得
-                    english_title = article_data.get('title', DEFAULT_TITLE)
-                    if english_title.endswith('.'):
-                        english_title = english_title[:-1]
-                    
-                    # googletransで高速翻訳
-                    try:
-                        translated = translator.translate(english_title, src='en', dest='ja')
-                        japanese_title = translated.text
-                    except Exception:
-                        japanese_title = english_title  # 翻訳失敗時は英語のまま
-                    
-                    # 著者取得
-                    authors = []
-                    if 'authors' in article_data and article_data['authors']:
-                        authors = [author.get('name', '') for author in article_data['authors'][:3]]
-                    author_text = ', '.join(authors) if authors else 'Unknown authors'
-                    
-                    # 日付取得と整形
-                    pub_date_raw = article_data.get('pubdate', '2024')
-                    try:
-                        from dateutil import parser
-                        parsed_date = parser.parse(pub_date_raw)
-                        pub_date = parsed_date.strftime('%Y-%m-%d')
-                    except Exception:
-                        import re
-                        year_match = re.search(r'20\d{2}', pub_date_raw)
-                        pub_date = f"{year_match.group()}-01-01" if year_match else "2024-01-01"
-                    
-                    # 要約作成
-                    summary = f"{author_text}らによる研究"
-                    
-                    # PubMed URL
-                    url = f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
-                    
-                    articles.append({
-                        'title': japanese_title,
-                        'summary': summary,
-                        'source': 'PubMed',
-                        'date': pub_date,
-                        'url': url
-                    })
-        
-        return articles
+        failed = {}
+        for pmid, future in futures.items():
+            try:
+                translated[pmid] = translate.result(future).text
+            except Exception as e:
+                print(f"[translate_titles] PMID {pmid} - attempt {attempt + 1} FAILED: {type(e).__name__}: {str(e)}")
+                failed[pmid] = pending[pmid]
+        if not failed:
+            break
+        pending = failed
     
+    return translated
+
+
+def _read_articles(pmids):
+    """論文ストアから読み込み（失敗時は空として扱う）"""
+    try:
+        return article_service.get_articles(pmids)
     except Exception as e:
-        print(f"PubMed API Error: {str(e)}")
+        print(f"[research_service] Article store read failed: {str(e)}")
+        return {}
+
+
+def _write_articles(articles):
+    """論文ストアへ書き込み（失敗しても処理は継続）"""
+    try:
+        article_service.save_articles(articles)
+    except Exception as e:
+        print(f"[research_service] Article store write failed: {str(e)}")
+
+
+def get_article_metadata(pmids):
+    """論文のメタデータ（タイトル・日本語タイトル・著者・出版日）を取得
+
+    論文ストアを先に参照し（read-through）、未保存の論文のみE-Summaryで取得、
+    未翻訳のタイトルのみ並行翻訳して、取得・翻訳した分をストアへ書き戻す。
+    
+    Returns:
+        dict: {pmid: {'title', 'title_ja', 'authors', 'pubdate'}}
+            （PubMedに存在しないPMIDは含まない、翻訳失敗時はtitle_jaなし）
+    """
+    stored = _read_articles(pmids)
+    
+    # 出版日まで保存済みの論文はE-Summaryを省略
+    missing = [pmid for pmid in pmids if 'pubdate' not in stored.get(pmid, {})]
+    fetched = {}
+    if missing:
+        # 未保存分をまとめて1回のE-Summaryで取得
+        summaries = eutils_client.get_client().esummary(missing)
+        for pmid in missing:
+            if pmid in summaries:
+                article_data = summaries[pmid]
+                fetched[pmid] = {
+                    'title': _clean_title(article_data),
+                    'authors': [author.get('name', '') for author in article_data.get('authors') or []],
+                    'pubdate': article_data.get('pubdate', '')
+                }
+    
+    articles = {}
+    for pmid in pmids:
+        if pmid not in stored and pmid not in fetched:
+            continue
+        article = {**stored.get(pmid, {}), **fetched.get(pmid, {})}
+        # タイトルが変わっていれば保存済みの翻訳は使わない
+        if pmid in fetched and stored.get(pmid, {}).get('title') != article['title']:
+            article.pop('title_ja', None)
+        articles[pmid] = article
+    
+    # 未翻訳のタイトルのみまとめて翻訳
+    untranslated = {pmid: article['title'] for pmid, article in articles.items() if not article.get('title_ja')}
+    translated = translate_titles(untranslated) if untranslated else {}
+    for pmid, title_ja in translated.items():
+        articles[pmid]['title_ja'] = title_ja
+    
+    # 取得・翻訳した分を書き戻す
+    updates = {pmid: dict(fields) for pmid, fields in fetched.items()}
+    for pmid, title_ja in translated.items():
+        updates.setdefault(pmid, {})['title_ja'] = title_ja
+    if updates:
+        _write_articles(updates)
+    
+    return articles
+
+
+def fetch_latest_research():
+    """PubMed APIから最新の筋トレ・ダイエット研究を取得
+
+    Raises:
+        Exception: PubMedへの問い合わせに失敗した場合（該当なしの空リストと区別し、前回のキャッシュを残すため）
+    """
+    # PubMed E-Search APIで論文IDを検索（人間対象のトレーニング研究のみ）
+    search_terms = "(((muscle hypertrophy[Title] OR resistance training[Title] OR strength training[Title]) OR (weight loss[Title] OR protein intake[Title])) AND (humans[MeSH Terms] OR human[Title/Abstract] OR adults[Title/Abstract]) AND (training[Title/Abstract] OR exercise[Title/Abstract]) AND (2024[PDAT] OR 2025[PDAT])) NOT (disease[Title] OR cancer[Title] OR diabetes[Title] OR hypertension[Title] OR stroke[Title] OR injury[Title] OR rehabilitation[Title] OR surgery[Title] OR elderly[Title] OR aging[Title] OR children[Title] OR pediatric[Title] OR rat[Title] OR mouse[Title] OR mice[Title] OR animal[Title] OR in vitro[Title] OR cell[Title] OR chemical[Title] OR toxicity[Title] OR hormone disruption[Title] OR molecular[Title] OR pathway[Title] OR gene[Title] OR review[Publication Type])"
+    search_data = eutils_client.get_client().esearch(search_terms, retmax=5, sort='pub_date')
+    
+    if 'esearchresult' not in search_data or 'idlist' not in search_data['esearchresult']:
+        return []
+    
+    pmids = search_data['esearchresult']['idlist']
+    
+    if not pmids:
         return []
+    
+    # 論文詳細を取得（保存済みの論文はストアから、タイトルは日本語訳付き）
+    metadata = get_article_metadata(pmids)
+    
+    articles = []
+    for pmid in pmids:
+        if pmid in metadata:
+            article_data = metadata[pmid]
+            japanese_title = article_data.get('title_ja', article_data['title'])  # 翻訳失敗時は英語のまま
+            
+            # 著者取得
+            authors = article_data.get('authors', [])[:3]
+            author_text = ', '.join(authors) if authors else 'Unknown authors'
+            
+            # 日付取得と整形
+            pub_date_raw = article_data.get('pubdate') or '2024'
+            try:
+                from dateutil import parser
+                parsed_date = parser.parse(pub_date_raw)
+                pub_date = parsed_date.strftime('%Y-%m-%d')
+            except Exception:
+                import re
+                year_match = re.search(r'20\d{2}', pub_date_raw)
+                pub_date = f"{year_match.group()}-01-01" if year_match else "2024-01-01"
+            
+            # 要約作成
+            summary = f"{author_text}らによる研究"
+            
+            # PubMed URL
+            url = f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
+            
+            articles.append({
+                'title': japanese_title,
+                'summary': summary,
+                'source': 'PubMed',
+                'date': pub_date,
+                'url': url
+            })
+    
+    return articles
 
 
-def get_cached_research():
-    """キャッシュから研究記事を取得（1時間以内ならキャッシュ利用）"""
+def get_db():
+    """Firestoreクライアントを取得（プロセス内で共有）"""
+    return firestore_client.get_client()
+
+
+def _shared_cache_ref(db):
+    """全ワーカー共有の最新研究キャッシュ"""
+    return db.collection('research_cache').document('latest')
+
+
+def _set_memory_cache(data):
+    research_cache['data'] = data
+    research_cache['timestamp'] = data['cached_at']
+
+
+def _sync_from_shared_cache():
+    """共有キャッシュが手元より新しければメモリに読み込む"""
+    try:
+        doc = _shared_cache_ref(get_db()).get()
+    except Exception as e:
+        print(f"[research_refresher] Shared cache read failed: {str(e)}")
+        return
+    if not doc.exists:
+        return
+    shared = doc.to_dict()
+    if 'cached_at' not in shared:
+        return
+    if research_cache['timestamp'] is None or shared['cached_at'] > research_cache['timestamp']:
+        _set_memory_cache({'articles': shared.get('articles', []), 'cached_at': shared['cached_at']})
+
+
+@firestore_client.transactional
+def _acquire_refresh_lock_in_transaction(transaction, ref, owner):
+    snapshot = ref.get(transaction=transaction)
+    now = time.time()
+    if snapshot.exists and snapshot.to_dict().get('refresh_lock_until', 0) > now:
+        return False
+    transaction.set(ref, {'refresh_lock_until': now + REFRESH_LOCK_SECONDS, 'refresh_owner': owner}, merge=True)
+    return True
+
+
+def _acquire_refresh_lock():
+    """更新ロックを取得（全ワーカーで1つのみ、期限付き）
+
+    共有キャッシュに接続できない場合は各ワーカーで個別に更新する。
+    """
+    try:
+        db = get_db()
+        owner = f'{socket.gethostname()}:{os.getpid()}'
+        return _acquire_refresh_lock_in_transaction(db.transaction(), _shared_cache_ref(db), owner)
+    except Exception as e:
+        print(f"[research_refresher] Refresh lock unavailable, refreshing locally: {str(e)}")
+        return True
+
+
+def refresh_research_cache():
+    """PubMedから最新研究を取得して共有キャッシュを更新
+
+    更新ロックを取得できたワーカーのみが取得し、他のワーカーは共有キャッシュを読み込む。
+    取得に失敗した場合はキャッシュを変えずにロックを解放して例外を送出する（次の確認時に再試行）。
+    """
+    if not _acquire_refresh_lock():
+        _sync_from_shared_cache()
+        return research_cache['data']
+    
     try:
-        if research_cache['data'] and research_cache['timestamp']:
-            cache_time = datetime.fromisoformat(research_cache['timestamp'])
-            if datetime.now() - cache_time < timedelta(hours=1):
-                return research_cache['data'], None
-        
-        # PubMed APIから論文取得
         articles = fetch_latest_research()
         
-        # 空でもキャッシュに保存（頻繁なAPI呼び出しを防ぐ）
-        research_cache['data'] = {
+        # 該当なしの空リストはキャッシュに保存（頻繁なAPI呼び出しを防ぐ）
+        # 取得失敗は例外になるため、前回の記事を空で上書きしない
+        data = {
             'articles': articles,
             'cached_at': datetime.now().isoformat()
         }
-        research_cache['timestamp'] = datetime.now().isoformat()
+        _set_memory_cache(data)
         
-        return research_cache['data'], None
+        try:
+            _shared_cache_ref(get_db()).set({**data, 'refresh_lock_until': 0})
+        except Exception as e:
+            print(f"[research_refresher] Shared cache write failed: {str(e)}")
+        
+        return data
+    except Exception as e:
+        # 取得失敗時はロックを解放して次の機会に再試行
+        print(f"PubMed API Error: {str(e)}")
+        try:
+            _shared_cache_ref(get_db()).set({'refresh_lock_until': 0}, merge=True)
+        except Exception:
+            pass
+        raise
+
+
+def _needs_refresh():
+    if research_cache['timestamp'] is None:
+        return True
+    cache_time = datetime.fromisoformat(research_cache['timestamp'])
+    return datetime.now() - cache_time >= timedelta(minutes=REFRESH_INTERVAL_MINUTES)
+
+
+def _refresher_loop():
+    """バックグラウンド更新ループ（ワーカーごとに1スレッド）"""
+    while True:
+        try:
+            _sync_from_shared_cache()
+            if _needs_refresh():
+                refresh_research_cache()
+        except Exception as e:
+            print(f"[research_refresher] Refresh failed: {str(e)}")
+        
+        # 全ワーカーが同時に確認しないよう間隔をランダムにずらす
+        interval = REFRESH_CHECK_SECONDS * random.uniform(1 - REFRESH_JITTER, 1 + REFRESH_JITTER)
+        time.sleep(interval)
+
+
+def start_refresher():
+    """バックグラウンド更新スレッドを開始（プロセスごとに1回、fork後は作り直す）"""
+    global _refresher_pid
+    
+    pid = os.getpid()
+    if _refresher_pid == pid:
+        return
+    with _refresher_lock:
+        if _refresher_pid != pid:
+            threading.Thread(target=_refresher_loop, name='research-refresher', daemon=True).start()
+            _refresher_pid = pid
+
+
+def get_cached_research():
+    """キャッシュから研究記事を取得（メモリから返し、更新はバックグラウンドで行う）"""
+    try:
+        start_refresher()
+        if research_cache['data']:
+            return research_cache['data'], None
+        
+        # 起動直後のみ: 共有キャッシュを読み込み、なければその場で取得
+        with _cold_start_lock:
+            if not research_cache['data']:
+                _sync_from_shared_cache()
+            if not research_cache['data']:
+                refresh_research_cache()
+        
+        # 他のワーカーが初回取得中の場合は空の一覧を返す
+        return research_cache['data'] or {'articles': [], 'cached_at': None}, None
     
     except Exception as e:
         print(f"get_cached_research error: {str(e)}")
         return None, str(e)
 
 
+def _search_cache_key(query, offset):
+    """検索キャッシュのキー（全角/半角・大文字/小文字・空白の違いを正規化）"""
+    normalized = ' '.join(unicodedata.normalize('NFKC', query).lower().split())
+    return f'{normalized}|{int(offset)}'
+
+
 def search_research(query, offset=0):
+    """研究検索（検索結果キャッシュ付き）
+
+    同じクエリ・オフセットの検索結果はキャッシュから返す。
+    一定時間を過ぎた結果は古い結果を即座に返しつつ、バックグラウンドで再検索する。
+    """
+    def load():
+        result, error = _search_pubmed(query, offset)
+        if error:
+            raise RuntimeError(error)  # エラー結果はキャッシュしない
+        return result
+    
+    try:
+        result, state = _search_cache.get_or_load(_search_cache_key(query, offset), load)
+        print(f"[search_research] Cache {state.upper()}: {query}, offset: {offset}")
+        return result, None
+    except Exception as e:
+        return None, str(e)
+
+
+def _translate_query(query):
+    """検索語を日本語から英語に翻訳（失敗時は元のクエリを返す）"""
+    for attempt in range(QUERY_TRANSLATION_ATTEMPTS):
+        try:
+            translated = upstream_service.call('translate', _get_translator().translate, query, src='ja', dest='en')
+            print(f"[search_research] Translation successful: {query} -> {translated.text}")
+            return translated.text
+        except Exception as translate_error:
+            print(f"[search_research] Translation attempt {attempt + 1} failed: {translate_error}")
+    print(f"[search_research] Translation failed after {QUERY_TRANSLATION_ATTEMPTS} attempts, using original query: {query}")
+    return query
+
+
+def _search_pubmed(query, offset=0):
     """研究検索（日本語→英語翻訳→PubMed検索）"""
     try:
         print(f"[search_research] Starting search for query: {query}, offset: {offset}")
         
-        # 日本語→英語翻訳（タイムアウト対策 + リトライ）
-        english_query = query  # デフォルトはそのまま
-        
-        # googletransを複数回リトライ
-        for attempt in range(3):
-            try:
-                from googletrans import Translator
-                translator = Translator()
-                translated = translator.translate(query, src='ja', dest='en')
-                english_query = translated.text
-                print(f"[search_research] Translation successful: {query} -> {english_query}")
-                break  # 成功したらループを抜ける
-            except Exception as translate_error:
-                print(f"[search_research] Translation attempt {attempt + 1} failed: {translate_error}")
-                if attempt == 2:  # 最後の試行
-                    print(f"[search_research] Translation failed after 3 attempts, using original query: {query}")
-                else:
-                    import time
-                    time.sleep(1)  # 1秒待ってリトライ
+        # 日本語→英語翻訳（失敗時は元のクエリで検索）
+        english_query = _translate_query(query)
         
         # フィットネス特化の検索クエリを構築（人間対象のトレーニング研究のみ）
         fitness_query = f"({english_query}) AND (humans[MeSH Terms] OR human OR adults) AND (resistance training OR strength training OR exercise OR training OR nutrition OR diet) NOT (disease OR pathology OR clinical trial OR patient OR therapy OR treatment OR cancer OR diabetes OR heart failure OR hypertension OR cardiovascular OR stroke OR injury OR rehabilitation OR surgery OR medical OR hospital OR elderly OR aging OR chronic OR acute OR syndrome OR disorder OR impairment OR disability OR risk OR mortality OR morbidity OR rat OR mouse OR mice OR animal OR in vitro OR in vivo OR cell culture OR chemical OR compound OR toxicity OR contamination OR pollutant OR pesticide OR hormone disruption OR molecular OR mechanism OR pathway OR gene OR protein expression OR enzyme OR receptor OR signaling OR review[Publication Type] OR meta-analysis[Publication Type])"
         
         # PubMed検索
-        search_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-        search_params = {
-            'db': 'pubmed',
-            'term': fitness_query,
-            'retmax': 10,
-            'retstart': offset,
-            'sort': 'pub_date',
-            'retmode': 'json'
-        }
-        
         print(f"[search_research] Querying PubMed with: {fitness_query[:100]}...")
-        search_response = requests.get(search_url, params=search_params, timeout=10)
-        search_data = search_response.json()
+        search_data = eutils_client.get_client().esearch(fitness_query, retmax=10, retstart=offset, sort='pub_date')
         
         # 全件数を取得
         total_count = 0
@@ -210,72 +458,29 @@ def search_research(query, offset=0):
                 'displayed_count': 0
             }, None
         
-        # 論文詳細取得
-        summary_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
-        summary_params = {
-            'db': 'pubmed',
-            'id': ','.join(pmids),
-            'retmode': 'json'
-        }
-        
-        summary_response = requests.get(summary_url, params=summary_params, timeout=10)
-        summary_data = summary_response.json()
+        # 論文詳細取得（保存済みの論文はストアから、タイトルは日本語訳付き）
+        metadata = get_article_metadata(pmids)
         
         results = []
-        if 'result' in summary_data:
-            for pmid in pmids:
-                if pmid in summary_data['result']:
-                    article_data = summary_data['result'][pmid]
-                    
-                    # 英語タイトル取得
-                    english_title = article_data.get('title', 'No title')
-                    if english_title.endswith('.'):
-                        english_title = english_title[:-1]
-                    
-                    print(f"[search_research] PMID {pmid} - Original English title: {english_title[:50]}...")
-                    
-                    # googletransで日本語翻訳（3回リトライ）
-                    japanese_title = english_title  # デフォルトは英語
-                    translation_successful = False
-                    for attempt in range(3):
-                        try:
-                            print(f"[search_research] PMID {pmid} - Translation attempt {attempt + 1}")
-                            from googletrans import Translator
-                            title_translator = Translator()
-                            translated_title = title_translator.translate(english_title, src='en', dest='ja')
-                            japanese_title = translated_title.text
-                            translation_successful = True
-                            print(f"[search_research] PMID {pmid} - Translation SUCCESS: {japanese_title[:50]}...")
-                            break  # 成功したらループを抜ける
-                        except Exception as translate_error:
-                            print(f"[search_research] PMID {pmid} - Translation attempt {attempt + 1} FAILED: {type(translate_error).__name__}: {str(translate_error)}")
-                            if attempt < 2:  # 最後の試行でなければ
-                                import time
-                                time.sleep(1)  # 1秒待ってリトライ
-                            else:
-                                print(f"[search_research] PMID {pmid} - All translation attempts failed, using English title")
-                    
-                    if not translation_successful:
-                        print(f"[search_research] PMID {pmid} - Final title (ENGLISH): {japanese_title[:50]}...")
-                    else:
-                        print(f"[search_research] PMID {pmid} - Final title (JAPANESE): {japanese_title[:50]}...")
-                    
-                    # 著者取得
-                    authors = []
-                    if 'authors' in article_data and article_data['authors']:
-                        authors = [author.get('name', '') for author in article_data['authors'][:3]]
-                    author_text = ', '.join(authors) if authors else 'Unknown'
-                    
-                    # 日付取得
-                    pub_date = article_data.get('pubdate', 'Unknown')
-                    
-                    results.append({
-                        'pmid': pmid,
-                        'title': japanese_title,
-                        'authors': author_text,
-                        'date': pub_date,
-                        'url': f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
-                    })
+        for pmid in pmids:
+            if pmid in metadata:
+                article_data = metadata[pmid]
+                japanese_title = article_data.get('title_ja', article_data['title'])  # 翻訳失敗時は英語のまま
+                
+                # 著者取得
+                authors = article_data.get('authors', [])[:3]
+                author_text = ', '.join(authors) if authors else 'Unknown'
+                
+                # 日付取得
+                pub_date = article_data.get('pubdate') or 'Unknown'
+                
+                results.append({
+                    'pmid': pmid,
+                    'title': japanese_title,
+                    'authors': author_text,
+                    'date': pub_date,
+                    'url': f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
+                })
         
         return {
             'results': results,
@@ -294,34 +499,34 @@ def search_research(query, offset=0):
 
 
 def get_research_summary(pmid):
-    """論文の要約をAI生成"""
+    """論文の要約をAI生成
+
+    生成済みの要約は論文ストアから返す（外部API呼び出しなし）。
+    Abstractが保存済みであればE-Fetchも省略し、生成した要約はストアへ書き戻す。
+    PubMedに存在しないPMIDは要約を生成・保存せず'Article not found'を返す。
+    """
+    if not pmid.isdigit():
+        return None, 'Article not found'
+    
+    article = _read_articles([pmid]).get(pmid, {})
+    if article.get('summary_ja'):
+        return _format_research_summary(pmid, article.get('title', DEFAULT_TITLE), article['summary_ja']), None
+    
     if not GEMINI_API_KEY:
         return None, 'Gemini API not configured'
     
     try:
-        # PubMed Fetch APIでAbstract取得
-        fetch_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
-        fetch_params = {
-            'db': 'pubmed',
-            'id': pmid,
-            'retmode': 'xml'
-        }
-        
-        fetch_response = requests.get(fetch_url, params=fetch_params, timeout=10)
-        
-        # XMLから要約抽出
-        root = ET.fromstring(fetch_response.content)
-        
-        # タイトル取得
-        title_elem = root.find('.//ArticleTitle')
-        title = title_elem.text if title_elem is not None else DEFAULT_TITLE
-        
-        # Abstract取得
-        abstract_elem = root.find('.//Abstract/AbstractText')
-        abstract = abstract_elem.text if abstract_elem is not None else 'No abstract available'
+        if article.get('abstract'):
+            title = article.get('title', DEFAULT_TITLE)
+            abstract = article['abstract']
+        else:
+            fetched = _fetch_abstract(pmid)
+            if fetched is None:
+                return None, 'Article not found'
+            title, abstract = fetched
         
         # Gemini AIで実践的なアドバイス生成
-        model = genai.GenerativeModel('gemini-2.5-flash')
+        model = gemini_client.generative_model('gemini-2.5-flash')
         prompt = f"""以下の論文から、トレーニーやダイエット実践者が使える具体的なアドバイスを抽出してください（200文字程度）：
 
 タイトル: {title}
@@ -337,15 +542,34 @@ Abstract: {abstract}
 例：「筋肥大には1日あたり体重1kgあたり1.6gのタンパク質摂取が効果的です」
 「10RM（10回で限界になる重量）でのトレーニングが筋肥大に最も効果的です」"""
         
-        response = model.generate_content(prompt)
+        response = upstream_service.call('gemini', model.generate_content, prompt)
         summary = response.text.strip()
         
-        return {
-            'pmid': pmid,
-            'title': title,
-            'summary': summary,
-            'url': f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
-        }, None
+        fields = {'abstract': abstract, 'summary_ja': summary}
+        if not article.get('title'):
+            fields['title'] = title
+        _write_articles({pmid: fields})
+        
+        return _format_research_summary(pmid, title, summary), None
         
     except Exception as e:
         return None, str(e)
+
+
+def _fetch_abstract(pmid):
+    """PubMed Fetch APIで論文タイトルとAbstractを取得（論文が存在しない場合はNone）"""
+    article = eutils_client.get_client().efetch_abstracts([pmid]).get(pmid)
+    if article is None:
+        return None
+    title = article.get('title') or DEFAULT_TITLE
+    abstract = article.get('abstract') or 'No abstract available'
+    return title, abstract
+
+
+def _format_research_summary(pmid, title, summary):
+    return {
+        'pmid': pmid,
+        'title': title,
+        'summary': summary,
+        'url': f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
+    }
@@ -1,11 +1,17 @@
 """トレーニング記録サービス"""
-from firebase_admin import firestore
+from app.services import advice_service, firestore_client
 from datetime import datetime
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
 
 
 def get_db():
-    """Firestoreクライアントを取得"""
-    return firestore.client()
+    """Firestoreクライアントを取得（プロセス内で共有）"""
+    return firestore_client.get_client()
 
 
 # トレーニング種目のプリセット
@@ -28,30 +34,146 @@ EXERCISE_PRESETS = [
 ]
 
 
-def get_exercise_presets():
-    """トレーニング種目プリセット一覧を取得（Firestore優先）"""
-    db = get_db()
-    
-    # Firestoreからカスタム種目を取得
-    custom_exercises = []
-    docs = db.collection('exercise_presets').stream()
-    for doc in docs:
+# 種目カタログ（デフォルト＋カスタム種目をマージしたスナップショット）
+# 版番号はcatalog_versions/exercise_presetsで管理し、種目の追加・削除と同じトランザクションで+1する。
+# ワーカーごとにスナップショットを保持し、CATALOG_CHECK_SECONDSごとに版番号だけを読んで変更を検知する。
+CATALOG_VERSION_COLLECTION = 'catalog_versions'
+EXERCISE_CATALOG_ID = 'exercise_presets'
+CATALOG_CHECK_SECONDS = float(os.environ.get('CATALOG_CHECK_SECONDS', 30))
+CATALOG_TOMBSTONE_LIMIT = 200  # 差分取得用に保持する削除履歴の件数
+
+_exercise_catalog = None
+_exercise_catalog_checked_at = 0.0
+_catalog_lock = threading.Lock()
+
+
+def _catalog_version_ref(db):
+    return db.collection(CATALOG_VERSION_COLLECTION).document(EXERCISE_CATALOG_ID)
+
+
+def _read_catalog_state(db, transaction=None):
+    """カタログの版番号と削除履歴を取得
+
+    Returns:
+        dict: {'version', 'deleted': [{'id', 'version'}], 'history_from': 差分を返せる最古の版}
+    """
+    snapshot = _catalog_version_ref(db).get(transaction=transaction)
+    state = snapshot.to_dict() if snapshot.exists else {}
+    return {
+        'version': state.get('version', 0),
+        'deleted': state.get('deleted', []),
+        'history_from': state.get('history_from', 0)
+    }
+
+
+def _build_exercise_catalog(db, state):
+    """カスタム種目を読み込んでデフォルトプリセットとマージ（カスタムを優先、idでユニーク化）"""
+    custom_exercises = {}
+    for doc in db.collection('exercise_presets').stream():
         data = doc.to_dict()
         data['id'] = doc.id
-        custom_exercises.append(data)
-    
-    # デフォルトプリセットとマージ（カスタムを優先）
-    all_exercises = custom_exercises + EXERCISE_PRESETS
-    
-    # 重複を除外（idでユニーク化）
-    seen_ids = set()
-    unique_exercises = []
-    for ex in all_exercises:
-        if ex['id'] not in seen_ids:
-            seen_ids.add(ex['id'])
-            unique_exercises.append(ex)
-    
-    return unique_exercises
+        custom_exercises[doc.id] = data
+
+    presets = list(custom_exercises.values())
+    presets.extend(ex for ex in EXERCISE_PRESETS if ex['id'] not in custom_exercises)
+    encoded = json.dumps(presets, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')
+    return {
+        **state,
+        'presets': presets,
+        'fingerprint': hashlib.sha256(encoded).hexdigest()[:32]
+    }
+
+
+def get_exercise_catalog(min_version=None):
+    """種目カタログのスナップショットを取得
+
+    前回の確認からCATALOG_CHECK_SECONDS以内はFirestoreを読まずに返す。
+    それ以降は版番号を確認し、変わっていた場合のみ作り直す。
+
+    Args:
+        min_version: この版より古いスナップショットは確認間隔に関わらず再確認する
+            （他のワーカーで新しい版を受け取ったクライアントからの差分要求）
+
+    Returns:
+        dict: {'version', 'presets', 'fingerprint', 'deleted', 'history_from'}（呼び出し側で変更しないこと）
+    """
+    global _exercise_catalog, _exercise_catalog_checked_at
+
+    with _catalog_lock:
+        catalog = _exercise_catalog
+        now = time.monotonic()
+        if (catalog is not None and now - _exercise_catalog_checked_at < CATALOG_CHECK_SECONDS
+                and (min_version is None or min_version <= catalog['version'])):
+            return catalog
+
+        db = get_db()
+        state = _read_catalog_state(db)
+        if catalog is None or state['version'] != catalog['version']:
+            catalog = _build_exercise_catalog(db, state)
+            _exercise_catalog = catalog
+        _exercise_catalog_checked_at = now
+        return catalog
+
+
+def invalidate_exercise_catalog():
+    """このプロセスの種目カタログを破棄（次回取得時に作り直す）"""
+    global _exercise_catalog
+
+    with _catalog_lock:
+        _exercise_catalog = None
+
+
+def get_exercise_presets():
+    """トレーニング種目プリセット一覧を取得（カスタム種目を優先してデフォルトとマージ）"""
+    return list(get_exercise_catalog()['presets'])
+
+
+def get_exercise_preset_changes(since_version):
+    """指定した版以降の種目カタログの変更を取得
+
+    削除履歴が残っていない古い版や、存在しない版を指定した場合は全件を返す（full=True）。
+
+    Returns:
+        dict: {'version', 'full', 'presets': 追加された種目（fullなら全件）, 'deleted': 削除された種目ID}
+    """
+    catalog = get_exercise_catalog(min_version=since_version)
+    if since_version > catalog['version'] or since_version < catalog['history_from']:
+        return {'version': catalog['version'], 'full': True, 'presets': list(catalog['presets']), 'deleted': []}
+
+    return {
+        'version': catalog['version'],
+        'full': False,
+        'presets': [ex for ex in catalog['presets'] if ex.get('version', 0) > since_version],
+        'deleted': [entry['id'] for entry in catalog['deleted'] if entry['version'] > since_version]
+    }
+
+
+@firestore_client.transactional
+def _add_exercise_in_transaction(transaction, db, doc_ref, data):
+    """カスタム種目の追加とカタログの版番号の更新をトランザクションで実行"""
+    version = _read_catalog_state(db, transaction)['version'] + 1
+    transaction.set(doc_ref, {**data, 'version': version})
+    transaction.set(_catalog_version_ref(db), {'version': version}, merge=True)
+
+
+@firestore_client.transactional
+def _delete_exercise_in_transaction(transaction, db, doc_ref):
+    """カスタム種目の削除とカタログの版番号・削除履歴の更新をトランザクションで実行"""
+    state = _read_catalog_state(db, transaction)
+    version = state['version'] + 1
+    deleted = state['deleted'] + [{'id': doc_ref.id, 'version': version}]
+    history_from = state['history_from']
+    if len(deleted) > CATALOG_TOMBSTONE_LIMIT:
+        # 履歴から外れた削除より前の版からは差分を返せない
+        history_from = deleted[-CATALOG_TOMBSTONE_LIMIT - 1]['version']
+        deleted = deleted[-CATALOG_TOMBSTONE_LIMIT:]
+
+    transaction.delete(doc_ref)
+    transaction.set(_catalog_version_ref(db), {
+        'version': version,
+        'deleted': deleted,
+        'history_from': history_from
+    }, merge=True)
 
 
 def add_exercise_preset(name, category='custom'):
@@ -71,12 +193,13 @@ def add_exercise_preset(name, category='custom'):
             return None, '同じ名前の種目がすでに存在します'
         
         doc_ref = db.collection('exercise_presets').document()
-        doc_ref.set({
+        _add_exercise_in_transaction(db.transaction(), db, doc_ref, {
             'name': name.strip(),
             'category': category.strip(),
             'unit': 'kg',
             'created_at': datetime.now().isoformat()
         })
+        invalidate_exercise_catalog()
         
         return doc_ref.id, None
     except Exception as e:
@@ -94,12 +217,24 @@ def delete_exercise_preset(exercise_id):
             return 'デフォルト種目は削除できません'
         
         # Firestoreから削除
-        db.collection('exercise_presets').document(exercise_id).delete()
+        doc_ref = db.collection('exercise_presets').document(exercise_id)
+        _delete_exercise_in_transaction(db.transaction(), db, doc_ref)
+        invalidate_exercise_catalog()
         return None
     except Exception as e:
         return str(e)
 
 
+def extract_exercise_ids(exercises):
+    """種目リストから重複なしのexercise_id一覧を抽出（array_containsクエリ用）"""
+    exercise_ids = []
+    for exercise in exercises or []:
+        exercise_id = exercise.get('exercise_id')
+        if exercise_id and exercise_id not in exercise_ids:
+            exercise_ids.append(exercise_id)
+    return exercise_ids
+
+
 def add_training_session(data):
     """トレーニングセッションを登録"""
     try:
@@ -111,34 +246,82 @@ def add_training_session(data):
         doc_ref = db.collection('training_sessions').document()
         session_id = doc_ref.id
         
-        doc_ref.set({
+        # セッションの登録とアドバイスキャッシュの無効化を1つのバッチで書き込む
+        batch = db.batch()
+        batch.set(doc_ref, {
             'customer_id': data['customer_id'],
             'date': data['date'],
             'exercises': data['exercises'],  # [{ exercise_id, sets: [{ reps, weight }] }]
+            'exercise_ids': extract_exercise_ids(data['exercises']),  # 種目別履歴検索用
             'notes': data.get('notes', ''),
             'duration_minutes': data.get('duration_minutes', 0),
             'created_at': datetime.now().isoformat()
         })
+        advice_service.touch(db, data['customer_id'], advice_service.TRAINING, writer=batch)
+        batch.commit()
         
         return session_id, None
     except Exception as e:
         return None, str(e)
 
 
-def get_training_sessions_by_customer(customer_id, limit=20):
-    """顧客のトレーニングセッション一覧を取得"""
+def _encode_cursor(session_id):
+    """セッションIDから不透明なページカーソルを生成"""
+    return base64.urlsafe_b64encode(session_id.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    """ページカーソルをセッションIDに戻す（不正な場合・ドキュメントIDとして使えない場合はNone）"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        session_id = base64.urlsafe_b64decode(padded.encode()).decode()
+    except Exception:
+        return None
+    return session_id if firestore_client.is_valid_document_id(session_id) else None
+
+
+def get_training_sessions_page(customer_id, limit=20, cursor=None):
+    """顧客のトレーニングセッションを1ページ分取得（新しい順）
+
+    複合インデックス（customer_id ASC + date DESC）を利用し、
+    ソートとlimitはFirestore側で実行する。
+
+    Returns:
+        tuple: (sessions, next_cursor)
+            - next_cursor: 次ページ用カーソル（最終ページの場合はNone）
+
+    Raises:
+        firestore_client.InvalidCursorError: カーソルを復元できない、
+            またはセッションが存在しない・別の顧客のセッション
+    """
     db = get_db()
-    query = db.collection('training_sessions').where('customer_id', '==', customer_id)
+    query = db.collection('training_sessions')\
+              .where('customer_id', '==', customer_id)\
+              .order_by('date', direction=firestore_client.DESCENDING)
+    
+    # カーソル（前ページ最後のドキュメント）以降から取得
+    if cursor:
+        session_id = _decode_cursor(cursor)
+        cursor_doc = db.collection('training_sessions').document(session_id).get() if session_id else None
+        # 先頭から返すと重複・無限ループになるため、不正なカーソルはエラーにする
+        if cursor_doc is None or not cursor_doc.exists or cursor_doc.to_dict().get('customer_id') != customer_id:
+            raise firestore_client.InvalidCursorError('Invalid cursor')
+        query = query.start_after(cursor_doc)
     
     sessions = []
-    for doc in query.stream():
+    for doc in query.limit(limit).stream():
         session = doc.to_dict()
         session['id'] = doc.id
         sessions.append(session)
     
-    # 日付でソート（新しい順）
-    sessions.sort(key=lambda x: x.get('date', ''), reverse=True)
-    return sessions[:limit]
+    next_cursor = _encode_cursor(sessions[-1]['id']) if sessions and len(sessions) == limit else None
+    return sessions, next_cursor
+
+
+def get_training_sessions_by_customer(customer_id, limit=20):
+    """顧客のトレーニングセッション一覧を取得（新しい順）"""
+    sessions, _ = get_training_sessions_page(customer_id, limit)
+    return sessions
 
 
 def get_training_session_by_id(session_id):
@@ -160,25 +343,54 @@ def get_training_session_by_id(session_id):
 def update_training_session(session_id, data):
     """トレーニングセッションを更新"""
     db = get_db()
+    
+    # exercisesが更新される場合は種目インデックスも再計算
+    if 'exercises' in data:
+        data['exercise_ids'] = extract_exercise_ids(data['exercises'])
+    
     doc_ref = db.collection('training_sessions').document(session_id)
-    doc_ref.update(data)
+    customer_id = _get_session_customer_id(doc_ref)
+    
+    batch = db.batch()
+    batch.update(doc_ref, data)
+    advice_service.touch(db, data.get('customer_id', customer_id), advice_service.TRAINING, writer=batch)
+    batch.commit()
 
 
 def delete_training_session(session_id):
     """トレーニングセッションを削除"""
     db = get_db()
-    db.collection('training_sessions').document(session_id).delete()
+    doc_ref = db.collection('training_sessions').document(session_id)
+    customer_id = _get_session_customer_id(doc_ref)
+    
+    batch = db.batch()
+    batch.delete(doc_ref)
+    advice_service.touch(db, customer_id, advice_service.TRAINING, writer=batch)
+    batch.commit()
+
+
+def _get_session_customer_id(doc_ref):
+    """セッションの顧客IDを取得（アドバイスキャッシュ無効化用、存在しなければNone）"""
+    doc = doc_ref.get()
+    return doc.to_dict().get('customer_id') if doc.exists else None
 
 
 def get_exercise_history(customer_id, exercise_id, limit=10):
-    """特定種目の履歴を取得（進捗確認用）"""
+    """特定種目の履歴を取得（進捗確認用）
+
+    exercise_ids配列へのarray_containsクエリで該当種目を含むセッションのみ取得する
+    （複合インデックス: customer_id ASC + exercise_ids CONTAINS + date DESC）。
+    """
     db = get_db()
-    query = db.collection('training_sessions').where('customer_id', '==', customer_id)
+    query = db.collection('training_sessions')\
+              .where('customer_id', '==', customer_id)\
+              .where('exercise_ids', 'array_contains', exercise_id)\
+              .order_by('date', direction=firestore_client.DESCENDING)\
+              .limit(limit)
     
     sessions = []
     for doc in query.stream():
         session = doc.to_dict()
-        session['id'] = doc.id
         
         # 該当種目のみ抽出
         for exercise in session.get('exercises', []):
@@ -186,13 +398,42 @@ def get_exercise_history(customer_id, exercise_id, limit=10):
                 sessions.append({
                     'date': session.get('date'),
                     'exercise': exercise,
-                    'session_id': session['id']
+                    'session_id': doc.id
                 })
                 break
     
-    # 日付でソート
-    sessions.sort(key=lambda x: x.get('date', ''), reverse=True)
-    return sessions[:limit]
+    return sessions
+
+
+def backfill_exercise_ids(batch_size=500):
+    """exercise_idsを持たない既存セッションに種目インデックスを付与（移行用）
+
+    Returns:
+        int: 更新したセッション数
+    """
+    db = get_db()
+    batch = db.batch()
+    pending = 0
+    updated = 0
+    
+    for doc in db.collection('training_sessions').stream():
+        session = doc.to_dict()
+        if 'exercise_ids' in session:
+            continue
+        
+        batch.update(doc.reference, {'exercise_ids': extract_exercise_ids(session.get('exercises'))})
+        pending += 1
+        updated += 1
+        
+        if pending >= batch_size:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    
+    if pending:
+        batch.commit()
+    
+    return updated
 
 
 def calculate_1rm(weight, reps):
@@ -0,0 +1,190 @@
+"""外部API呼び出しレイヤー（Gemini / PubMed / 翻訳）
+
+外部APIごとに専用のスレッドプールを持ち、同時実行数の上限とタイムアウトを適用する。
+- 遅い外部APIがあっても、そのAPI用のスレッドだけが埋まり、他のAPIやFirestore処理は影響を受けない
+- 呼び出し元はタイムアウトで必ず解放される（応答待ちでFlaskワーカーを占有し続けない）
+- submitで複数の呼び出しを並行に実行し、まとめて結果を待てる
+- streamはストリーミング応答の受信完了まで同時実行数の枠を占有し、断片ごと・全体のタイムアウトを適用する
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+class UpstreamTimeout(Exception):
+    """外部API呼び出しのタイムアウト"""
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+# 外部APIごとの設定（環境変数 UPSTREAM_<NAME>_CONCURRENCY / UPSTREAM_<NAME>_TIMEOUT /
+# UPSTREAM_<NAME>_STREAM_TIMEOUT で調整可能）
+# - timeout: 応答（ストリーミングでは次の断片）を待つ最大秒数
+# - stream_timeout: ストリーミング応答全体の最大秒数（省略時はtimeoutと同じ）
+UPSTREAM_DEFAULTS = {
+    'gemini': {'concurrency': 4, 'timeout': 60, 'stream_timeout': 120},
+    'pubmed': {'concurrency': 3, 'timeout': 15},
+    'translate': {'concurrency': 5, 'timeout': 10},
+}
+
+# ストリーミングの受け渡し用（キューに入れる要素の種類）
+_STARTED, _CHUNK, _DONE, _ERROR = 'started', 'chunk', 'done', 'error'
+
+
+class Upstream:
+    """1つの外部APIに対する呼び出し口（同時実行数の上限 + タイムアウト）"""
+
+    def __init__(self, name, concurrency, timeout, stream_timeout=None):
+        self.name = name
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.stream_timeout = stream_timeout or timeout
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._stats = {'calls': 0, 'in_flight': 0, 'errors': 0, 'timeouts': 0}
+
+    def _get_executor(self):
+        """スレッドプールを取得（fork後のプロセスでは作り直す）"""
+        pid = os.getpid()
+        with self._lock:
+            if self._executor is None or self._executor_pid != pid:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.concurrency, thread_name_prefix=f'upstream-{self.name}'
+                )
+                self._executor_pid = pid
+            return self._executor
+
+    def _run(self, fn, args, kwargs):
+        with self._lock:
+            self._stats['in_flight'] += 1
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._stats['in_flight'] -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        """非同期に実行（Futureを返す、結果はresultで取得）"""
+        with self._lock:
+            self._stats['calls'] += 1
+        return self._get_executor().submit(self._run, fn, args, kwargs)
+
+    def result(self, future, timeout=None):
+        """Futureの結果を待つ（タイムアウト時はUpstreamTimeout）"""
+        try:
+            return future.result(timeout=timeout if timeout is not None else self.timeout)
+        except FutureTimeoutError:
+            # 実行中の呼び出しは中断できないため、結果を待たずに呼び出し元を解放する
+            future.cancel()
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise UpstreamTimeout(f'{self.name} request timed out')
+
+    def call(self, fn, *args, **kwargs):
+        """実行して結果を待つ（同期呼び出し）"""
+        return self.result(self.submit(fn, *args, **kwargs))
+
+    def stream(self, fn, *args, **kwargs):
+        """ストリーミング応答を返す呼び出し（呼び出しから最後の断片の受信までを1つの枠で実行）
+
+        fnの呼び出しと断片の受信はプール内のスレッドで行い、断片はキュー経由で呼び出し元に渡す。
+        fnが返るまで待ってからイテレータを返すため、開始時のエラーはここで例外になる。
+        次の断片をtimeout秒、全体をstream_timeout秒待っても受信できない場合はUpstreamTimeout。
+        タイムアウトや呼び出し元が途中で読むのをやめた場合は、次の断片の受信時に打ち切って枠を解放する。
+
+        Returns:
+            generator: 応答の断片
+        """
+        chunks = queue.Queue()
+        cancelled = threading.Event()
+        deadline = time.monotonic() + self.stream_timeout
+
+        def produce():
+            try:
+                response = fn(*args, **kwargs)
+                chunks.put((_STARTED, None))
+                for chunk in response:
+                    if cancelled.is_set():
+                        return
+                    chunks.put((_CHUNK, chunk))
+                chunks.put((_DONE, None))
+            except Exception as e:
+                chunks.put((_ERROR, e))
+                raise
+
+        def receive():
+            wait = min(self.timeout, deadline - time.monotonic())
+            try:
+                kind, value = chunks.get(timeout=max(wait, 0))
+            except queue.Empty:
+                cancelled.set()
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise UpstreamTimeout(f'{self.name} request timed out')
+            if kind == _ERROR:
+                raise value
+            return kind, value
+
+        def iterate():
+            try:
+                while True:
+                    kind, value = receive()
+                    if kind == _DONE:
+                        return
+                    yield value
+            finally:
+                cancelled.set()
+
+        self.submit(produce)
+        receive()  # 開始（fnが返る）まで待つ
+        return iterate()
+
+    def stats(self):
+        """統計を取得"""
+        with self._lock:
+            return {
+                'concurrency': self.concurrency, 'timeout': self.timeout,
+                'stream_timeout': self.stream_timeout, **self._stats
+            }
+
+
+_upstreams = {
+    name: Upstream(
+        name,
+        concurrency=_env_int(f'UPSTREAM_{name.upper()}_CONCURRENCY', config['concurrency']),
+        timeout=_env_int(f'UPSTREAM_{name.upper()}_TIMEOUT', config['timeout']),
+        stream_timeout=_env_int(
+            f'UPSTREAM_{name.upper()}_STREAM_TIMEOUT', config.get('stream_timeout', config['timeout'])
+        )
+    )
+    for name, config in UPSTREAM_DEFAULTS.items()
+}
+
+
+def get(name):
+    """外部APIの呼び出し口を取得"""
+    return _upstreams[name]
+
+
+def call(name, fn, *args, **kwargs):
+    """外部APIを呼び出して結果を待つ（同時実行数の上限・タイムアウトを適用）"""
+    return _upstreams[name].call(fn, *args, **kwargs)
+
+
+def stream(name, fn, *args, **kwargs):
+    """外部APIのストリーミング応答を受信（受信完了まで同時実行数の枠を占有、断片ごと・全体のタイムアウトを適用）"""
+    return _upstreams[name].stream(fn, *args, **kwargs)
+
+
+def get_all_stats():
+    """全外部APIの統計を取得"""
+    return {name: upstream.stats() for name, upstream in _upstreams.items()}
@@ -1,11 +1,16 @@
 """ユーザー管理サービス"""
-from firebase_admin import firestore
+from app.services import firestore_client
 import hashlib
+import threading
 from datetime import datetime
 
+# デフォルトユーザーの初期化済みフラグ（プロセスごと）
+_default_users_ready = False
+_default_users_lock = threading.Lock()
+
 def _get_db():
-    """Firestoreクライアントを取得"""
-    return firestore.client()
+    """Firestoreクライアントを取得（プロセス内で共有）"""
+    return firestore_client.get_client()
 
 def hash_password(password: str) -> str:
     """パスワードをSHA-256でハッシュ化"""
@@ -140,7 +145,11 @@ def delete_user(user_id: str):
         return str(e)
 
 def initialize_default_users():
-    """デフォルトユーザーを初期化（初回セットアップ用）"""
+    """デフォルトユーザーを初期化（初回セットアップ用）
+
+    Returns:
+        bool: 成功したか
+    """
     try:
         db = _get_db()
         # 開発者アカウント（admin）
@@ -154,5 +163,17 @@ def initialize_default_users():
         if not any(user_exists):
             create_user('user', 'user123', role=0, email='user@michela.local')
             print("✅ Default user created: user/user123")
+        return True
     except Exception as e:
         print(f"Error initializing users: {e}")
+        return False
+
+def ensure_default_users():
+    """デフォルトユーザーを初期化（プロセスごとに初回のみ、失敗時は次回再試行）"""
+    global _default_users_ready
+
+    if _default_users_ready:
+        return
+    with _default_users_lock:
+        if not _default_users_ready:
+            _default_users_ready = initialize_default_users()
@@ -1,47 +1,259 @@
 """体重履歴管理サービス"""
-from firebase_admin import firestore
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from app.services import firestore_client
+
+# 顧客ごとの最新体重サマリー（weight_summaries/{customer_id}）
+SUMMARY_COLLECTION = 'weight_summaries'
+SUMMARY_SIZE = 10  # サマリーに保持する最新記録数（get_latest_weightsのlimit上限）
+GET_ALL_CHUNK_SIZE = 100  # サマリーの一括取得1回あたりのドキュメント数
+SUMMARY_BUILD_MAX_WORKERS = int(os.environ.get('SUMMARY_BUILD_MAX_WORKERS', 8))
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+
 
 def get_db():
-    """Firestoreクライアントを取得"""
-    return firestore.client()
+    """Firestoreクライアントを取得（プロセス内で共有）"""
+    return firestore_client.get_client()
+
+
+def _get_executor():
+    """サマリー作成用のスレッドプールを取得（fork後のプロセスでは作り直す）"""
+    global _executor, _executor_pid
+
+    pid = os.getpid()
+    with _lock:
+        if _executor is None or _executor_pid != pid:
+            _executor = ThreadPoolExecutor(max_workers=SUMMARY_BUILD_MAX_WORKERS,
+                                           thread_name_prefix='weight-summary')
+            _executor_pid = pid
+        return _executor
+
+
+def get_weight_history(customer_id, limit=10, start_after=None):
+    """顧客IDに基づく体重履歴を取得（新しい順）
 
+    複合インデックス（customer_id ASC + recorded_at DESC）を利用し、
+    ソートとlimitはFirestore側で実行する。
+    start_afterに前ページ最後の記録IDを渡すと、その続きから取得する。
 
-def get_weight_history(customer_id, limit=10):
-    """顧客IDに基づく体重履歴を取得"""
+    Raises:
+        firestore_client.InvalidCursorError: start_afterがIDとして不正、記録が存在しない、または別の顧客の記録
+    """
     db = get_db()
     weight_history = []
     
-    # whereのみでクエリ（インデックス不要）
     query = db.collection('weight_history')\
-              .where('customer_id', '==', customer_id)
+              .where('customer_id', '==', customer_id)\
+              .order_by('recorded_at', direction=firestore_client.DESCENDING)
     
-    for doc in query.stream():
+    # カーソル（前ページ最後のドキュメント）以降から取得
+    if start_after:
+        # 先頭から返すと重複・無限ループになるため、不正なカーソルはエラーにする
+        if not firestore_client.is_valid_document_id(start_after):
+            raise firestore_client.InvalidCursorError('Invalid cursor')
+        cursor_doc = db.collection('weight_history').document(start_after).get()
+        if not cursor_doc.exists or cursor_doc.to_dict().get('customer_id') != customer_id:
+            raise firestore_client.InvalidCursorError('Invalid cursor')
+        query = query.start_after(cursor_doc)
+    
+    for doc in query.limit(limit).stream():
         history = doc.to_dict()
         history['id'] = doc.id
         weight_history.append(history)
     
-    # Pythonでソート（新しい順）
-    weight_history.sort(key=lambda x: x.get('recorded_at', ''), reverse=True)
-    
-    # limit適用
-    return weight_history[:limit]
+    return weight_history
 
 
-def add_weight_record(customer_id, weight, recorded_at=None, note=''):
-    """体重記録を追加"""
-    db = get_db()
-    weight_history_ref = db.collection('weight_history').document()
-    weight_history_ref.set({
+def _summary_ref(db, customer_id):
+    return db.collection(SUMMARY_COLLECTION).document(customer_id)
+
+
+def _summary_entry(record_id, record):
+    return {'id': record_id, 'weight': record['weight'], 'recorded_at': record['recorded_at']}
+
+
+def _merge_into_summary(summary, customer_id, record_id, record):
+    """サマリーに体重記録を反映（最新SUMMARY_SIZE件を記録日時の新しい順に保持、最古の記録はfirstに保持）"""
+    entry = _summary_entry(record_id, record)
+    latest = [r for r in summary.get('latest', []) if r['id'] != record_id] + [entry]
+    latest.sort(key=lambda r: r['recorded_at'], reverse=True)
+
+    first = summary.get('first')
+    if first is None or entry['recorded_at'] < first['recorded_at']:
+        first = entry
+
+    return {
+        'customer_id': customer_id,
+        'first': first,
+        'latest': latest[:SUMMARY_SIZE],
+        'updated_at': datetime.now().isoformat()
+    }
+
+
+def _build_summary_from_history(db, customer_id, transaction=None):
+    """体重履歴からサマリーを作成（サマリー未作成の顧客用）"""
+    query = db.collection('weight_history').where('customer_id', '==', customer_id)
+    latest_docs = query.order_by('recorded_at', direction=firestore_client.DESCENDING)\
+                       .limit(SUMMARY_SIZE).stream(transaction=transaction)
+    first_docs = query.order_by('recorded_at', direction=firestore_client.ASCENDING)\
+                      .limit(1).stream(transaction=transaction)
+
+    latest = [_summary_entry(doc.id, doc.to_dict()) for doc in latest_docs]
+    first = [_summary_entry(doc.id, doc.to_dict()) for doc in first_docs]
+    return {
+        'customer_id': customer_id,
+        'first': first[0] if first else None,
+        'latest': latest
+    }
+
+
+@firestore_client.transactional
+def _create_summary_in_transaction(transaction, db, customer_id):
+    """サマリー未作成の顧客のサマリーを体重履歴から作成して保存（作成済みなら既存のものを返す）
+
+    体重記録がない、または存在しない顧客のサマリーは保存しない
+    （任意の顧客IDでの参照によって不要なドキュメントが作られないようにする）。
+    """
+    summary_ref = _summary_ref(db, customer_id)
+    snapshot = summary_ref.get(transaction=transaction)
+    if snapshot.exists:
+        return snapshot.to_dict()
+
+    summary = _build_summary_from_history(db, customer_id, transaction)
+    if summary['first'] is None:
+        return summary
+    if not db.collection('customer').document(customer_id).get(transaction=transaction).exists:
+        return summary
+
+    summary['updated_at'] = datetime.now().isoformat()
+    transaction.set(summary_ref, summary)
+    return summary
+
+
+def _create_summary(db, customer_id):
+    return _create_summary_in_transaction(db.transaction(), db, customer_id)
+
+
+@firestore_client.transactional
+def _record_weight_in_transaction(transaction, db, record_ref, record, update_customer):
+    """体重記録の追加とサマリーの更新をトランザクションで実行"""
+    customer_id = record['customer_id']
+    summary_ref = _summary_ref(db, customer_id)
+    snapshot = summary_ref.get(transaction=transaction)
+    if snapshot.exists:
+        summary = snapshot.to_dict()
+    else:
+        summary = _build_summary_from_history(db, customer_id, transaction)
+
+    transaction.set(record_ref, record)
+    transaction.set(summary_ref, _merge_into_summary(summary, customer_id, record_ref.id, record))
+    if update_customer:
+        transaction.update(db.collection('customer').document(customer_id), {'weight': record['weight']})
+
+
+def record_weight(db, customer_id, weight, recorded_at=None, note='', update_customer=True):
+    """体重履歴に記録（最新体重サマリーも更新）
+
+    Args:
+        update_customer: 顧客の現在の体重も更新するか
+
+    Returns:
+        str: 体重記録ID
+    """
+    record_ref = db.collection('weight_history').document()
+    record = {
         'customer_id': customer_id,
         'weight': float(weight),
         'recorded_at': recorded_at or datetime.now().isoformat(),
         'note': note
-    })
-    
-    # 顧客の現在の体重も更新
-    customer_ref = db.collection('customer').document(customer_id)
-    customer_ref.update({'weight': float(weight)})
-    
-    return weight_history_ref.id
+    }
+    _record_weight_in_transaction(db.transaction(), db, record_ref, record, update_customer)
+    return record_ref.id
+
+
+def add_weight_record(customer_id, weight, recorded_at=None, note=''):
+    """体重記録を追加（顧客の現在の体重も更新）"""
+    return record_weight(get_db(), customer_id, weight, recorded_at, note)
+
+
+def get_latest_weights(customer_ids, limit=1):
+    """複数顧客の最新体重と最初の体重をまとめて取得
+
+    weight_summariesをget_allでまとめて読むため、顧客数に関わらずリクエストは数回で済む。
+    サマリー未作成の顧客（rebuild_weight_summaries実行前のデータ）は体重履歴から並行して作成・保存し、
+    次回以降はサマリーから読む。
+
+    Args:
+        limit: 顧客ごとの最新記録数（最大SUMMARY_SIZE）
+
+    Returns:
+        dict: {customer_id: {'first': 最初の記録 or None, 'latest': 新しい順の記録リスト}}
+    """
+    db = get_db()
+    limit = max(0, min(limit, SUMMARY_SIZE))
+    customer_ids = list(dict.fromkeys(customer_ids))
+
+    summaries = {}
+    for i in range(0, len(customer_ids), GET_ALL_CHUNK_SIZE):
+        refs = [_summary_ref(db, cid) for cid in customer_ids[i:i + GET_ALL_CHUNK_SIZE]]
+        summaries.update({doc.id: doc.to_dict() for doc in db.get_all(refs) if doc.exists})
+
+    missing = [cid for cid in customer_ids if cid not in summaries]
+    if len(missing) == 1:
+        summaries[missing[0]] = _create_summary(db, missing[0])
+    elif missing:
+        executor = _get_executor()
+        futures = {cid: executor.submit(_create_summary, db, cid) for cid in missing}
+        summaries.update({cid: future.result() for cid, future in futures.items()})
+
+    result = {}
+    for customer_id in customer_ids:
+        summary = summaries[customer_id]
+        result[customer_id] = {
+            'first': summary.get('first'),
+            'latest': summary.get('latest', [])[:limit]
+        }
+    return result
+
+
+def rebuild_weight_summaries(customer_id=None, batch_size=500):
+    """体重履歴から最新体重サマリーを再構築（初回移行・復元後の整合用）
+
+    Returns:
+        int: 書き込んだサマリー数
+    """
+    db = get_db()
+    query = db.collection('weight_history')
+    if customer_id:
+        query = query.where('customer_id', '==', customer_id)
+
+    summaries = {}
+    for doc in query.stream():
+        record = doc.to_dict()
+        summary_customer_id = record.get('customer_id')
+        if not summary_customer_id or 'recorded_at' not in record:
+            continue
+        summaries[summary_customer_id] = _merge_into_summary(
+            summaries.get(summary_customer_id, {}), summary_customer_id, doc.id, record
+        )
+
+    batch = db.batch()
+    pending = 0
+    for summary_customer_id, summary in summaries.items():
+        batch.set(_summary_ref(db, summary_customer_id), summary)
+        pending += 1
+        if pending >= batch_size:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+
+    return len(summaries)
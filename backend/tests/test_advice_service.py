@@ -0,0 +1,58 @@
+"""Tests for advice_service.py"""
+import pytest
+from unittest.mock import Mock, MagicMock, patch
+from app.services import advice_service
+
+
+class TestAdviceService:
+    """Test fingerprint-based advice caching"""
+
+    def setup_method(self):
+        advice_service._cache.clear()
+
+    def test_touch_with_writer(self):
+        """Test that touch writes the update time through the given batch"""
+        mock_db = MagicMock()
+        mock_batch = MagicMock()
+
+        advice_service.touch(mock_db, 'customer_123', advice_service.MEAL, writer=mock_batch)
+
+        mock_db.collection.assert_called_with('advice_fingerprints')
+        mock_db.collection.return_value.document.assert_called_with('customer_123')
+        args, kwargs = mock_batch.set.call_args
+        assert 'meal_updated_at' in args[1]
+        assert kwargs == {'merge': True}
+
+    def test_touch_without_customer_id(self):
+        """Test that touch does nothing when the customer is unknown"""
+        mock_db = MagicMock()
+
+        advice_service.touch(mock_db, None, advice_service.TRAINING)
+
+        mock_db.collection.assert_not_called()
+
+    @patch('app.services.advice_service.get_db')
+    def test_get_fingerprint(self, mock_get_db):
+        """Test reading the last update time for each advice kind"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_doc = MagicMock()
+        mock_doc.exists = True
+        mock_doc.to_dict.return_value = {'training_updated_at': '2026-01-04T10:00:00'}
+        mock_db.collection.return_value.document.return_value.get.return_value = mock_doc
+
+        assert advice_service.get_fingerprint('customer_123', advice_service.TRAINING) == '2026-01-04T10:00:00'
+        assert advice_service.get_fingerprint('customer_123', advice_service.MEAL) is None
+
+    def test_cache_invalidated_by_new_fingerprint(self):
+        """Test that advice is only reused while the fingerprint is unchanged"""
+        advice_service.save_advice('customer_123', advice_service.TRAINING, 't1', '順調です')
+
+        advice, cached_until = advice_service.get_cached_advice('customer_123', advice_service.TRAINING, 't1')
+        assert advice == '順調です'
+        assert cached_until is not None
+
+        # データ更新後（新しいフィンガープリント）はキャッシュを使わない
+        assert advice_service.get_cached_advice('customer_123', advice_service.TRAINING, 't2') == (None, None)
+        # 種類が違えば別キャッシュ
+        assert advice_service.get_cached_advice('customer_123', advice_service.MEAL, 't1') == (None, None)
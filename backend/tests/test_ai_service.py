@@ -38,17 +38,15 @@ class TestAIService:
         ai_service._cache.clear()
         cache_key = "test_key"
         
-        ai_service._cache[cache_key] = {
-            'response': 'old_response',
-            'expires_at': datetime.now() - timedelta(minutes=1)
-        }
+        ai_service._cache.set(cache_key, 'old_response', ttl_seconds=-60)
         
         retrieved, expires_at = ai_service._get_from_cache(cache_key)
         assert retrieved is None
         assert expires_at is None
+        assert len(ai_service._cache) == 0  # 期限切れのエントリは削除される
 
     @patch('app.services.ai_service.GEMINI_API_KEY', 'test_key_12345')
-    @patch('app.services.ai_service.genai.GenerativeModel')
+    @patch('app.services.ai_service.gemini_client.generative_model')
     def test_chat_with_ai_success(self, mock_model_class):
         """Test successful AI chat"""
         ai_service._cache.clear()
@@ -74,7 +72,7 @@ class TestAIService:
         assert cached_until is None
 
     @patch('app.services.ai_service.GEMINI_API_KEY', 'test_key_12345')
-    @patch('app.services.ai_service.genai.GenerativeModel')
+    @patch('app.services.ai_service.gemini_client.generative_model')
     def test_chat_with_ai_error_handling(self, mock_model_class):
         """Test AI chat with exception"""
         mock_model = MagicMock()
@@ -88,7 +86,7 @@ class TestAIService:
         assert cached_until is None
 
     @patch('app.services.ai_service.GEMINI_API_KEY', 'test_key_12345')
-    @patch('app.services.ai_service.genai.GenerativeModel')
+    @patch('app.services.ai_service.gemini_client.generative_model')
     def test_chat_with_ai_with_cache_hit(self, mock_model_class):
         """Test AI chat with cache hit"""
         ai_service._cache.clear()
@@ -110,3 +108,81 @@ class TestAIService:
         assert cached2 is not None
         assert error2 is None
 
+
+    @patch('app.services.ai_service.GEMINI_API_KEY', 'test_key_12345')
+    @patch('app.services.ai_service.gemini_client.generative_model')
+    def test_chat_with_ai_coalesces_concurrent_requests(self, mock_model_class):
+        """Test that identical concurrent prompts trigger one API call"""
+        import threading
+        import time
+        ai_service._cache.clear()
+        release = threading.Event()
+        
+        def slow_generate(prompt):
+            release.wait(timeout=5)
+            response = MagicMock()
+            response.text = 'Shared response'
+            return response
+        mock_model_class.return_value.generate_content.side_effect = slow_generate
+        
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(ai_service.chat_with_ai("Same prompt")))
+            for _ in range(3)
+        ]
+        coalesced_before = ai_service._inflight.stats()['coalesced']
+        for t in threads:
+            t.start()
+        
+        deadline = time.time() + 5
+        while ai_service._inflight.stats()['coalesced'] - coalesced_before < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join(timeout=5)
+        
+        assert mock_model_class.return_value.generate_content.call_count == 1
+        assert [r[0] for r in results] == ['Shared response'] * 3
+        assert all(r[1] is None for r in results)
+
+    @patch('app.services.ai_service.GEMINI_API_KEY', 'test_key_12345')
+    @patch('app.services.ai_service.gemini_client.generative_model')
+    def test_stream_chat_with_ai(self, mock_model_class):
+        """Test streaming chunks in order and caching the full text on completion"""
+        ai_service._cache.clear()
+        chunks = []
+        for text in ['筋トレは', '週3回が', '目安です']:
+            chunk = MagicMock()
+            chunk.text = text
+            chunks.append(chunk)
+        mock_model_class.return_value.generate_content.return_value = iter(chunks)
+        completed = []
+
+        stream, error, cached_until = ai_service.stream_chat_with_ai("Stream prompt", on_complete=completed.append)
+
+        assert error is None
+        assert cached_until is None
+        assert mock_model_class.return_value.generate_content.call_args[1] == {'stream': True}
+        # 全文を受信するまではキャッシュに保存しない
+        assert next(stream) == '筋トレは'
+        assert ai_service._get_from_cache(ai_service._get_cache_key("Stream prompt")) == (None, None)
+
+        assert list(stream) == ['週3回が', '目安です']
+        assert completed == ['筋トレは週3回が目安です']
+
+        # 2回目はキャッシュから全文を1断片で返す
+        stream2, _, cached_until2 = ai_service.stream_chat_with_ai("Stream prompt")
+        assert list(stream2) == ['筋トレは週3回が目安です']
+        assert cached_until2 is not None
+        assert mock_model_class.return_value.generate_content.call_count == 1
+
+    @patch('app.services.ai_service.GEMINI_API_KEY', 'test_key_12345')
+    @patch('app.services.ai_service.gemini_client.generative_model')
+    def test_stream_chat_with_ai_error_handling(self, mock_model_class):
+        """Test streaming when the API request fails"""
+        mock_model_class.return_value.generate_content.side_effect = Exception('API Error')
+
+        stream, error, cached_until = ai_service.stream_chat_with_ai("Error prompt", use_cache=False)
+
+        assert stream is None
+        assert error == 'API Error'
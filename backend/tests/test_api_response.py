@@ -0,0 +1,161 @@
+"""Tests for response compression and ETag handling in logic/api.py"""
+import gzip
+import json
+import pytest
+from unittest.mock import Mock, MagicMock, patch
+from app.logic import api
+
+LARGE_PAYLOAD = [{'id': f'customer_{i}', 'name': 'テスト太郎', 'favorite_food': '鶏むね肉'} for i in range(100)]
+
+
+@pytest.fixture
+def client():
+    return api.app.test_client()
+
+
+class TestCompressAndTag:
+    """Test gzip compression and conditional GET"""
+
+    @patch('app.services.customer_service.get_all_customers')
+    def test_large_response_is_gzipped(self, mock_get_all, client):
+        """Test that large JSON responses are compressed with a distinct strong ETag"""
+        mock_get_all.return_value = LARGE_PAYLOAD
+
+        response = client.get('/get_customers', headers={'Accept-Encoding': 'gzip'})
+
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['ETag'].endswith('-gzip"')
+        assert not response.headers['ETag'].startswith('W/')
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert json.loads(gzip.decompress(response.data)) == LARGE_PAYLOAD
+
+    @patch('app.services.customer_service.get_all_customers')
+    def test_small_or_unaccepted_response_not_compressed(self, mock_get_all, client):
+        """Test that small responses and clients without gzip get the plain body"""
+        mock_get_all.return_value = [{'id': 'customer_1'}]
+        small = client.get('/get_customers', headers={'Accept-Encoding': 'gzip'})
+
+        mock_get_all.return_value = LARGE_PAYLOAD
+        plain = client.get('/get_customers')
+
+        assert 'Content-Encoding' not in small.headers
+        assert 'Content-Encoding' not in plain.headers
+        assert json.loads(plain.data) == LARGE_PAYLOAD
+
+    @patch('app.services.customer_service.get_all_customers')
+    def test_gzip_refused_with_zero_quality(self, mock_get_all, client):
+        """Test that "gzip;q=0" is treated as refusing gzip"""
+        mock_get_all.return_value = LARGE_PAYLOAD
+
+        response = client.get('/get_customers', headers={'Accept-Encoding': 'gzip;q=0, identity'})
+
+        assert 'Content-Encoding' not in response.headers
+        assert not response.headers['ETag'].endswith('-gzip"')
+        assert json.loads(response.data) == LARGE_PAYLOAD
+
+    @patch('app.services.customer_service.get_all_customers')
+    def test_if_none_match_returns_304(self, mock_get_all, client):
+        """Test that an unchanged resource is answered with 304 and no body"""
+        mock_get_all.return_value = LARGE_PAYLOAD
+        etag = client.get('/get_customers', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+
+        not_modified = client.get('/get_customers', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+
+        assert not_modified.status_code == 304
+        assert not_modified.data == b''
+        assert not_modified.headers['ETag'] == etag
+
+        # 内容が変わればETagも変わり200を返す
+        mock_get_all.return_value = LARGE_PAYLOAD[:-1]
+        changed = client.get('/get_customers', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert changed.headers['ETag'] != etag
+
+    @patch('app.services.backup_service.stream_backup')
+    def test_streamed_backup_is_gzipped(self, mock_stream_backup, client):
+        """Test that the streamed backup is compressed chunk by chunk"""
+        mock_stream_backup.return_value = iter(['{"collections": ', '{"customers": []}', '}'])
+
+        response = client.get('/backup_all', headers={'Accept-Encoding': 'gzip'})
+
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'ETag' not in response.headers
+        assert json.loads(gzip.decompress(response.data)) == {'collections': {'customers': []}}
+
+
+class TestCatalogResponse:
+    """Test preset catalogs served with precomputed ETags"""
+
+    def test_food_presets_304_without_serializing(self, client):
+        """Test that a matching If-None-Match skips building the body"""
+        response = client.get('/get_food_presets', headers={'Accept-Encoding': 'gzip'})
+        etag = response.headers['ETag']
+
+        assert response.status_code == 200
+        assert etag.startswith('"' + api.meal_service.FOOD_PRESETS_FINGERPRINT)
+        assert json.loads(gzip.decompress(response.data)) == api.meal_service.FOOD_PRESETS
+
+        with patch('app.services.meal_service.get_food_presets') as mock_get_food_presets:
+            not_modified = client.get('/get_food_presets', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+
+        assert not_modified.status_code == 304
+        assert not_modified.data == b''
+        assert not_modified.headers['ETag'] == etag
+        mock_get_food_presets.assert_not_called()
+
+    def test_gzip_etag_does_not_match_plain_variant(self, client):
+        """Test that a client without gzip is not answered 304 for the gzip variant's ETag"""
+        gzip_etag = client.get('/get_food_presets', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+        assert gzip_etag.endswith('-gzip"')
+
+        for accept_encoding in ('identity', 'gzip;q=0'):
+            response = client.get('/get_food_presets', headers={
+                'Accept-Encoding': accept_encoding, 'If-None-Match': gzip_etag
+            })
+
+            assert response.status_code == 200
+            assert 'Content-Encoding' not in response.headers
+            assert response.headers['ETag'] == f'"{api.meal_service.FOOD_PRESETS_FINGERPRINT}"'
+            assert json.loads(response.data) == api.meal_service.FOOD_PRESETS
+
+    @patch('app.services.training_service.get_exercise_catalog')
+    def test_exercise_presets_version_header(self, mock_get_catalog, client):
+        """Test that the full catalog carries its version and fingerprint ETag"""
+        mock_get_catalog.return_value = {
+            'version': 12, 'fingerprint': 'abc123', 'presets': [{'id': 'squat'}], 'deleted': [], 'history_from': 0
+        }
+
+        response = client.get('/get_exercise_presets')
+
+        assert response.headers['X-Catalog-Version'] == '12'
+        assert response.headers['ETag'] == '"abc123"'
+        assert response.get_json() == [{'id': 'squat'}]
+        assert client.get('/get_exercise_presets', headers={'If-None-Match': '"abc123"'}).status_code == 304
+
+    @patch('app.services.training_service.get_exercise_preset_changes')
+    def test_exercise_presets_since(self, mock_get_changes, client):
+        """Test that ?since returns only the changes"""
+        mock_get_changes.return_value = {'version': 12, 'full': False, 'presets': [], 'deleted': ['custom_1']}
+
+        response = client.get('/get_exercise_presets?since=11')
+
+        mock_get_changes.assert_called_once_with(11)
+        assert response.get_json()['deleted'] == ['custom_1']
+
+
+class TestLatestWeightsValidation:
+    """Test request validation for the batch latest weights endpoint"""
+
+    @pytest.mark.parametrize('body', [
+        {'customer_ids': ['customer_1', 'a/b']},
+        {'customer_ids': ['customer_1', 123]},
+        {'customer_ids': ['customer_1'], 'limit': 'abc'},
+    ])
+    @patch('app.services.weight_service.get_latest_weights')
+    def test_invalid_request_returns_400(self, mock_get_latest_weights, client, body):
+        """Test that invalid customer IDs or limit are rejected before reading Firestore"""
+        response = client.post('/get_latest_weights', json=body)
+
+        assert response.status_code == 400
+        mock_get_latest_weights.assert_not_called()
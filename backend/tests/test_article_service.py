@@ -0,0 +1,49 @@
+"""Tests for article_service.py"""
+import pytest
+from unittest.mock import Mock, MagicMock, patch
+from app.services import article_service
+
+
+class TestArticleService:
+    """Test PMID-keyed article store"""
+
+    @patch('app.services.article_service.get_db')
+    def test_get_articles(self, mock_get_db):
+        """Test batch reading stored articles"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        stored = MagicMock()
+        stored.id = '12345'
+        stored.exists = True
+        stored.to_dict.return_value = {'title': 'Title', 'title_ja': 'タイトル'}
+        missing = MagicMock()
+        missing.exists = False
+        mock_db.get_all.return_value = [stored, missing]
+
+        articles = article_service.get_articles(['12345', '67890'])
+
+        assert articles == {'12345': {'title': 'Title', 'title_ja': 'タイトル'}}
+        mock_db.collection.assert_called_with('research_articles')
+        assert len(mock_db.get_all.call_args[0][0]) == 2
+
+    @patch('app.services.article_service.get_db')
+    def test_get_articles_empty(self, mock_get_db):
+        """Test that no request is made for an empty PMID list"""
+        assert article_service.get_articles([]) == {}
+        mock_get_db.assert_not_called()
+
+    @patch('app.services.article_service.get_db')
+    def test_save_articles(self, mock_get_db):
+        """Test saving articles with merge in one batch"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_batch = mock_db.batch.return_value
+
+        article_service.save_articles({'12345': {'title_ja': 'タイトル'}})
+
+        ref, data = mock_batch.set.call_args[0]
+        assert data['title_ja'] == 'タイトル'
+        assert data['pmid'] == '12345'
+        assert 'updated_at' in data
+        assert mock_batch.set.call_args[1] == {'merge': True}
+        mock_batch.commit.assert_called_once()
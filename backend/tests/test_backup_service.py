@@ -0,0 +1,239 @@
+"""Tests for backup_service.py"""
+import pytest
+import json
+from unittest.mock import Mock, MagicMock, patch
+from app.services import backup_service
+
+
+def _make_doc(doc_id, data):
+    doc = MagicMock()
+    doc.id = doc_id
+    doc.to_dict.return_value = dict(data)
+    return doc
+
+
+def _iter_raising(error):
+    """最初の要素の取得で例外を送出するイテレータ"""
+    raise error
+    yield
+
+
+class TestBackupService:
+    """Test backup service functions"""
+
+    @patch('app.services.backup_service.get_db')
+    def test_iter_collection_pages(self, mock_get_db):
+        """Test scanning a collection page by page"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+
+        doc1 = _make_doc('a', {})
+        doc2 = _make_doc('b', {})
+        doc3 = _make_doc('c', {})
+
+        # 1ページ目: limit()直後、2ページ目: start_after()経由
+        mock_query = mock_db.collection.return_value.order_by.return_value.limit.return_value
+        mock_query.stream.return_value = [doc1, doc2]
+        mock_query.start_after.return_value.stream.return_value = [doc3]
+
+        # Execute
+        docs = list(backup_service.iter_collection('customer', page_size=2))
+
+        # Assert
+        assert [d.id for d in docs] == ['a', 'b', 'c']
+        mock_db.collection.return_value.order_by.assert_called_with('__name__')
+        mock_query.start_after.assert_called_once_with(doc2)
+
+    @patch('app.services.backup_service.iter_collection')
+    def test_stream_backup_format(self, mock_iter_collection):
+        """Test streamed backup is valid JSON in the legacy layout"""
+        collections = {
+            'customer': [_make_doc('customer_1', {'name': 'テスト太郎'})],
+            'weight_history': [
+                _make_doc('weight_1', {'customer_id': 'customer_1', 'weight': 70.0}),
+                _make_doc('weight_2', {'customer_id': 'customer_1', 'weight': 69.5})
+            ],
+            'training_sessions': [],
+            'meal_records': [_make_doc('meal_1', {'customer_id': 'customer_1', 'date': '2026-01-04'})],
+            'nutrition_goals': [_make_doc('customer_1', {'target_calories': 2000})],
+        }
+        mock_iter_collection.side_effect = lambda name, page_size: iter(collections[name])
+
+        # Execute
+        chunks = list(backup_service.stream_backup())
+        backup = json.loads(''.join(chunks))
+
+        # Assert
+        assert backup['version'] == '1.1'
+        assert backup['complete'] is True
+        assert backup_service.is_complete_backup(backup)
+        assert 'timestamp' in backup
+        data = backup['collections']
+        assert data['customers'] == [{'name': 'テスト太郎', 'id': 'customer_1'}]
+        assert [r['id'] for r in data['weight_history']] == ['weight_1', 'weight_2']
+        assert data['training_sessions'] == []
+        assert data['meal_records'][0]['id'] == 'meal_1'
+        assert data['nutrition_goals'] == [{'target_calories': 2000, 'customer_id': 'customer_1'}]
+        # ドキュメント単位でチャンク化されている
+        assert len(chunks) > len(collections)
+
+    @patch('app.services.backup_service.iter_collection')
+    def test_stream_backup_setup_error_raised_before_streaming(self, mock_iter_collection):
+        """Test that a failure on the first page raises when the stream is created"""
+        mock_iter_collection.return_value = _iter_raising(Exception('Firestore unavailable'))
+
+        with pytest.raises(Exception, match='Firestore unavailable'):
+            backup_service.stream_backup()
+
+    @patch('app.services.backup_service.iter_collection')
+    def test_stream_backup_midway_error_has_no_complete_marker(self, mock_iter_collection):
+        """Test that a failure partway through stops the stream without the completion marker"""
+        def iter_docs(name, page_size):
+            if name == 'weight_history':
+                return _iter_raising(Exception('Scan failed'))
+            return iter([_make_doc(f'{name}_1', {'name': 'x'})])
+        mock_iter_collection.side_effect = iter_docs
+
+        chunks = []
+        with pytest.raises(Exception, match='Scan failed'):
+            for chunk in backup_service.stream_backup():
+                chunks.append(chunk)
+
+        assert chunks
+        assert 'complete' not in ''.join(chunks)
+
+    def test_is_complete_backup(self):
+        """Test the completion check, accepting legacy files without the marker"""
+        assert backup_service.is_complete_backup({'version': '1.1', 'collections': {}, 'complete': True})
+        assert not backup_service.is_complete_backup({'version': '1.1', 'collections': {}})
+        assert backup_service.is_complete_backup({'version': '1.0', 'collections': {}})
+
+    @patch('app.services.backup_service.advice_service.touch')
+    @patch('app.services.backup_service.weight_service.rebuild_weight_summaries')
+    @patch('app.services.backup_service.meal_service.rebuild_daily_nutrition')
+    @patch('app.services.backup_service.get_db')
+    def test_restore_backup_batches(self, mock_get_db, mock_rebuild, mock_rebuild_weights, mock_touch):
+        """Test restoring collections with batched writes"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_batch = mock_db.batch.return_value
+
+        collections = {
+            'customers': [{'id': 'customer_1', 'name': 'テスト太郎'}],
+            'meal_records': [
+                {'id': f'meal_{i}', 'customer_id': f'customer_{i % 2 + 1}', 'date': '2026-01-04'} for i in range(5)
+            ],
+            'nutrition_goals': [{'customer_id': 'customer_1', 'target_calories': 2000}],
+        }
+
+        # Execute
+        result, error = backup_service.restore_backup(collections, batch_size=2)
+
+        # Assert
+        assert error is None
+        assert result['restore_id']
+        assert result['restored_counts'] == {
+            'customers': 1,
+            'weight_history': 0,
+            'training_sessions': 0,
+            'meal_records': 5,
+            'nutrition_goals': 1
+        }
+        assert result['committed']['meal_records'] == 5
+        # 7件を2件ずつ → 顧客1 + 食事3(2+2+1) + 目標1 = 5回 + アドバイス無効化1回のコミット
+        assert mock_batch.commit.call_count == 6
+        assert mock_batch.set.call_count == 7
+        mock_db.collection.return_value.document.assert_any_call('meal_0')
+        # 復元した顧客の分だけ日次ロールアップを再構築し、食事アドバイスを無効化
+        assert sorted(c[0][0] for c in mock_rebuild.call_args_list) == ['customer_1', 'customer_2']
+        mock_rebuild_weights.assert_not_called()
+        assert sorted(c[0][1:3] for c in mock_touch.call_args_list) == [
+            ('customer_1', 'meal'), ('customer_2', 'meal')
+        ]
+
+    @patch('app.services.backup_service.advice_service.touch')
+    @patch('app.services.backup_service.weight_service.rebuild_weight_summaries')
+    @patch('app.services.backup_service.get_db')
+    def test_restore_backup_training_and_weights(self, mock_get_db, mock_rebuild_weights, mock_touch):
+        """Test that exercise_ids are added on write and rebuilds are scoped to restored customers"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_batch = mock_db.batch.return_value
+
+        collections = {
+            'weight_history': [{'id': 'w1', 'customer_id': 'customer_1', 'weight': 70.0}],
+            'training_sessions': [{
+                'id': 'session_1', 'customer_id': 'customer_2',
+                'exercises': [{'exercise_id': 'squat'}, {'exercise_id': 'squat'}]
+            }],
+        }
+
+        result, error = backup_service.restore_backup(collections)
+
+        assert error is None
+        session_data = next(c[0][1] for c in mock_batch.set.call_args_list if 'exercises' in c[0][1])
+        assert session_data['exercise_ids'] == ['squat']
+        mock_rebuild_weights.assert_called_once_with('customer_1')
+        assert [c[0][1:3] for c in mock_touch.call_args_list] == [('customer_2', 'training')]
+
+    @patch('app.services.backup_service.get_db')
+    def test_restore_progress_keyed_by_restore_id(self, mock_get_db):
+        """Test that progress is stored per restore and readable from any worker"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+
+        result, error = backup_service.restore_backup({}, restore_id='restore_abc')
+
+        assert error is None
+        assert result['restore_id'] == 'restore_abc'
+        mock_db.collection.return_value.document.assert_any_call('restore_abc')
+        final = mock_db.collection.return_value.document.return_value.set.call_args[0][0]
+        assert final['status'] == 'completed'
+
+        mock_doc = MagicMock()
+        mock_doc.exists = True
+        mock_doc.to_dict.return_value = {'status': 'running', 'collections': {'customers': {'total': 3}}}
+        mock_db.collection.return_value.document.return_value.get.return_value = mock_doc
+        progress, error = backup_service.get_restore_progress('restore_abc')
+        assert error is None
+        assert progress['collections']['customers']['total'] == 3
+
+        mock_doc.exists = False
+        assert backup_service.get_restore_progress('missing') == (None, 'Restore not found')
+
+    @patch('app.services.backup_service.meal_service.rebuild_daily_nutrition')
+    @patch('app.services.backup_service.get_db')
+    def test_restore_backup_resume_after_failure(self, mock_get_db, mock_rebuild):
+        """Test that a failed restore reports where to resume"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_batch = mock_db.batch.return_value
+        # 2回目のコミットで失敗
+        mock_batch.commit.side_effect = [None, Exception("Commit error")]
+
+        records = [{'id': f'meal_{i}'} for i in range(4)]
+        result, error = backup_service.restore_backup({'meal_records': records}, batch_size=2)
+
+        assert 'Commit error' in error
+        assert result['restored_counts']['meal_records'] == 2
+        assert result['committed']['meal_records'] == 2
+        # 進捗はrestore_progress/{restore_id}に保存（最後に失敗として記録）
+        mock_progress_ref = mock_db.collection.return_value.document.return_value
+        mock_db.collection.assert_any_call('restore_progress')
+        assert mock_progress_ref.set.call_args[0][0]['status'] == 'failed'
+        saved_totals = [
+            c[0][0]['collections'].get('meal_records', {}).get('total')
+            for c in mock_progress_ref.set.call_args_list if c[0][0].get('collections')
+        ]
+        assert 4 in saved_totals
+        mock_rebuild.assert_not_called()
+
+        # 再開: コミット済みの2件をスキップ
+        mock_batch.commit.side_effect = None
+        mock_batch.set.reset_mock()
+        result, error = backup_service.restore_backup({'meal_records': records}, resume_from=result['committed'], batch_size=2)
+
+        assert error is None
+        assert result['restored_counts']['meal_records'] == 2
+        assert mock_batch.set.call_count == 2
+        mock_db.collection.return_value.document.assert_called_with('meal_3')
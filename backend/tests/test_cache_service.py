@@ -0,0 +1,211 @@
+"""Tests for cache_service.py"""
+import os
+import pytest
+import threading
+import time
+from unittest.mock import Mock, MagicMock, patch
+from datetime import datetime
+from app.services import cache_service
+
+
+class TestLRUCache:
+    """Test in-process LRU cache"""
+
+    def test_set_and_get(self):
+        """Test saving and retrieving a value"""
+        cache = cache_service.LRUCache(ttl_seconds=60)
+        cache.set('key', 'value')
+
+        value, expires_at = cache.get('key')
+
+        assert value == 'value'
+        assert expires_at > datetime.now()
+        assert cache.stats()['hits'] == 1
+
+    def test_miss_and_expiration(self):
+        """Test that expired entries count as misses and are removed"""
+        cache = cache_service.LRUCache(ttl_seconds=60)
+        cache.set('old', 'value', ttl_seconds=-1)
+
+        assert cache.get('old') == (None, None)
+        assert cache.get('missing') == (None, None)
+
+        stats = cache.stats()
+        assert stats['misses'] == 2
+        assert stats['expirations'] == 1
+        assert stats['entries'] == 0
+
+    def test_evicts_least_recently_used(self):
+        """Test LRU eviction by entry count"""
+        cache = cache_service.LRUCache(ttl_seconds=60, max_entries=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')  # aを最近使用に
+        cache.set('c', '3')
+
+        assert cache.get('b') == (None, None)
+        assert cache.get('a')[0] == '1'
+        assert cache.get('c')[0] == '3'
+        assert cache.stats()['evictions'] == 1
+
+    def test_evicts_by_bytes(self):
+        """Test eviction by total byte size"""
+        cache = cache_service.LRUCache(ttl_seconds=60, max_entries=100, max_bytes=10)
+        cache.set('a', '12345')
+        cache.set('b', '67890')
+        cache.set('c', 'abcde')
+
+        assert len(cache) == 2
+        assert cache.get('a') == (None, None)
+        assert cache.stats()['bytes'] <= 10
+
+        # 上限を超える単一の値は保存しない
+        cache.set('huge', 'x' * 11)
+        assert cache.get('huge') == (None, None)
+
+
+class TestSQLiteCache:
+    """Test SQLite-backed shared cache"""
+
+    def test_shared_between_instances(self, tmp_path):
+        """Test that separate instances (workers) share entries"""
+        path = str(tmp_path / 'cache.sqlite3')
+        worker1 = cache_service.SQLiteCache('ai_chat', ttl_seconds=60, path=path)
+        worker2 = cache_service.SQLiteCache('ai_chat', ttl_seconds=60, path=path)
+
+        worker1.set('key', 'AI応答')
+        value, expires_at = worker2.get('key')
+
+        assert value == 'AI応答'
+        assert expires_at > datetime.now()
+        assert worker2.stats()['hits'] == 1
+
+    def test_expiration_and_eviction(self, tmp_path):
+        """Test TTL expiry and max entry eviction"""
+        path = str(tmp_path / 'cache.sqlite3')
+        cache = cache_service.SQLiteCache('test', ttl_seconds=60, max_entries=2, path=path)
+
+        cache.set('expired', 'v', ttl_seconds=-1)
+        assert cache.get('expired') == (None, None)
+
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.set('c', '3')
+
+        assert len(cache) == 2
+        assert cache.stats()['evictions'] == 1
+
+    def test_no_connection_kept_across_fork(self, tmp_path):
+        """Test that the constructor keeps no connection and a forked process opens its own"""
+        path = str(tmp_path / 'cache.sqlite3')
+        cache = cache_service.SQLiteCache('fork_test', ttl_seconds=60, path=path)
+
+        # import時（fork前のマスター）にはスレッドローカルの接続を残さない
+        assert getattr(cache._local, 'conn', None) is None
+
+        cache.set('key', 'value')
+        parent_conn = cache._local.conn
+        with patch('app.services.cache_service.os.getpid', return_value=os.getpid() + 1):
+            assert cache._connect() is not parent_conn
+            assert cache.get('key')[0] == 'value'
+
+    def test_create_cache_registers_stats(self, tmp_path):
+        """Test factory and stats registry"""
+        with patch('app.services.cache_service.CACHE_SQLITE_PATH', str(tmp_path / 'cache.sqlite3')):
+            cache = cache_service.create_cache('registry_test', ttl_seconds=60, backend='sqlite')
+
+        assert isinstance(cache, cache_service.SQLiteCache)
+        assert cache_service.get_all_stats()['registry_test']['backend'] == 'sqlite'
+
+
+class TestSingleFlight:
+    """Test single-flight request coalescing"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Test that concurrent callers wait on a single execution"""
+        flight = cache_service.SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def slow_fn():
+            calls.append(1)
+            release.wait(timeout=5)
+            return 'result'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do('key', slow_fn)))
+            for _ in range(3)
+        ]
+        for t in threads:
+            t.start()
+
+        # 後続2件が待機に入るまで待ってから完了させる
+        deadline = time.time() + 5
+        while flight.stats()['coalesced'] < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join(timeout=5)
+
+        assert len(calls) == 1
+        assert sorted(results) == [('result', False), ('result', True), ('result', True)]
+        assert flight.stats() == {'in_flight': 0, 'executed': 1, 'coalesced': 2}
+
+    def test_error_is_shared_and_cleared(self):
+        """Test that errors propagate and the key can be retried"""
+        flight = cache_service.SingleFlight()
+
+        def failing_fn():
+            raise ValueError('upstream error')
+
+        with pytest.raises(ValueError):
+            flight.do('key', failing_fn)
+
+        assert flight.do('key', lambda: 'ok') == ('ok', False)
+
+
+class TestStaleWhileRevalidateCache:
+    """Test stale-while-revalidate cache"""
+
+    def test_fresh_and_miss(self):
+        """Test loading on miss and serving fresh entries"""
+        cache = cache_service.StaleWhileRevalidateCache(cache_service.LRUCache(ttl_seconds=60), fresh_seconds=30)
+        loader = Mock(return_value='result')
+
+        assert cache.get_or_load('key', loader) == ('result', 'miss')
+        assert cache.get_or_load('key', loader) == ('result', 'fresh')
+        loader.assert_called_once()
+
+    def test_stale_served_while_refreshing(self):
+        """Test that a stale entry is returned immediately and refreshed in the background"""
+        cache = cache_service.StaleWhileRevalidateCache(cache_service.LRUCache(ttl_seconds=60), fresh_seconds=-1)
+        release = threading.Event()
+        cache.get_or_load('key', lambda: 'old')
+
+        def slow_loader():
+            release.wait(timeout=5)
+            return 'new'
+
+        # 再取得中に何度アクセスしても古い値を返し、再取得は1件のみ
+        assert cache.get_or_load('key', slow_loader) == ('old', 'stale')
+        assert cache.get_or_load('key', slow_loader) == ('old', 'stale')
+        assert cache.stats()['refreshing'] == 1
+        release.set()
+
+        deadline = time.time() + 5
+        while cache.stats()['refreshes'] < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        assert cache.get_or_load('key', slow_loader) == ('new', 'stale')
+        assert cache.stats()['refreshes'] >= 1
+        assert cache.stats()['stale_hits'] == 3
+
+    def test_loader_error_not_cached(self):
+        """Test that loader errors propagate and nothing is cached"""
+        cache = cache_service.StaleWhileRevalidateCache(cache_service.LRUCache(ttl_seconds=60), fresh_seconds=30)
+
+        with pytest.raises(ValueError):
+            cache.get_or_load('key', Mock(side_effect=ValueError('upstream error')))
+
+        assert len(cache) == 0
+        assert cache.get_or_load('key', lambda: 'ok') == ('ok', 'miss')
@@ -1,14 +1,16 @@
 """Tests for customer_service.py"""
 import pytest
 from unittest.mock import Mock, MagicMock, patch
+from datetime import datetime, timedelta
 from app.services import customer_service
 
 
 class TestCustomerService:
     """Test customer service functions"""
 
+    @patch('app.services.customer_service.weight_service.record_weight')
     @patch('app.services.customer_service.get_db')
-    def test_register_customer_success(self, mock_get_db, sample_customer_data):
+    def test_register_customer_success(self, mock_get_db, mock_record_weight, sample_customer_data):
         """Test successful customer registration"""
         # Setup mocks
         mock_db = MagicMock()
@@ -23,8 +25,11 @@ class TestCustomerService:
         # Assert
         assert customer_id == 'customer_123'
         assert error is None
-        assert mock_db.collection.call_count == 2  # customer + weight_history
-        mock_doc_ref.set.assert_called()
+        mock_doc_ref.set.assert_called_once()
+        # 初回の体重履歴（体重サマリーも更新）
+        mock_record_weight.assert_called_once_with(
+            mock_db, 'customer_123', sample_customer_data['weight'], note='初回登録', update_customer=False
+        )
 
     @patch('app.services.customer_service.get_db')
     def test_register_customer_missing_fields(self, mock_get_db):
@@ -119,8 +124,9 @@ class TestCustomerService:
         # Assert
         mock_doc_ref.update.assert_called_once_with(update_data)
 
+    @patch('app.services.customer_service.weight_service.record_weight')
     @patch('app.services.customer_service.get_db')
-    def test_update_customer_with_weight(self, mock_get_db):
+    def test_update_customer_with_weight(self, mock_get_db, mock_record_weight):
         """Test updating customer with weight change (creates history)"""
         # Setup mocks
         mock_db = MagicMock()
@@ -134,33 +140,149 @@ class TestCustomerService:
 
         # Assert
         mock_doc_ref.update.assert_called_once()
-        assert mock_db.collection.call_count == 2  # customer + weight_history
+        mock_record_weight.assert_called_once_with(
+            mock_db, 'customer_123', 75.5, note='体重更新', update_customer=False
+        )
 
     @patch('app.services.customer_service.get_db')
     def test_delete_customer(self, mock_get_db):
-        """Test deleting customer and related weight history"""
+        """Test deleting customer and all related data in batches"""
         # Setup mocks
         mock_db = MagicMock()
         mock_get_db.return_value = mock_db
         
-        # Mock weight history documents
+        # 関連ドキュメント: 1回目のクエリで2件、2回目以降は0件（削除済み）
         mock_weight_doc1 = MagicMock()
         mock_weight_doc2 = MagicMock()
-        mock_db.collection.return_value.where.return_value.stream.return_value = [
-            mock_weight_doc1, mock_weight_doc2
-        ]
-        
-        mock_customer_ref = MagicMock()
-        mock_db.collection.return_value.document.return_value = mock_customer_ref
+        mock_limit = mock_db.collection.return_value.where.return_value.limit
+        mock_limit.return_value.stream.side_effect = [[mock_weight_doc1, mock_weight_doc2], [], [], []]
+        mock_batch = mock_db.batch.return_value
 
         # Execute
         result = customer_service.delete_customer('customer_123')
 
         # Assert
         assert result is True
-        mock_weight_doc1.reference.delete.assert_called_once()
-        mock_weight_doc2.reference.delete.assert_called_once()
-        mock_customer_ref.delete.assert_called_once()
+        queried = [c[0][0] for c in mock_db.collection.call_args_list]
+        for name in ['weight_history', 'training_sessions', 'meal_records', 'daily_nutrition',
+                     'nutrition_goals', 'advice_fingerprints', 'weight_summaries', 'daily_nutrition_status', 'customer']:
+            assert name in queried
+        mock_batch.delete.assert_any_call(mock_weight_doc1.reference)
+        mock_batch.delete.assert_any_call(mock_weight_doc2.reference)
+        # 関連2件 + 栄養目標 + アドバイス更新記録 + 体重サマリー + ロールアップ作成記録 + 顧客本体
+        assert mock_batch.delete.call_count == 7
+        mock_limit.assert_called_with(customer_service.DELETE_BATCH_SIZE)
+
+    @patch('app.services.customer_service.get_db')
+    def test_delete_customer_pages_until_empty(self, mock_get_db):
+        """Test that large histories are deleted page by page with progress"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        
+        page = [MagicMock(), MagicMock()]
+        mock_limit = mock_db.collection.return_value.where.return_value.limit
+        # weight_history: 2件 → 2件 → 1件、他は0件
+        mock_limit.return_value.stream.side_effect = [page, page, page[:1], [], [], []]
+        progress = []
+
+        customer_service.delete_customer(
+            'customer_123',
+            on_progress=lambda name, count: progress.append((name, count)),
+            batch_size=2
+        )
+
+        assert progress == [('weight_history', 2), ('weight_history', 4), ('weight_history', 5)]
+
+    @patch('app.services.customer_service.threading.Thread')
+    @patch('app.services.customer_service.get_db')
+    def test_start_delete_customer_job(self, mock_get_db, mock_thread_class):
+        """Test registering a background delete job in Firestore"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_job_ref = mock_db.collection.return_value.document.return_value
+        mock_job_ref.get.return_value.exists = False
+        mock_transaction = mock_db.transaction.return_value
+
+        # Execute - ジョブ開始（スレッドは起動しない）
+        job = customer_service.start_delete_customer_job('customer_123')
+
+        # Assert - delete_jobs/{customer_id}に登録してからスレッドを起動
+        assert job['status'] == 'running'
+        mock_db.collection.assert_any_call('delete_jobs')
+        mock_transaction.set.assert_called_once_with(mock_job_ref, job)
+        mock_thread_class.return_value.start.assert_called_once()
+
+    @pytest.mark.parametrize('updated_seconds_ago,restarted', [(10, False), (3600, True)])
+    @patch('app.services.customer_service.threading.Thread')
+    @patch('app.services.customer_service.get_db')
+    def test_start_delete_customer_job_running(self, mock_get_db, mock_thread_class, updated_seconds_ago, restarted):
+        """Test that a running job is reused unless its progress has stalled"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        updated_at = (datetime.now() - timedelta(seconds=updated_seconds_ago)).isoformat()
+        running = {'customer_id': 'customer_123', 'status': 'running', 'started_at': updated_at, 'updated_at': updated_at}
+        mock_snapshot = mock_db.collection.return_value.document.return_value.get.return_value
+        mock_snapshot.exists = True
+        mock_snapshot.to_dict.return_value = running
+
+        job = customer_service.start_delete_customer_job('customer_123')
+
+        assert (job['started_at'] != updated_at) is restarted
+        assert mock_thread_class.return_value.start.called is restarted
+
+    @patch('app.services.customer_service.delete_customer')
+    @patch('app.services.customer_service.get_db')
+    def test_run_delete_job_saves_progress(self, mock_get_db, mock_delete_customer):
+        """Test that job progress and the result are written to the job document"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_job_ref = mock_db.collection.return_value.document.return_value
+
+        def fake_delete(customer_id, on_progress=None):
+            on_progress('meal_records', 1200)
+            return True
+        mock_delete_customer.side_effect = fake_delete
+
+        # スレッド本体を同期実行
+        customer_service._run_delete_job('customer_123')
+
+        progress = mock_job_ref.update.call_args_list[0][0][0]
+        result = mock_job_ref.update.call_args_list[1][0][0]
+        assert progress['deleted.meal_records'] == 1200
+        assert result['status'] == 'done'
+        assert result['finished_at'] is not None
+
+    @patch('app.services.customer_service.threading.Thread')
+    @patch('app.services.customer_service.get_db')
+    def test_get_delete_customer_job(self, mock_get_db, mock_thread_class):
+        """Test reading job status, resuming stalled jobs until the attempt limit"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_doc = mock_db.collection.return_value.document.return_value.get.return_value
+        mock_doc.exists = True
+        stale = (datetime.now() - timedelta(hours=1)).isoformat()
+
+        # 中断されたジョブは参照時に再開（試行回数を加算）
+        mock_doc.to_dict.return_value = {'status': 'running', 'started_at': stale, 'updated_at': stale, 'attempts': 1}
+        job = customer_service.get_delete_customer_job('customer_123')
+        assert job['status'] == 'running'
+        assert job['attempts'] == 2
+        mock_thread_class.return_value.start.assert_called_once()
+
+        # 上限に達したジョブは再開せずinterruptedとして返す
+        mock_thread_class.reset_mock()
+        mock_doc.to_dict.return_value = {
+            'status': 'running', 'started_at': stale, 'updated_at': stale,
+            'attempts': customer_service.DELETE_JOB_MAX_ATTEMPTS
+        }
+        assert customer_service.get_delete_customer_job('customer_123')['status'] == 'interrupted'
+        mock_thread_class.return_value.start.assert_not_called()
+
+        mock_doc.to_dict.return_value = {'status': 'done', 'started_at': stale, 'updated_at': stale}
+        assert customer_service.get_delete_customer_job('customer_123')['status'] == 'done'
+
+        mock_doc.exists = False
+        assert customer_service.get_delete_customer_job('unknown') is None
 
     @patch('app.services.customer_service.get_db')
     def test_register_customer_error_handling(self, mock_get_db):
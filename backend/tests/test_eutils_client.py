@@ -0,0 +1,176 @@
+"""Tests for eutils_client.py"""
+import json
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock, MagicMock, patch
+from urllib.parse import urlparse, parse_qs
+from app.services import eutils_client
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """E-utilitiesのローカル代替サーバー"""
+
+    protocol_version = 'HTTP/1.1'  # keep-aliveを有効にする
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.server.requests.append((url.path, params, self.client_address[1]))
+
+        if self.server.failures > 0:
+            self.server.failures -= 1
+            self._send(503, b'busy', 'text/plain')
+        elif url.path.endswith('/esearch.fcgi'):
+            body = {'esearchresult': {'count': '2', 'idlist': ['111', '222']}}
+            self._send(200, json.dumps(body).encode(), 'application/json')
+        elif url.path.endswith('/esummary.fcgi'):
+            ids = params['id'].split(',')
+            body = {'result': {'uids': ids, **{pmid: {'title': f'Title {pmid}'} for pmid in ids}}}
+            self._send(200, json.dumps(body).encode(), 'application/json')
+        elif url.path.endswith('/efetch.fcgi'):
+            articles = ''.join(
+                f'<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID><Article>'
+                f'<ArticleTitle>Title {pmid}</ArticleTitle>'
+                f'<Abstract><AbstractText>Abstract {pmid}</AbstractText></Abstract>'
+                f'</Article></MedlineCitation></PubmedArticle>'
+                for pmid in params['id'].split(',')
+            )
+            self._send(200, f'<PubmedArticleSet>{articles}</PubmedArticleSet>'.encode(), 'text/xml')
+        else:
+            self._send(404, b'not found', 'text/plain')
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StandInHandler)
+    server.requests = []
+    server.failures = 0
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(server, **kwargs):
+    return eutils_client.EutilsClient(
+        base_url=f'http://127.0.0.1:{server.server_address[1]}/entrez/eutils',
+        rate_limit=100, backoff_seconds=0.01, **kwargs
+    )
+
+
+class TestEutilsClient:
+    """Test E-utilities client against a local stand-in server"""
+
+    def test_esearch_and_connection_reuse(self, stand_in_server):
+        """Test that requests share one keep-alive connection"""
+        client = _client(stand_in_server)
+
+        data1 = client.esearch('protein', retmax=10, retstart=20, sort='pub_date')
+        data2 = client.esearch('protein')
+
+        assert data1['esearchresult']['idlist'] == ['111', '222']
+        assert data2 == data1
+        path, params, _ = stand_in_server.requests[0]
+        assert path == '/entrez/eutils/esearch.fcgi'
+        assert params['retstart'] == '20'
+        assert params['tool'] == 'michela'
+        assert 'api_key' not in params
+        # 同じ接続（クライアント側ポート）を再利用している
+        assert len({port for _, _, port in stand_in_server.requests}) == 1
+
+    def test_esummary_batches(self, stand_in_server):
+        """Test that many PMIDs are fetched in batches"""
+        client = _client(stand_in_server)
+
+        with patch('app.services.eutils_client.BATCH_SIZE', 2):
+            summaries = client.esummary(['1', '2', '3'])
+
+        assert set(summaries) == {'1', '2', '3'}
+        assert [r[1]['id'] for r in stand_in_server.requests] == ['1,2', '3']
+
+    def test_efetch_abstracts(self, stand_in_server):
+        """Test parsing titles and abstracts for several PMIDs in one request"""
+        client = _client(stand_in_server)
+
+        articles = client.efetch_abstracts(['111', '222'])
+
+        assert articles['222'] == {'title': 'Title 222', 'abstract': 'Abstract 222'}
+        assert len(stand_in_server.requests) == 1
+
+    def test_retries_server_errors(self, stand_in_server):
+        """Test retry with backoff on 503 responses"""
+        stand_in_server.failures = 2
+        client = _client(stand_in_server, api_key='test_key')
+
+        data = client.esearch('protein')
+
+        assert data['esearchresult']['count'] == '2'
+        assert len(stand_in_server.requests) == 3
+        assert stand_in_server.requests[-1][1]['api_key'] == 'test_key'
+
+    def test_gives_up_after_max_retries(self, stand_in_server):
+        """Test that persistent errors are raised"""
+        stand_in_server.failures = 10
+        client = _client(stand_in_server, max_retries=1)
+
+        with pytest.raises(Exception):
+            client.esearch('protein')
+        assert len(stand_in_server.requests) == 2
+
+    def test_rate_limit_depends_on_api_key(self):
+        """Test NCBI rate limits with and without an API key"""
+        assert eutils_client.EutilsClient().rate_limiter.rate == 3
+        assert eutils_client.EutilsClient(api_key='key').rate_limiter.rate == 10
+
+    def test_rate_limit_is_split_across_processes(self):
+        """Test that the per-process bucket gets an equal share of the total limit"""
+        limiter = eutils_client.EutilsClient(processes=4).rate_limiter
+        assert limiter.rate == 0.75
+        assert limiter.capacity == 1
+        assert eutils_client.EutilsClient(api_key='key', processes=4).rate_limiter.rate == 2.5
+
+        eutils_client.reset_client()
+        with patch.dict('os.environ', {'EUTILS_RATE_LIMIT': '8', 'EUTILS_PROCESSES': '4'}):
+            assert eutils_client.get_client().rate_limiter.rate == 2
+        eutils_client.reset_client()
+
+    def test_reset_client_closes_session(self):
+        """Test that the shared client is rebuilt and its connection pool closed on reset"""
+        eutils_client.reset_client()
+        client = eutils_client.get_client()
+
+        with patch.object(client.session, 'close') as mock_close:
+            eutils_client.reset_client()
+
+        mock_close.assert_called_once()
+        assert eutils_client.get_client() is not client
+        eutils_client.reset_client()
+
+
+class TestTokenBucket:
+    """Test token bucket rate limiter"""
+
+    def test_limits_rate(self):
+        """Test that requests beyond the burst wait for new tokens"""
+        bucket = eutils_client.TokenBucket(rate=50, capacity=1)
+
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        elapsed = time.monotonic() - start
+
+        # 1件目は即時、残り3件は1/50秒ずつ待つ
+        assert elapsed >= 0.05
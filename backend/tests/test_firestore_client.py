@@ -0,0 +1,109 @@
+"""Tests for firestore_client.py"""
+import pytest
+from unittest.mock import Mock, MagicMock, patch
+from app.services import firestore_client
+
+
+class TestFirestoreClient:
+    """Test shared Firestore client handling"""
+
+    def setup_method(self):
+        firestore_client.reset_client()
+
+    def teardown_method(self):
+        firestore_client.reset_client()
+
+    @patch('app.services.firestore_client._create_client')
+    def test_get_client_reuses_instance(self, mock_create_client):
+        """Test that the client is created once per process"""
+        mock_create_client.return_value = MagicMock()
+
+        client1 = firestore_client.get_client()
+        client2 = firestore_client.get_client()
+
+        assert client1 is client2
+        mock_create_client.assert_called_once()
+
+    @patch('app.services.firestore_client.os.getpid')
+    @patch('app.services.firestore_client._create_client')
+    def test_get_client_recreated_after_fork(self, mock_create_client, mock_getpid):
+        """Test that a forked worker gets its own client"""
+        mock_create_client.side_effect = [MagicMock(), MagicMock()]
+
+        mock_getpid.return_value = 100
+        parent_client = firestore_client.get_client()
+        mock_getpid.return_value = 101
+        child_client = firestore_client.get_client()
+
+        assert parent_client is not child_client
+        assert mock_create_client.call_count == 2
+
+    @patch('app.services.firestore_client._create_client')
+    def test_reset_client(self, mock_create_client):
+        """Test resetting the shared client"""
+        mock_create_client.side_effect = [MagicMock(), MagicMock()]
+
+        client1 = firestore_client.get_client()
+        firestore_client.reset_client()
+        client2 = firestore_client.get_client()
+
+        assert client1 is not client2
+
+    @patch('app.services.firestore_client.os.getpid')
+    @patch('app.services.firestore_client._create_client')
+    def test_reset_client_closes_own_channel_only(self, mock_create_client, mock_getpid):
+        """Test that reset closes a client created in this process but not one inherited by fork"""
+        parent_client = MagicMock()
+        mock_create_client.return_value = parent_client
+
+        # fork後のワーカー: 親のチャネルは閉じずに破棄する
+        mock_getpid.return_value = 100
+        firestore_client.get_client()
+        mock_getpid.return_value = 101
+        firestore_client.reset_client()
+        parent_client.close.assert_not_called()
+
+        # 同じプロセスで生成したクライアントは閉じる
+        firestore_client.get_client()
+        firestore_client.reset_client()
+        parent_client.close.assert_called_once()
+
+    @patch.dict('os.environ', {'GOOGLE_CREDENTIALS': '{"type": "service_account"}'})
+    @patch('firebase_admin.get_app')
+    @patch('firebase_admin.initialize_app')
+    @patch('firebase_admin.credentials.Certificate')
+    @patch('firebase_admin._apps', {})
+    def test_initialize_app_on_first_use(self, mock_certificate, mock_initialize_app, mock_get_app):
+        """Test that Firebase is initialized lazily from GOOGLE_CREDENTIALS"""
+        app = firestore_client._initialize_app()
+
+        mock_certificate.assert_called_once_with({'type': 'service_account'})
+        mock_initialize_app.assert_called_once_with(mock_certificate.return_value)
+        assert app is mock_get_app.return_value
+
+    def test_channel_options(self):
+        """Test gRPC channel options include keepalive settings"""
+        options = firestore_client.get_channel_options()
+
+        assert options['grpc.keepalive_time_ms'] == firestore_client.GRPC_KEEPALIVE_TIME_MS
+        assert 'grpc.keepalive_timeout_ms' in options
+        assert options['grpc.max_receive_message_length'] > 0
+
+    @patch.dict('os.environ', {}, clear=False)
+    @patch('google.cloud.firestore_v1.services.firestore.transports.grpc.grpc_helpers.create_channel')
+    def test_tuned_client_applies_channel_options(self, mock_create_channel):
+        """Test the SDK internals the tuned client relies on (fails if an SDK update removes them)"""
+        import os
+        import grpc
+        from google.auth.credentials import AnonymousCredentials
+        os.environ.pop('FIRESTORE_EMULATOR_HOST', None)
+        mock_create_channel.return_value = MagicMock(spec=grpc.Channel)
+
+        client = firestore_client._client_class()(credentials=AnonymousCredentials(), project='test-project')
+        api = client._firestore_api
+
+        # GAPICクライアントは差し替えたトランスポート（設定済みのチャネル）で生成される
+        assert api is client._firestore_api
+        assert type(api.transport).__name__ == 'TunedGrpcTransport'
+        options = dict(mock_create_channel.call_args.kwargs['options'])
+        assert options == firestore_client.get_channel_options()
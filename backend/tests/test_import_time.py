@@ -0,0 +1,56 @@
+"""Tests for startup import cost of logic/api.py (python -X importtime)"""
+import os
+import subprocess
+import sys
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+
+# 起動時にimportしない重いSDK（初回利用時に遅延import）
+DEFERRED_MODULES = [
+    'google.generativeai',
+    'firebase_admin',
+    'google.cloud.firestore',
+    'grpc',
+    'requests',
+    'googletrans',
+]
+
+# app.logic.apiのimport時間の上限（秒、遅い環境ではIMPORT_TIME_BUDGET_SECONDSで調整）
+IMPORT_TIME_BUDGET_SECONDS = float(os.environ.get('IMPORT_TIME_BUDGET_SECONDS', 0.5))
+
+
+def _profile_import(module):
+    """別プロセスでimportし、モジュールごとの累積import時間（秒）を返す"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=SRC_DIR, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = int(cumulative) / 1_000_000
+    return timings
+
+
+@pytest.fixture(scope='module')
+def api_import_timings():
+    return _profile_import('app.logic.api')
+
+
+class TestImportTime:
+    """Test that importing the API module stays cheap"""
+
+    def test_heavy_sdks_are_deferred(self, api_import_timings):
+        """Test that SDKs are not imported at startup"""
+        imported = [name for name in DEFERRED_MODULES if name in api_import_timings]
+
+        assert imported == []
+
+    def test_import_time_budget(self, api_import_timings):
+        """Test that importing app.logic.api stays within the budget"""
+        assert api_import_timings['app.logic.api'] < IMPORT_TIME_BUDGET_SECONDS
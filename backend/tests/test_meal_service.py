@@ -1,12 +1,19 @@
 """Tests for meal_service.py"""
 import pytest
-from unittest.mock import Mock, MagicMock, patch
+from unittest.mock import Mock, MagicMock, patch, ANY
 from app.services import meal_service
 
 
 class TestMealService:
     """Test meal service functions"""
 
+    @pytest.fixture(autouse=True)
+    def reset_rollup_ready_customers(self):
+        """ロールアップ作成済みの顧客の記憶をテストごとに破棄"""
+        meal_service._rollup_ready_customers.clear()
+        yield
+        meal_service._rollup_ready_customers.clear()
+
     def test_get_food_presets(self):
         """Test getting food presets"""
         # get_food_presetsはハードコードされたプリセット配列を返すだけ
@@ -33,7 +40,18 @@ class TestMealService:
 
         assert record_id == 'meal_123'
         assert error is None
-        mock_doc_ref.set.assert_called_once()
+        # 記録とロールアップを1つのバッチで書き込む
+        mock_batch = mock_db.batch.return_value
+        assert mock_batch.set.call_count == 3
+        record_data = mock_batch.set.call_args_list[0][0][1]
+        assert record_data['total_calories'] == 10500.0  # 105kcal × 100
+        rollup_args = mock_batch.set.call_args_list[1]
+        assert rollup_args[1] == {'merge': True}
+        assert rollup_args[0][1]['date'] == '2026-01-04'
+        # 食事アドバイスのキャッシュも同じバッチで無効化
+        fingerprint_args = mock_batch.set.call_args_list[2]
+        assert 'meal_updated_at' in fingerprint_args[0][1]
+        mock_batch.commit.assert_called_once()
 
     @patch('app.services.meal_service.get_db')
     def test_add_meal_record_missing_fields(self, mock_get_db):
@@ -58,15 +76,17 @@ class TestMealService:
             'total_calories': 500
         }
         
-        # where().stream()のチェーン修正
+        # where().order_by().order_by().limit().stream()のチェーン
         mock_where = MagicMock()
-        mock_where.stream.return_value = [mock_doc1]
+        mock_where.order_by.return_value.order_by.return_value.limit.return_value.stream.return_value = [mock_doc1]
         mock_db.collection.return_value.where.return_value = mock_where
 
         records = meal_service.get_meal_records_by_customer('customer_123', limit=30)
 
         assert len(records) == 1
         assert records[0]['id'] == 'meal_1'
+        mock_where.where.assert_not_called()  # 日付範囲なし
+        mock_where.order_by.return_value.order_by.return_value.limit.assert_called_once_with(30)
 
     @patch('app.services.meal_service.get_db')
     def test_get_meal_record_by_id_success(self, mock_get_db):
@@ -106,11 +126,60 @@ class TestMealService:
         mock_get_db.return_value = mock_db
         mock_doc_ref = MagicMock()
         mock_db.collection.return_value.document.return_value = mock_doc_ref
+        mock_doc_ref.get.return_value.exists = False
+        mock_transaction = mock_db.transaction.return_value
 
         update_data = {'meal_type': 'lunch'}
         meal_service.update_meal_record('meal_123', update_data)
 
-        mock_doc_ref.update.assert_called_once_with(update_data)
+        mock_transaction.update.assert_called_once_with(mock_doc_ref, update_data)
+
+    @patch('app.services.meal_service.get_db')
+    def test_update_meal_record_moves_rollup(self, mock_get_db):
+        """Test that changing the date moves totals between daily rollups"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        
+        record_snapshot = MagicMock()
+        record_snapshot.exists = True
+        record_snapshot.to_dict.return_value = {
+            'customer_id': 'customer_123', 'date': '2026-01-03',
+            'total_calories': 500, 'total_protein': 30, 'total_fat': 10, 'total_carbs': 60
+        }
+        old_rollup = MagicMock()
+        old_rollup.exists = True
+        old_rollup.to_dict.return_value = {
+            'meal_count': 1, 'total_calories': 500, 'total_protein': 30, 'total_fat': 10, 'total_carbs': 60
+        }
+        new_rollup = MagicMock()
+        new_rollup.exists = True
+        new_rollup.to_dict.return_value = {
+            'meal_count': 2, 'total_calories': 1000, 'total_protein': 50, 'total_fat': 20, 'total_carbs': 100
+        }
+        
+        refs = {}
+        def document(doc_id):
+            ref = refs.setdefault(doc_id, MagicMock(name=doc_id))
+            ref.get.return_value = {
+                'meal_123': record_snapshot,
+                'customer_123_2026-01-03': old_rollup,
+                'customer_123_2026-01-04': new_rollup,
+                'customer_123': MagicMock(),  # advice_fingerprints
+            }[doc_id]
+            return ref
+        mock_db.collection.return_value.document.side_effect = document
+        mock_transaction = mock_db.transaction.return_value
+
+        meal_service.update_meal_record('meal_123', {'date': '2026-01-04'})
+
+        # 旧日付は0件になるので削除、新日付に加算
+        mock_transaction.delete.assert_called_once_with(refs['customer_123_2026-01-03'])
+        rollup_ref, rollup = mock_transaction.set.call_args_list[0][0]
+        assert rollup_ref is refs['customer_123_2026-01-04']
+        assert rollup['meal_count'] == 3
+        assert rollup['total_calories'] == 1500
+        mock_transaction.update.assert_called_once_with(refs['meal_123'], {'date': '2026-01-04'})
+        mock_transaction.set.assert_any_call(refs['customer_123'], {'meal_updated_at': ANY}, merge=True)
 
     @patch('app.services.meal_service.get_db')
     def test_delete_meal_record(self, mock_get_db):
@@ -119,10 +188,23 @@ class TestMealService:
         mock_get_db.return_value = mock_db
         mock_doc_ref = MagicMock()
         mock_db.collection.return_value.document.return_value = mock_doc_ref
+        
+        # 記録・ロールアップとも同じスナップショットを返す（1日2件 → 1件）
+        mock_snapshot = MagicMock()
+        mock_snapshot.exists = True
+        mock_snapshot.to_dict.return_value = {
+            'customer_id': 'customer_123', 'date': '2026-01-04', 'meal_count': 2,
+            'total_calories': 500, 'total_protein': 30, 'total_fat': 10, 'total_carbs': 60
+        }
+        mock_doc_ref.get.return_value = mock_snapshot
+        mock_transaction = mock_db.transaction.return_value
 
         meal_service.delete_meal_record('meal_123')
 
-        mock_doc_ref.delete.assert_called_once()
+        mock_transaction.delete.assert_called_once_with(mock_doc_ref)
+        rollup = mock_transaction.set.call_args_list[0][0][1]
+        assert rollup['meal_count'] == 1
+        assert rollup['total_calories'] == 0
 
     @patch('app.services.meal_service.get_db')
     def test_get_daily_nutrition_summary(self, mock_get_db):
@@ -130,36 +212,118 @@ class TestMealService:
         mock_db = MagicMock()
         mock_get_db.return_value = mock_db
         
-        mock_doc1 = MagicMock()
-        mock_doc1.to_dict.return_value = {
-            'meal_type': 'breakfast',
-            'total_calories': 500,
-            'total_protein': 30,
-            'total_fat': 10,
-            'total_carbs': 60
-        }
-        
-        mock_doc2 = MagicMock()
-        mock_doc2.to_dict.return_value = {
-            'meal_type': 'lunch',
-            'total_calories': 700,
-            'total_protein': 40,
-            'total_fat': 20,
-            'total_carbs': 80
+        mock_doc = MagicMock()
+        mock_doc.exists = True
+        mock_doc.to_dict.return_value = {
+            'customer_id': 'customer_123',
+            'date': '2026-01-04',
+            'total_calories': 1200,
+            'total_protein': 70,
+            'total_fat': 30,
+            'total_carbs': 140,
+            'meal_count': 2
         }
-        
-        mock_query = MagicMock()
-        mock_query.stream.return_value = [mock_doc1, mock_doc2]
-        mock_db.collection.return_value.where.return_value.where.return_value = mock_query
+        mock_db.collection.return_value.document.return_value.get.return_value = mock_doc
 
         summary = meal_service.get_daily_nutrition_summary('customer_123', '2026-01-04')
 
+        mock_db.collection.assert_called_with('daily_nutrition')
+        mock_db.collection.return_value.document.assert_called_with('customer_123_2026-01-04')
         assert summary['total_calories'] == 1200
         assert summary['total_protein'] == 70
         assert summary['total_fat'] == 30
         assert summary['total_carbs'] == 140
         assert summary['meal_count'] == 2
 
+    @patch('app.services.meal_service.get_db')
+    def test_get_daily_nutrition_summary_no_records(self, mock_get_db):
+        """Test daily summary for a day without meals"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_db.collection.return_value.document.return_value.get.return_value.exists = False
+
+        summary = meal_service.get_daily_nutrition_summary('customer_123', '2026-01-05')
+
+        assert summary['total_calories'] == 0
+        assert summary['meal_count'] == 0
+
+    @patch('app.services.meal_service.get_db')
+    def test_get_daily_nutrition_range(self, mock_get_db):
+        """Test getting recent daily rollups"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        
+        mock_doc = MagicMock()
+        mock_doc.to_dict.return_value = {
+            'date': '2026-01-04', 'total_calories': 1800.04, 'total_protein': 120,
+            'total_fat': 50, 'total_carbs': 200, 'meal_count': 3
+        }
+        mock_order_by = mock_db.collection.return_value.where.return_value.order_by.return_value
+        mock_order_by.limit.return_value.stream.return_value = [mock_doc]
+
+        summaries = meal_service.get_daily_nutrition_range('customer_123', limit=7)
+
+        mock_order_by.limit.assert_called_once_with(7)
+        assert summaries == [{
+            'date': '2026-01-04', 'total_calories': 1800.0, 'total_protein': 120,
+            'total_fat': 50, 'total_carbs': 200, 'meal_count': 3
+        }]
+
+    @patch('app.services.meal_service.get_db')
+    def test_rebuild_daily_nutrition(self, mock_get_db):
+        """Test rebuilding daily rollups from raw meal records"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        
+        docs = []
+        for calories in (300, 500):
+            doc = MagicMock()
+            doc.to_dict.return_value = {
+                'customer_id': 'customer_123', 'date': '2026-01-04',
+                'total_calories': calories, 'total_protein': 10, 'total_fat': 5, 'total_carbs': 40
+            }
+            docs.append(doc)
+        mock_db.collection.return_value.where.return_value.stream.return_value = docs
+        mock_batch = mock_db.batch.return_value
+
+        count = meal_service.rebuild_daily_nutrition('customer_123')
+
+        assert count == 1
+        rollup = mock_batch.set.call_args_list[0][0][1]
+        assert rollup['total_calories'] == 800
+        assert rollup['meal_count'] == 2
+        # 集計した顧客をロールアップ作成済みとして記録
+        assert mock_batch.set.call_count == 2
+        mock_db.collection.assert_any_call('daily_nutrition_status')
+        mock_batch.commit.assert_called_once()
+
+    @patch('app.services.meal_service.rebuild_daily_nutrition')
+    @patch('app.services.meal_service.get_db')
+    def test_daily_nutrition_built_on_first_read(self, mock_get_db, mock_rebuild):
+        """Test that customers without rollups are aggregated from meal records once"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_db.collection.return_value.document.return_value.get.return_value.exists = False
+
+        meal_service.get_daily_nutrition_summary('customer_123', '2026-01-04')
+        meal_service.get_daily_nutrition_range('customer_123', limit=7)
+
+        # 2回目以降はプロセス内の記憶で判定し再集計しない
+        mock_rebuild.assert_called_once_with('customer_123')
+        mock_db.collection.assert_any_call('daily_nutrition_status')
+
+    @patch('app.services.meal_service.rebuild_daily_nutrition')
+    @patch('app.services.meal_service.get_db')
+    def test_daily_nutrition_not_rebuilt_when_ready(self, mock_get_db, mock_rebuild):
+        """Test that customers marked as rebuilt are read from rollups directly"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_db.collection.return_value.document.return_value.get.return_value.exists = True
+
+        meal_service.get_daily_nutrition_summary('customer_123', '2026-01-04')
+
+        mock_rebuild.assert_not_called()
+
     @patch('app.services.meal_service.get_db')
     def test_get_nutrition_goal_success(self, mock_get_db):
         """Test getting nutrition goal"""
@@ -216,7 +380,11 @@ class TestMealService:
 
         assert result['customer_id'] == 'customer_123'
         assert result['target_calories'] == 2500
-        mock_doc_ref.set.assert_called_once()
+        mock_batch = mock_db.batch.return_value
+        mock_batch.set.assert_any_call(mock_doc_ref, result)
+        # 食事アドバイスのキャッシュも無効化される
+        mock_batch.set.assert_any_call(mock_doc_ref, {'meal_updated_at': ANY}, merge=True)
+        mock_batch.commit.assert_called_once()
 
     @patch('app.services.meal_service.get_db')
     def test_add_meal_record_error_handling(self, mock_get_db):
@@ -253,19 +421,25 @@ class TestMealService:
         mock_query = MagicMock()
         mock_stream = MagicMock()
         mock_stream.__iter__ = MagicMock(return_value=iter([mock_doc]))
-        mock_query.order_by.return_value.limit.return_value.stream.return_value = mock_stream
+        mock_query.order_by.return_value.order_by.return_value.limit.return_value.stream.return_value = mock_stream
         mock_db.collection.return_value.where.return_value.where.return_value.where.return_value = mock_query
         
         records = meal_service.get_meal_records_by_customer('customer_123', start_date='2026-01-01', end_date='2026-01-03')
         
         assert isinstance(records, list)
+        assert records[0]['id'] == 'meal_001'
+        # 日付範囲はFirestoreの範囲フィルタとして渡される
+        mock_where = mock_db.collection.return_value.where
+        mock_where.return_value.where.assert_called_once_with('date', '>=', '2026-01-01')
+        mock_where.return_value.where.return_value.where.assert_called_once_with('date', '<=', '2026-01-03')
 
     @patch('app.services.meal_service.get_db')
     def test_update_meal_record_error_handling(self, mock_get_db):
         """Test error handling in meal record update"""
         mock_db = MagicMock()
         mock_get_db.return_value = mock_db
-        mock_db.collection.return_value.document.return_value.update.side_effect = Exception("Update error")
+        mock_db.collection.return_value.document.return_value.get.return_value.exists = False
+        mock_db.transaction.return_value.update.side_effect = Exception("Update error")
         
         try:
             meal_service.update_meal_record('meal_123', {'total_calories': 600})
@@ -277,7 +451,8 @@ class TestMealService:
         """Test error handling in meal record deletion"""
         mock_db = MagicMock()
         mock_get_db.return_value = mock_db
-        mock_db.collection.return_value.document.return_value.delete.side_effect = Exception("Delete error")
+        mock_db.collection.return_value.document.return_value.get.return_value.exists = False
+        mock_db.transaction.return_value.delete.side_effect = Exception("Delete error")
         
         try:
             meal_service.delete_meal_record('meal_123')
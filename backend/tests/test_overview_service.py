@@ -0,0 +1,97 @@
+"""Tests for overview_service.py"""
+import threading
+import pytest
+from unittest.mock import Mock, MagicMock, patch
+from app.services import overview_service
+
+
+class TestOverviewService:
+    """Test aggregated customer overview"""
+
+    @patch('app.services.overview_service.meal_service')
+    @patch('app.services.overview_service.training_service')
+    @patch('app.services.overview_service.weight_service')
+    @patch('app.services.overview_service.customer_service')
+    def test_get_customer_overview_success(self, mock_customer, mock_weight, mock_training, mock_meal):
+        """Test that all sections are fetched with the requested sizes"""
+        mock_customer.get_customer_by_id.return_value = ({'id': 'customer_123', 'name': 'テスト'}, None)
+        mock_weight.get_weight_history.return_value = [{'id': 'w1', 'weight': 70.0}]
+        mock_training.get_training_sessions_by_customer.return_value = [{'id': 's1'}]
+        mock_meal.get_meal_records_by_customer.return_value = [{'id': 'm1'}]
+        mock_meal.get_nutrition_goal.return_value = ({'target_calories': 2000}, None)
+
+        overview, error = overview_service.get_customer_overview(
+            'customer_123', weight_limit=5, training_limit=10, meal_limit=15
+        )
+
+        assert error is None
+        assert overview == {
+            'customer': {'id': 'customer_123', 'name': 'テスト'},
+            'weight_history': [{'id': 'w1', 'weight': 70.0}],
+            'training_sessions': [{'id': 's1'}],
+            'meal_records': [{'id': 'm1'}],
+            'nutrition_goal': {'target_calories': 2000}
+        }
+        mock_weight.get_weight_history.assert_called_once_with('customer_123', 5)
+        mock_training.get_training_sessions_by_customer.assert_called_once_with('customer_123', 10)
+        mock_meal.get_meal_records_by_customer.assert_called_once_with('customer_123', None, None, 15)
+
+    @patch('app.services.overview_service.meal_service')
+    @patch('app.services.overview_service.training_service')
+    @patch('app.services.overview_service.weight_service')
+    @patch('app.services.overview_service.customer_service')
+    def test_sections_fetched_concurrently(self, mock_customer, mock_weight, mock_training, mock_meal):
+        """Test that section queries run in parallel rather than one after another"""
+        barrier = threading.Barrier(5, timeout=5)
+
+        def wait_then(value):
+            def fn(*args):
+                barrier.wait()  # 5件すべてが同時に実行中でなければタイムアウトする
+                return value
+            return fn
+
+        mock_customer.get_customer_by_id.side_effect = wait_then(({'id': 'customer_123'}, None))
+        mock_weight.get_weight_history.side_effect = wait_then([])
+        mock_training.get_training_sessions_by_customer.side_effect = wait_then([])
+        mock_meal.get_meal_records_by_customer.side_effect = wait_then([])
+        mock_meal.get_nutrition_goal.side_effect = wait_then(({}, None))
+
+        overview, error = overview_service.get_customer_overview('customer_123')
+
+        assert error is None
+        assert overview['customer'] == {'id': 'customer_123'}
+
+    @patch('app.services.overview_service.meal_service')
+    @patch('app.services.overview_service.training_service')
+    @patch('app.services.overview_service.weight_service')
+    @patch('app.services.overview_service.customer_service')
+    def test_zero_limit_skips_section(self, mock_customer, mock_weight, mock_training, mock_meal):
+        """Test that a section with limit 0 is not queried"""
+        mock_customer.get_customer_by_id.return_value = ({'id': 'customer_123'}, None)
+        mock_meal.get_meal_records_by_customer.return_value = [{'id': 'm1'}]
+        mock_meal.get_nutrition_goal.return_value = ({}, None)
+
+        overview, error = overview_service.get_customer_overview(
+            'customer_123', weight_limit=0, training_limit=0
+        )
+
+        assert error is None
+        assert overview['weight_history'] == []
+        assert overview['training_sessions'] == []
+        assert overview['meal_records'] == [{'id': 'm1'}]
+        mock_weight.get_weight_history.assert_not_called()
+        mock_training.get_training_sessions_by_customer.assert_not_called()
+
+    @patch('app.services.overview_service.meal_service')
+    @patch('app.services.overview_service.training_service')
+    @patch('app.services.overview_service.weight_service')
+    @patch('app.services.overview_service.customer_service')
+    def test_customer_not_found(self, mock_customer, mock_weight, mock_training, mock_meal):
+        """Test that a missing customer returns an error"""
+        mock_customer.get_customer_by_id.return_value = (None, 'Customer not found')
+        mock_meal.get_nutrition_goal.return_value = ({}, None)
+
+        overview, error = overview_service.get_customer_overview('nonexistent')
+
+        assert overview is None
+        assert error == 'Customer not found'
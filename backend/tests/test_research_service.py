@@ -2,13 +2,37 @@
 import pytest
 from unittest.mock import Mock, MagicMock, patch
 from datetime import datetime
-from app.services import research_service
+from app.services import eutils_client, research_service
 
 
 class TestResearchService:
     """Test research service functions"""
 
-    @patch('app.services.research_service.requests.get')
+    def setup_method(self):
+        # 翻訳クライアントは共有されるため、テストごとに作り直す
+        research_service._translator = None
+        research_service._search_cache.clear()
+        eutils_client.reset_client()
+        # 論文ストア（Firestore）は空の状態にする
+        self.article_patcher = patch('app.services.research_service.article_service')
+        self.mock_article_service = self.article_patcher.start()
+        self.mock_article_service.get_articles.return_value = {}
+        # 共有キャッシュ（Firestore）は空、バックグラウンド更新は起動しない
+        self.db_patcher = patch('app.services.research_service.get_db')
+        self.mock_db = self.db_patcher.start().return_value
+        self.mock_db.collection.return_value.document.return_value.get.return_value.exists = False
+        self.refresher_patcher = patch('app.services.research_service.start_refresher')
+        self.refresher_patcher.start()
+
+    def teardown_method(self):
+        self.article_patcher.stop()
+        self.db_patcher.stop()
+        self.refresher_patcher.stop()
+        research_service.research_cache['data'] = None
+        research_service.research_cache['timestamp'] = None
+        research_service._translator = None
+
+    @patch('requests.Session.get')
     @patch('googletrans.Translator')
     def test_fetch_latest_research_success(self, mock_translator_class, mock_requests_get):
         """Test fetching latest research from PubMed"""
@@ -56,7 +80,7 @@ class TestResearchService:
         assert 'PubMed' in articles[0]['source']
         assert '12345' in articles[0]['url']
 
-    @patch('app.services.research_service.requests.get')
+    @patch('requests.Session.get')
     def test_fetch_latest_research_no_results(self, mock_requests_get):
         """Test fetching research with no results"""
         mock_response = MagicMock()
@@ -71,14 +95,14 @@ class TestResearchService:
         
         assert articles == []
 
-    @patch('app.services.research_service.requests.get')
+    @patch('requests.Session.get')
     def test_fetch_latest_research_error(self, mock_requests_get):
         """Test error handling in fetch"""
         mock_requests_get.side_effect = Exception("Network error")
         
-        articles = research_service.fetch_latest_research()
-        
-        assert articles == []
+        # 該当なし（空リスト）と区別するため、取得失敗は例外を送出
+        with pytest.raises(Exception, match='Network error'):
+            research_service.fetch_latest_research()
 
     @patch('app.services.research_service.fetch_latest_research')
     def test_get_cached_research_cache_hit(self, mock_fetch):
@@ -110,7 +134,7 @@ class TestResearchService:
         assert len(data['articles']) == 1
         mock_fetch.assert_called_once()
 
-    @patch('app.services.research_service.requests.get')
+    @patch('requests.Session.get')
     @patch('googletrans.Translator')
     def test_search_research_success(self, mock_translator_class, mock_requests_get):
         """Test searching research with Japanese query"""
@@ -150,9 +174,9 @@ class TestResearchService:
         assert result['count'] == 1
         assert len(result['results']) == 1
 
-    @patch('app.services.research_service.requests.get')
+    @patch('requests.Session.get')
     @patch('app.services.research_service.GEMINI_API_KEY', 'test_key')
-    @patch('app.services.research_service.genai.GenerativeModel')
+    @patch('app.services.research_service.gemini_client.generative_model')
     def test_get_research_summary_success(self, mock_model_class, mock_requests_get):
         """Test getting AI summary of research"""
         # Mock PubMed fetch
@@ -161,6 +185,7 @@ class TestResearchService:
 <PubmedArticleSet>
     <PubmedArticle>
         <MedlineCitation>
+            <PMID>12345</PMID>
             <Article>
                 <ArticleTitle>Test Title</ArticleTitle>
                 <Abstract>
@@ -193,7 +218,7 @@ class TestResearchService:
         assert summary is None
         assert 'not configured' in error
 
-    @patch('app.services.research_service.requests.get')
+    @patch('requests.Session.get')
     @patch('googletrans.Translator')
     def test_fetch_latest_research_translation_error(self, mock_translator_class, mock_requests_get):
         """Test handling translation errors"""
@@ -229,7 +254,7 @@ class TestResearchService:
         # Should still return articles with English titles
         assert len(articles) >= 0
 
-    @patch('app.services.research_service.requests.get')
+    @patch('requests.Session.get')
     def test_fetch_latest_research_invalid_response(self, mock_requests_get):
         """Test handling invalid API response"""
         mock_response = MagicMock()
@@ -240,7 +265,7 @@ class TestResearchService:
         
         assert articles == []
 
-    @patch('app.services.research_service.requests.get')
+    @patch('requests.Session.get')
     @patch('googletrans.Translator')
     def test_search_research_translation_retry(self, mock_translator_class, mock_requests_get):
         """Test translation retry mechanism"""
@@ -268,13 +293,17 @@ class TestResearchService:
         assert result['count'] == 0
         assert result['offset'] == 10
 
-    @patch('app.services.research_service.requests.get')
+    @patch('requests.Session.get')
     @patch('app.services.research_service.GEMINI_API_KEY', 'test_key')
-    @patch('app.services.research_service.genai.GenerativeModel')
+    @patch('app.services.research_service.gemini_client.generative_model')
     def test_get_research_summary_error_handling(self, mock_model_class, mock_requests_get):
         """Test error handling in summary generation"""
         mock_response = MagicMock()
-        mock_response.content = b'<?xml version="1.0"?><PubmedArticleSet></PubmedArticleSet>'
+        mock_response.content = (
+            b'<?xml version="1.0"?><PubmedArticleSet><PubmedArticle><MedlineCitation>'
+            b'<PMID>12345</PMID><Article><ArticleTitle>Test Title</ArticleTitle></Article>'
+            b'</MedlineCitation></PubmedArticle></PubmedArticleSet>'
+        )
         mock_requests_get.return_value = mock_response
         
         mock_model = MagicMock()
@@ -286,7 +315,7 @@ class TestResearchService:
         assert summary is None
         assert error == "AI error"
 
-    @patch('app.services.research_service.requests.get')
+    @patch('requests.Session.get')
     def test_search_research_error_handling(self, mock_requests_get):
         """Test error handling in research search"""
         mock_requests_get.side_effect = Exception("Network error")
@@ -310,3 +339,195 @@ class TestResearchService:
         assert data is None
         assert error == "Fetch error"
 
+
+    def test_translate_titles_retries_failures_only(self):
+        """Test batch title translation with the shared client, retrying only failed titles"""
+        mock_translator = MagicMock()
+        research_service._translator = mock_translator
+        calls = []
+
+        def translate(text, src, dest):
+            calls.append(text)
+            if text == 'Flaky Title' and calls.count(text) == 1:
+                raise Exception('Temporary error')
+            return MagicMock(text=f'訳: {text}')
+        mock_translator.translate.side_effect = translate
+
+        result = research_service.translate_titles({'1': 'First Title', '2': 'Flaky Title'})
+
+        assert result == {'1': '訳: First Title', '2': '訳: Flaky Title'}
+        assert calls.count('First Title') == 1
+        assert calls.count('Flaky Title') == 2
+
+    @patch('app.services.research_service.time.sleep')
+    def test_translate_query_retries_once_without_sleep(self, mock_sleep):
+        """Test query translation retries immediately and falls back to the original query"""
+        mock_translator = MagicMock()
+        research_service._translator = mock_translator
+        mock_translator.translate.side_effect = [Exception('Temporary error'), MagicMock(text='muscle training')]
+
+        assert research_service._translate_query('筋トレ') == 'muscle training'
+
+        mock_translator.translate.reset_mock()
+        mock_translator.translate.side_effect = Exception('Translation down')
+        assert research_service._translate_query('筋トレ') == '筋トレ'
+        assert mock_translator.translate.call_count == research_service.QUERY_TRANSLATION_ATTEMPTS
+        mock_sleep.assert_not_called()
+
+    @patch('app.services.research_service.translate_titles')
+    @patch('requests.Session.get')
+    def test_get_article_metadata_read_through(self, mock_requests_get, mock_translate_titles):
+        """Test that stored articles skip E-Summary and only new data is written back"""
+        self.mock_article_service.get_articles.return_value = {
+            '1': {'title': 'Known Title', 'title_ja': '既知のタイトル', 'authors': ['A'], 'pubdate': '2024'}
+        }
+        mock_summary_response = MagicMock()
+        mock_summary_response.json.return_value = {
+            'result': {'2': {'title': 'New Title.', 'authors': [{'name': 'B'}], 'pubdate': '2025 Jan'}}
+        }
+        mock_requests_get.return_value = mock_summary_response
+        mock_translate_titles.return_value = {'2': '新しいタイトル'}
+
+        articles = research_service.get_article_metadata(['1', '2', '3'])
+
+        # 未保存のPMIDのみE-Summaryで取得
+        assert mock_requests_get.call_args[1]['params']['id'] == '2,3'
+        mock_translate_titles.assert_called_once_with({'2': 'New Title'})
+        assert articles['1']['title_ja'] == '既知のタイトル'
+        assert articles['2'] == {'title': 'New Title', 'title_ja': '新しいタイトル', 'authors': ['B'], 'pubdate': '2025 Jan'}
+        assert '3' not in articles
+        self.mock_article_service.save_articles.assert_called_once_with({
+            '2': {'title': 'New Title', 'authors': ['B'], 'pubdate': '2025 Jan', 'title_ja': '新しいタイトル'}
+        })
+
+    @patch('requests.Session.get')
+    @patch('app.services.research_service.GEMINI_API_KEY', '')
+    @patch('app.services.research_service.gemini_client.generative_model')
+    def test_get_research_summary_from_store(self, mock_model_class, mock_requests_get):
+        """Test that a stored summary is returned without any upstream call"""
+        self.mock_article_service.get_articles.return_value = {
+            '12345': {'title': 'Stored Title', 'summary_ja': '保存済みの要約です'}
+        }
+
+        summary, error = research_service.get_research_summary('12345')
+
+        assert error is None
+        assert summary['summary'] == '保存済みの要約です'
+        assert summary['title'] == 'Stored Title'
+        mock_requests_get.assert_not_called()
+        mock_model_class.assert_not_called()
+
+    @patch('requests.Session.get')
+    @patch('app.services.research_service.GEMINI_API_KEY', 'test_key')
+    @patch('app.services.research_service.gemini_client.generative_model')
+    def test_get_research_summary_writes_back(self, mock_model_class, mock_requests_get):
+        """Test that a stored abstract skips E-Fetch and the summary is saved"""
+        self.mock_article_service.get_articles.return_value = {
+            '12345': {'title': 'Stored Title', 'abstract': 'Stored abstract'}
+        }
+        mock_model_class.return_value.generate_content.return_value = MagicMock(text=' 新しい要約 ')
+
+        summary, error = research_service.get_research_summary('12345')
+
+        assert error is None
+        assert summary['summary'] == '新しい要約'
+        mock_requests_get.assert_not_called()
+        self.mock_article_service.save_articles.assert_called_once_with({
+            '12345': {'abstract': 'Stored abstract', 'summary_ja': '新しい要約'}
+        })
+
+    @pytest.mark.parametrize('pmid', ['99999999', 'not-a-pmid'])
+    @patch('requests.Session.get')
+    @patch('app.services.research_service.GEMINI_API_KEY', 'test_key')
+    @patch('app.services.research_service.gemini_client.generative_model')
+    def test_get_research_summary_unknown_article(self, mock_model_class, mock_requests_get, pmid):
+        """Test that an unknown or invalid PMID is neither summarized nor saved"""
+        mock_requests_get.return_value = MagicMock(
+            content=b'<?xml version="1.0"?><PubmedArticleSet></PubmedArticleSet>'
+        )
+
+        summary, error = research_service.get_research_summary(pmid)
+
+        assert summary is None
+        assert error == 'Article not found'
+        mock_model_class.return_value.generate_content.assert_not_called()
+        self.mock_article_service.save_articles.assert_not_called()
+
+    @patch('app.services.research_service._search_pubmed')
+    def test_search_research_uses_result_cache(self, mock_search_pubmed):
+        """Test that repeated and equivalent queries are served from the cache"""
+        mock_search_pubmed.return_value = ({'results': [], 'count': 0, 'offset': 0}, None)
+
+        result1, error1 = research_service.search_research('タンパク質')
+        result2, error2 = research_service.search_research('  タンパク質 ')  # 空白違いも同じキー
+        result3, _ = research_service.search_research('タンパク質', offset=10)
+
+        assert error1 is None and error2 is None
+        assert result1 == result2
+        assert mock_search_pubmed.call_count == 2  # offset違いのみ再検索
+
+    @patch('app.services.research_service._search_pubmed')
+    def test_search_research_does_not_cache_errors(self, mock_search_pubmed):
+        """Test that failed searches are retried on the next request"""
+        mock_search_pubmed.side_effect = [(None, 'Network error'), ({'results': []}, None)]
+
+        assert research_service.search_research('test') == (None, 'Network error')
+        assert research_service.search_research('test') == ({'results': []}, None)
+
+    @patch('app.services.research_service.fetch_latest_research')
+    def test_get_cached_research_loads_shared_cache(self, mock_fetch):
+        """Test that a cold worker reads the shared cache instead of calling PubMed"""
+        research_service.research_cache['data'] = None
+        research_service.research_cache['timestamp'] = None
+        shared = self.mock_db.collection.return_value.document.return_value.get.return_value
+        shared.exists = True
+        shared.to_dict.return_value = {
+            'articles': [{'title': 'Shared Article'}],
+            'cached_at': datetime.now().isoformat(),
+            'refresh_lock_until': 0
+        }
+
+        data, error = research_service.get_cached_research()
+
+        assert error is None
+        assert data['articles'][0]['title'] == 'Shared Article'
+        mock_fetch.assert_not_called()
+
+    @patch('app.services.research_service.fetch_latest_research')
+    def test_refresh_research_cache_skipped_when_locked(self, mock_fetch):
+        """Test that only the worker holding the refresh lock calls PubMed"""
+        import time
+        shared = self.mock_db.collection.return_value.document.return_value.get.return_value
+        shared.exists = True
+        shared.to_dict.return_value = {'refresh_lock_until': time.time() + 60}
+
+        research_service.refresh_research_cache()
+
+        mock_fetch.assert_not_called()
+
+    @patch('app.services.research_service.fetch_latest_research')
+    def test_refresh_research_cache_updates_shared_cache(self, mock_fetch):
+        """Test that the lock holder writes fresh articles to memory and the shared cache"""
+        mock_fetch.return_value = [{'title': 'Fresh Article'}]
+        mock_ref = self.mock_db.collection.return_value.document.return_value
+
+        data = research_service.refresh_research_cache()
+
+        assert data['articles'] == [{'title': 'Fresh Article'}]
+        assert research_service.research_cache['data'] == data
+        self.mock_db.collection.assert_any_call('research_cache')
+        mock_ref.set.assert_called_with({**data, 'refresh_lock_until': 0})
+
+    @patch('app.services.research_service.fetch_latest_research')
+    def test_refresh_research_cache_failure_keeps_articles(self, mock_fetch):
+        """Test that a failed fetch keeps the previous articles and only releases the lock"""
+        previous = {'articles': [{'title': 'Previous Article'}], 'cached_at': '2026-01-01T00:00:00'}
+        research_service._set_memory_cache(previous)
+        mock_fetch.side_effect = ConnectionError('NCBI unavailable')
+        mock_ref = self.mock_db.collection.return_value.document.return_value
+
+        with pytest.raises(ConnectionError):
+            research_service.refresh_research_cache()
+
+        assert research_service.research_cache['data'] == previous
+        mock_ref.set.assert_called_once_with({'refresh_lock_until': 0}, merge=True)
@@ -1,33 +1,117 @@
 """Tests for training_service.py"""
 import pytest
-from unittest.mock import Mock, MagicMock, patch
+from unittest.mock import Mock, MagicMock, patch, ANY
 from app.services import training_service
 
 
 class TestTrainingService:
     """Test training service functions"""
 
+    @pytest.fixture(autouse=True)
+    def reset_exercise_catalog(self):
+        """種目カタログのスナップショットをテストごとに破棄"""
+        training_service.invalidate_exercise_catalog()
+        yield
+        training_service.invalidate_exercise_catalog()
+
+    @staticmethod
+    def _mock_catalog_db(mock_get_db, custom_docs, state):
+        """カスタム種目と版番号ドキュメントを返すFirestoreモック"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_db.collection.return_value.stream.return_value = custom_docs
+        mock_state = MagicMock()
+        mock_state.exists = state is not None
+        mock_state.to_dict.return_value = state
+        mock_db.collection.return_value.document.return_value.get.return_value = mock_state
+        return mock_db
+
     @patch('app.services.training_service.get_db')
     def test_get_exercise_presets(self, mock_get_db):
         """Test getting exercise presets"""
         # Setup mocks
-        mock_db = MagicMock()
-        mock_get_db.return_value = mock_db
-        
         mock_doc1 = MagicMock()
         mock_doc1.id = 'custom_ex_001'
         mock_doc1.to_dict.return_value = {'id': 'custom_ex_001', 'name': 'カスタムベンチ', 'category': '胸'}
-        
-        mock_db.collection.return_value.stream.return_value = [mock_doc1]
+        self._mock_catalog_db(mock_get_db, [mock_doc1], None)
 
         # Execute
         presets = training_service.get_exercise_presets()
 
-        # Assert - デフォルトプリセット + カスタム1件
-        assert len(presets) >= 1  # カスタム1件は最低含まれる
-        # カスタム種目が含まれているか確認
-        custom_found = any(p['id'] == 'custom_ex_001' for p in presets)
-        assert custom_found
+        # Assert - デフォルトプリセット + カスタム1件（カスタムが先頭）
+        assert len(presets) == len(training_service.EXERCISE_PRESETS) + 1
+        assert presets[0]['id'] == 'custom_ex_001'
+
+    @patch('app.services.training_service.get_db')
+    def test_get_exercise_presets_custom_overrides_default(self, mock_get_db):
+        """Test that a custom document with a default id replaces the default entry"""
+        mock_doc = MagicMock()
+        mock_doc.id = 'squat'
+        mock_doc.to_dict.return_value = {'name': 'スクワット（フリー）', 'category': 'legs', 'unit': 'kg'}
+        self._mock_catalog_db(mock_get_db, [mock_doc], None)
+
+        presets = training_service.get_exercise_presets()
+
+        squats = [p for p in presets if p['id'] == 'squat']
+        assert len(presets) == len(training_service.EXERCISE_PRESETS)
+        assert squats == [{'id': 'squat', 'name': 'スクワット（フリー）', 'category': 'legs', 'unit': 'kg'}]
+
+    @patch('app.services.training_service.get_db')
+    def test_exercise_catalog_snapshot_reused(self, mock_get_db):
+        """Test that the snapshot is reused and only rebuilt when the version changes"""
+        mock_db = self._mock_catalog_db(mock_get_db, [], {'version': 3})
+
+        first = training_service.get_exercise_catalog()
+        second = training_service.get_exercise_catalog()
+
+        # 確認間隔内はFirestoreを読まない
+        assert second is first
+        assert first['version'] == 3
+        mock_db.collection.return_value.stream.assert_called_once()
+
+        # 確認間隔を過ぎても版が同じなら作り直さない
+        with patch('app.services.training_service.CATALOG_CHECK_SECONDS', 0):
+            assert training_service.get_exercise_catalog() is first
+            mock_db.collection.return_value.stream.assert_called_once()
+
+            # 版が進んでいれば作り直す
+            mock_db.collection.return_value.document.return_value.get.return_value.to_dict.return_value = {'version': 4}
+            rebuilt = training_service.get_exercise_catalog()
+
+        assert rebuilt['version'] == 4
+        assert mock_db.collection.return_value.stream.call_count == 2
+
+    @patch('app.services.training_service.get_db')
+    def test_get_exercise_preset_changes(self, mock_get_db):
+        """Test fetching only the changes since a client's version"""
+        mock_old = MagicMock()
+        mock_old.id = 'custom_old'
+        mock_old.to_dict.return_value = {'name': '古い種目', 'category': 'back', 'unit': 'kg', 'version': 2}
+        mock_new = MagicMock()
+        mock_new.id = 'custom_new'
+        mock_new.to_dict.return_value = {'name': '新しい種目', 'category': 'back', 'unit': 'kg', 'version': 5}
+        self._mock_catalog_db(mock_get_db, [mock_old, mock_new], {
+            'version': 6,
+            'deleted': [{'id': 'custom_a', 'version': 3}, {'id': 'custom_b', 'version': 6}],
+            'history_from': 1
+        })
+
+        changes = training_service.get_exercise_preset_changes(4)
+
+        assert changes['version'] == 6
+        assert changes['full'] is False
+        assert [p['id'] for p in changes['presets']] == ['custom_new']
+        assert changes['deleted'] == ['custom_b']
+
+        # 最新の版なら変更なし
+        assert training_service.get_exercise_preset_changes(6) == {
+            'version': 6, 'full': False, 'presets': [], 'deleted': []
+        }
+
+        # 削除履歴が残っていない版からは全件
+        full = training_service.get_exercise_preset_changes(0)
+        assert full['full'] is True
+        assert len(full['presets']) == len(training_service.EXERCISE_PRESETS) + 2
 
     @patch('app.services.training_service.get_db')
     def test_add_exercise_preset(self, mock_get_db):
@@ -38,14 +122,23 @@ class TestTrainingService:
         mock_doc_ref = MagicMock()
         mock_doc_ref.id = 'ex_new'
         mock_db.collection.return_value.document.return_value = mock_doc_ref
+        mock_state = MagicMock()
+        mock_state.exists = True
+        mock_state.to_dict.return_value = {'version': 7}
+        mock_doc_ref.get.return_value = mock_state
+        mock_transaction = mock_db.transaction.return_value
 
         # Execute
         exercise_id, error = training_service.add_exercise_preset('カスタム種目', '背中')
 
-        # Assert
+        # Assert - 種目と版番号を同じトランザクションで書き込む
         assert exercise_id == 'ex_new'
         assert error is None
-        mock_doc_ref.set.assert_called_once()
+        assert mock_transaction.set.call_count == 2
+        preset = mock_transaction.set.call_args_list[0][0][1]
+        assert preset['name'] == 'カスタム種目'
+        assert preset['version'] == 8
+        assert mock_transaction.set.call_args_list[1][0][1] == {'version': 8}
 
     @patch('app.services.training_service.get_db')
     def test_add_training_session_success(self, mock_get_db, sample_training_session):
@@ -63,7 +156,12 @@ class TestTrainingService:
         # Assert
         assert session_id == 'session_123'
         assert error is None
-        mock_doc_ref.set.assert_called_once()
+        # セッション登録とアドバイスキャッシュ無効化を1つのバッチで書き込む
+        mock_batch = mock_db.batch.return_value
+        assert mock_batch.set.call_count == 2
+        assert mock_batch.set.call_args_list[0][0][0] is mock_doc_ref
+        assert 'training_updated_at' in mock_batch.set.call_args_list[1][0][1]
+        mock_batch.commit.assert_called_once()
 
     @patch('app.services.training_service.get_db')
     def test_add_training_session_missing_fields(self, mock_get_db):
@@ -90,10 +188,10 @@ class TestTrainingService:
             'exercises': [{'exercise_name': 'ベンチプレス'}]
         }
         
-        # where().stream()のチェーン修正
-        mock_where = MagicMock()
-        mock_where.stream.return_value = [mock_doc1]
-        mock_db.collection.return_value.where.return_value = mock_where
+        # where().order_by().limit().stream()のチェーン
+        mock_order_by = MagicMock()
+        mock_order_by.limit.return_value.stream.return_value = [mock_doc1]
+        mock_db.collection.return_value.where.return_value.order_by.return_value = mock_order_by
 
         # Execute
         sessions = training_service.get_training_sessions_by_customer('customer_123', limit=10)
@@ -101,6 +199,84 @@ class TestTrainingService:
         # Assert
         assert len(sessions) == 1
         assert sessions[0]['id'] == 'session_1'
+        mock_order_by.limit.assert_called_once_with(10)
+
+    @patch('app.services.training_service.get_db')
+    def test_get_training_sessions_page_cursor(self, mock_get_db):
+        """Test paging training sessions with an opaque cursor"""
+        # Setup mocks
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        
+        mock_doc1 = MagicMock()
+        mock_doc1.id = 'session_1'
+        mock_doc1.to_dict.return_value = {'date': '2026-01-02', 'exercises': []}
+        mock_doc2 = MagicMock()
+        mock_doc2.id = 'session_2'
+        mock_doc2.to_dict.return_value = {'date': '2026-01-01', 'exercises': []}
+        
+        mock_order_by = MagicMock()
+        mock_order_by.limit.return_value.stream.return_value = [mock_doc1, mock_doc2]
+        mock_db.collection.return_value.where.return_value.order_by.return_value = mock_order_by
+
+        # Execute - 1ページ目（limit件ちょうど取得できたので次ページあり）
+        sessions, next_cursor = training_service.get_training_sessions_page('customer_123', limit=2)
+
+        # Assert
+        assert [s['id'] for s in sessions] == ['session_1', 'session_2']
+        assert next_cursor is not None
+        assert next_cursor != 'session_2'  # IDをそのまま露出しない
+        
+        # Execute - 2ページ目（カーソルのドキュメントから再開）
+        mock_cursor_doc = MagicMock()
+        mock_cursor_doc.exists = True
+        mock_cursor_doc.to_dict.return_value = {'customer_id': 'customer_123', 'date': '2026-01-01'}
+        mock_db.collection.return_value.document.return_value.get.return_value = mock_cursor_doc
+        mock_order_by.start_after.return_value.limit.return_value.stream.return_value = []
+        
+        sessions, next_cursor = training_service.get_training_sessions_page('customer_123', limit=2, cursor=next_cursor)
+        
+        # Assert
+        mock_db.collection.return_value.document.assert_called_with('session_2')
+        mock_order_by.start_after.assert_called_once_with(mock_cursor_doc)
+        assert sessions == []
+        assert next_cursor is None
+
+    @pytest.mark.parametrize('exists,owner', [(False, None), (True, 'customer_other')])
+    @patch('app.services.training_service.get_db')
+    def test_get_training_sessions_page_invalid_cursor(self, mock_get_db, exists, owner):
+        """Test that a deleted or foreign cursor session raises instead of returning the first page"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_cursor_doc = MagicMock()
+        mock_cursor_doc.exists = exists
+        mock_cursor_doc.to_dict.return_value = {'customer_id': owner}
+        mock_db.collection.return_value.document.return_value.get.return_value = mock_cursor_doc
+
+        with pytest.raises(training_service.firestore_client.InvalidCursorError):
+            training_service.get_training_sessions_page(
+                'customer_123', limit=2, cursor=training_service._encode_cursor('session_2')
+            )
+
+        mock_db.collection.return_value.where.return_value.order_by.return_value.limit.assert_not_called()
+
+    @patch('app.services.training_service._decode_cursor', return_value=None)
+    @patch('app.services.training_service.get_db')
+    def test_get_training_sessions_page_undecodable_cursor(self, mock_get_db, mock_decode):
+        """Test that a cursor that cannot be decoded raises without a document lookup"""
+        with pytest.raises(training_service.firestore_client.InvalidCursorError):
+            training_service.get_training_sessions_page('customer_123', cursor='broken')
+
+        mock_get_db.return_value.collection.return_value.document.assert_not_called()
+
+    @pytest.mark.parametrize('cursor', ['YS9i', training_service._encode_cursor('..')])
+    @patch('app.services.training_service.get_db')
+    def test_get_training_sessions_page_cursor_not_document_id(self, mock_get_db, cursor):
+        """Test that a cursor decoding to an invalid document ID (e.g. "a/b") raises InvalidCursorError"""
+        with pytest.raises(training_service.firestore_client.InvalidCursorError):
+            training_service.get_training_sessions_page('customer_123', cursor=cursor)
+
+        mock_get_db.return_value.collection.return_value.document.assert_not_called()
 
     @patch('app.services.training_service.get_db')
     def test_get_training_session_by_id_success(self, mock_get_db):
@@ -146,6 +322,7 @@ class TestTrainingService:
         mock_db = MagicMock()
         mock_get_db.return_value = mock_db
         mock_doc_ref = MagicMock()
+        mock_doc_ref.get.return_value.to_dict.return_value = {'customer_id': 'customer_123'}
         mock_db.collection.return_value.document.return_value = mock_doc_ref
 
         # Execute
@@ -153,7 +330,11 @@ class TestTrainingService:
         training_service.update_training_session('session_123', update_data)
 
         # Assert
-        mock_doc_ref.update.assert_called_once_with(update_data)
+        mock_batch = mock_db.batch.return_value
+        mock_batch.update.assert_called_once_with(mock_doc_ref, update_data)
+        mock_db.collection.assert_any_call('advice_fingerprints')
+        mock_batch.set.assert_called_once_with(mock_doc_ref, {'training_updated_at': ANY}, merge=True)
+        mock_batch.commit.assert_called_once()
 
     @patch('app.services.training_service.get_db')
     def test_delete_training_session(self, mock_get_db):
@@ -164,11 +345,16 @@ class TestTrainingService:
         mock_doc_ref = MagicMock()
         mock_db.collection.return_value.document.return_value = mock_doc_ref
 
+        mock_doc_ref.get.return_value.to_dict.return_value = {'customer_id': 'customer_123'}
+
         # Execute
         training_service.delete_training_session('session_123')
 
         # Assert
-        mock_doc_ref.delete.assert_called_once()
+        mock_batch = mock_db.batch.return_value
+        mock_batch.delete.assert_called_once_with(mock_doc_ref)
+        mock_batch.set.assert_called_once_with(mock_doc_ref, {'training_updated_at': ANY}, merge=True)
+        mock_batch.commit.assert_called_once()
 
     @patch('app.services.training_service.get_db')
     def test_delete_exercise_preset(self, mock_get_db):
@@ -177,14 +363,47 @@ class TestTrainingService:
         mock_db = MagicMock()
         mock_get_db.return_value = mock_db
         mock_doc_ref = MagicMock()
+        mock_doc_ref.id = 'ex_001'
         mock_db.collection.return_value.document.return_value = mock_doc_ref
+        mock_state = MagicMock()
+        mock_state.exists = True
+        mock_state.to_dict.return_value = {'version': 7, 'deleted': [], 'history_from': 0}
+        mock_doc_ref.get.return_value = mock_state
+        mock_transaction = mock_db.transaction.return_value
 
         # Execute
         error = training_service.delete_exercise_preset('ex_001')
 
-        # Assert
+        # Assert - 削除と削除履歴の追記を同じトランザクションで行う
         assert error is None
-        mock_doc_ref.delete.assert_called_once()
+        mock_transaction.delete.assert_called_once_with(mock_doc_ref)
+        mock_transaction.set.assert_called_once_with(mock_doc_ref, {
+            'version': 8,
+            'deleted': [{'id': 'ex_001', 'version': 8}],
+            'history_from': 0
+        }, merge=True)
+
+    @patch('app.services.training_service.get_db')
+    def test_delete_exercise_preset_trims_history(self, mock_get_db):
+        """Test that old deletions are dropped and history_from advances"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_doc_ref = MagicMock()
+        mock_doc_ref.id = 'ex_new'
+        mock_db.collection.return_value.document.return_value = mock_doc_ref
+        deleted = [{'id': f'ex_{i}', 'version': i} for i in range(1, training_service.CATALOG_TOMBSTONE_LIMIT + 1)]
+        mock_state = MagicMock()
+        mock_state.exists = True
+        mock_state.to_dict.return_value = {'version': len(deleted), 'deleted': deleted, 'history_from': 0}
+        mock_doc_ref.get.return_value = mock_state
+
+        error = training_service.delete_exercise_preset('ex_new')
+
+        state = mock_db.transaction.return_value.set.call_args[0][1]
+        assert error is None
+        assert len(state['deleted']) == training_service.CATALOG_TOMBSTONE_LIMIT
+        assert state['deleted'][-1] == {'id': 'ex_new', 'version': len(deleted) + 1}
+        assert state['history_from'] == 1
 
     @patch('app.services.training_service.get_db')
     def test_get_exercise_history(self, mock_get_db):
@@ -211,10 +430,10 @@ class TestTrainingService:
             ]
         }
         
-        # where().stream()のチェーン修正
+        # where().where(array_contains).order_by().limit().stream()のチェーン
         mock_where = MagicMock()
-        mock_where.stream.return_value = [mock_session]
-        mock_db.collection.return_value.where.return_value = mock_where
+        mock_where.order_by.return_value.limit.return_value.stream.return_value = [mock_session]
+        mock_db.collection.return_value.where.return_value.where.return_value = mock_where
 
         # Execute
         history = training_service.get_exercise_history('customer_123', 'ex_001', limit=10)
@@ -223,6 +442,63 @@ class TestTrainingService:
         assert len(history) == 1
         assert history[0]['date'] == '2026-01-01'
         assert history[0]['exercise']['exercise_name'] == 'ベンチプレス'
+        assert history[0]['session_id'] == 'session_1'
+        mock_db.collection.return_value.where.return_value.where.assert_called_once_with(
+            'exercise_ids', 'array_contains', 'ex_001'
+        )
+        mock_where.order_by.return_value.limit.assert_called_once_with(10)
+
+    @patch('app.services.training_service.get_db')
+    def test_add_training_session_stores_exercise_ids(self, mock_get_db, sample_training_session):
+        """Test that exercise_ids index is stored with a new session"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_doc_ref = MagicMock()
+        mock_doc_ref.id = 'session_123'
+        mock_db.collection.return_value.document.return_value = mock_doc_ref
+
+        training_service.add_training_session(sample_training_session)
+
+        call_data = mock_db.batch.return_value.set.call_args_list[0][0][1]
+        assert call_data['exercise_ids'] == ['ex_001']
+
+    @patch('app.services.training_service.get_db')
+    def test_update_training_session_refreshes_exercise_ids(self, mock_get_db):
+        """Test that updating exercises recomputes exercise_ids"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_doc_ref = MagicMock()
+        mock_db.collection.return_value.document.return_value = mock_doc_ref
+
+        training_service.update_training_session('session_123', {
+            'exercises': [
+                {'exercise_id': 'squat', 'sets': []},
+                {'exercise_id': 'deadlift', 'sets': []},
+                {'exercise_id': 'squat', 'sets': []}
+            ]
+        })
+
+        call_data = mock_db.batch.return_value.update.call_args[0][1]
+        assert call_data['exercise_ids'] == ['squat', 'deadlift']
+
+    @patch('app.services.training_service.get_db')
+    def test_backfill_exercise_ids(self, mock_get_db):
+        """Test backfilling exercise_ids on legacy sessions"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        
+        legacy_doc = MagicMock()
+        legacy_doc.to_dict.return_value = {'exercises': [{'exercise_id': 'bench_press'}]}
+        indexed_doc = MagicMock()
+        indexed_doc.to_dict.return_value = {'exercises': [], 'exercise_ids': []}
+        mock_db.collection.return_value.stream.return_value = [legacy_doc, indexed_doc]
+        mock_batch = mock_db.batch.return_value
+
+        updated = training_service.backfill_exercise_ids()
+
+        assert updated == 1
+        mock_batch.update.assert_called_once_with(legacy_doc.reference, {'exercise_ids': ['bench_press']})
+        mock_batch.commit.assert_called_once()
 
     @patch('app.services.training_service.get_db')
     def test_add_training_session_error_handling(self, mock_get_db):
@@ -282,7 +558,7 @@ class TestTrainingService:
         """Test error handling in exercise preset deletion"""
         mock_db = MagicMock()
         mock_get_db.return_value = mock_db
-        mock_db.collection.return_value.document.return_value.delete.side_effect = Exception("Delete preset error")
+        mock_db.transaction.return_value.delete.side_effect = Exception("Delete preset error")
         
         error = training_service.delete_exercise_preset('ex_001')
         
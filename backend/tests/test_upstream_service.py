@@ -0,0 +1,135 @@
+"""Tests for upstream_service.py"""
+import pytest
+import threading
+import time
+from unittest.mock import Mock, MagicMock, patch
+from app.services import upstream_service
+
+
+class TestUpstreamService:
+    """Test per-upstream concurrency limits and timeouts"""
+
+    def test_call_returns_result(self):
+        """Test calling an upstream function"""
+        upstream = upstream_service.Upstream('test', concurrency=2, timeout=5)
+        fn = Mock(return_value='ok')
+
+        result = upstream.call(fn, 'arg', key='value')
+
+        assert result == 'ok'
+        fn.assert_called_once_with('arg', key='value')
+        assert upstream.stats()['calls'] == 1
+
+    def test_call_propagates_errors(self):
+        """Test that upstream errors are raised to the caller"""
+        upstream = upstream_service.Upstream('test', concurrency=1, timeout=5)
+
+        with pytest.raises(ValueError):
+            upstream.call(Mock(side_effect=ValueError('bad response')))
+
+        assert upstream.stats()['errors'] == 1
+        assert upstream.stats()['in_flight'] == 0
+
+    def test_call_timeout_releases_caller(self):
+        """Test that a slow upstream raises UpstreamTimeout instead of blocking"""
+        upstream = upstream_service.Upstream('test', concurrency=1, timeout=0.05)
+        release = threading.Event()
+
+        with pytest.raises(upstream_service.UpstreamTimeout):
+            upstream.call(lambda: release.wait(timeout=5))
+
+        assert upstream.stats()['timeouts'] == 1
+        release.set()
+
+    def test_concurrency_limit(self):
+        """Test that at most `concurrency` calls run at the same time"""
+        upstream = upstream_service.Upstream('test', concurrency=2, timeout=5)
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def slow_fn():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+            return 'done'
+
+        futures = [upstream.submit(slow_fn) for _ in range(5)]
+        results = [upstream.result(f) for f in futures]
+
+        assert results == ['done'] * 5
+        assert max(peak) == 2
+
+    def test_stream_holds_slot_until_last_chunk(self):
+        """Test that streamed chunks are read inside the upstream's concurrency slot"""
+        upstream = upstream_service.Upstream('test', concurrency=1, timeout=5)
+        release = threading.Event()
+
+        def slow_chunks():
+            yield 'a'
+            release.wait(timeout=5)
+            yield 'b'
+
+        chunks = upstream.stream(lambda: slow_chunks())
+        assert next(chunks) == 'a'
+        # 受信中は枠を占有している（同時実行数1のため次の呼び出しは待たされる）
+        assert upstream.stats()['in_flight'] == 1
+        waiting = upstream.submit(lambda: 'next')
+        time.sleep(0.05)
+        assert not waiting.done()
+
+        release.set()
+        assert list(chunks) == ['b']
+        assert upstream.result(waiting) == 'next'
+
+    def test_stream_start_error_raised(self):
+        """Test that an error before the first chunk is raised by stream itself"""
+        upstream = upstream_service.Upstream('test', concurrency=1, timeout=5)
+
+        with pytest.raises(ValueError):
+            upstream.stream(Mock(side_effect=ValueError('auth error')))
+
+    def test_stream_chunk_timeout(self):
+        """Test that a stalled stream raises UpstreamTimeout and frees the slot at the next chunk"""
+        upstream = upstream_service.Upstream('test', concurrency=1, timeout=0.05)
+        release = threading.Event()
+
+        def stalled_chunks():
+            yield 'a'
+            release.wait(timeout=5)
+            yield 'b'
+            yield 'c'
+
+        chunks = upstream.stream(lambda: stalled_chunks())
+        assert next(chunks) == 'a'
+        with pytest.raises(upstream_service.UpstreamTimeout):
+            next(chunks)
+        assert upstream.stats()['timeouts'] == 1
+
+        # 受信側が打ち切ったので、次の断片で読み込みを止めて枠を解放する
+        release.set()
+        assert upstream.call(lambda: 'free') == 'free'
+
+    def test_stream_overall_deadline(self):
+        """Test that a stream that keeps trickling is stopped at stream_timeout"""
+        upstream = upstream_service.Upstream('test', concurrency=1, timeout=1, stream_timeout=0.1)
+
+        def endless_chunks():
+            while True:
+                time.sleep(0.02)
+                yield 'x'
+
+        with pytest.raises(upstream_service.UpstreamTimeout):
+            for _ in upstream.stream(lambda: endless_chunks()):
+                pass
+
+    def test_module_level_upstreams(self):
+        """Test configured upstreams and stats"""
+        assert upstream_service.call('translate', lambda text: text.upper(), 'hello') == 'HELLO'
+
+        stats = upstream_service.get_all_stats()
+        assert set(stats) == {'gemini', 'pubmed', 'translate'}
+        assert stats['translate']['concurrency'] > 0
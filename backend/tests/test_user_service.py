@@ -246,6 +246,20 @@ class TestUserService:
         # Assert - should create 2 users (admin + user)
         assert mock_doc_ref.set.call_count == 2
 
+    @patch('app.services.user_service.initialize_default_users')
+    def test_ensure_default_users_runs_once(self, mock_initialize):
+        """Test that default users are seeded on first use only, retrying after a failure"""
+        user_service._default_users_ready = False
+        mock_initialize.side_effect = [False, True]
+
+        user_service.ensure_default_users()  # 失敗 → 次回再試行
+        user_service.ensure_default_users()
+        user_service.ensure_default_users()
+
+        assert mock_initialize.call_count == 2
+        assert user_service._default_users_ready is True
+        user_service._default_users_ready = False
+
     @patch('app.services.user_service._get_db')
     def test_update_user_with_password_change(self, mock_get_db):
         """Test updating user with password change"""
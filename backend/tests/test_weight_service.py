@@ -30,22 +30,80 @@ class TestWeightService:
             'note': 'テスト記録2'
         }
         
-        # クエリチェーンの修正: where().stream()
-        mock_collection = MagicMock()
-        mock_where = MagicMock()
-        mock_where.stream.return_value = [mock_doc1, mock_doc2]
-        mock_collection.where.return_value = mock_where
-        mock_db.collection.return_value = mock_collection
+        # クエリチェーン: where().order_by().limit().stream()（Firestore側でソート済み）
+        mock_order_by = MagicMock()
+        mock_order_by.limit.return_value.stream.return_value = [mock_doc2, mock_doc1]
+        mock_db.collection.return_value.where.return_value.order_by.return_value = mock_order_by
 
         # Execute
         history = weight_service.get_weight_history('customer_123', limit=10)
 
         # Assert
         assert len(history) == 2
-        assert history[0]['id'] == 'weight_2'  # 新しい順にソート
+        assert history[0]['id'] == 'weight_2'  # 新しい順
         assert history[0]['weight'] == 69.8
         assert history[1]['id'] == 'weight_1'
         assert history[1]['weight'] == 70.5
+        mock_order_by.limit.assert_called_once_with(10)
+        mock_order_by.start_after.assert_not_called()
+
+    @patch('app.services.weight_service.get_db')
+    def test_get_weight_history_start_after(self, mock_get_db):
+        """Test paging weight history from a cursor record"""
+        # Setup mocks
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        
+        mock_cursor_doc = MagicMock()
+        mock_cursor_doc.exists = True
+        mock_cursor_doc.to_dict.return_value = {'customer_id': 'customer_123', 'weight': 70.5}
+        mock_db.collection.return_value.document.return_value.get.return_value = mock_cursor_doc
+        
+        mock_doc = MagicMock()
+        mock_doc.id = 'weight_older'
+        mock_doc.to_dict.return_value = {'weight': 71.0, 'recorded_at': '2025-12-31T10:00:00'}
+        
+        mock_order_by = MagicMock()
+        mock_order_by.start_after.return_value.limit.return_value.stream.return_value = [mock_doc]
+        mock_db.collection.return_value.where.return_value.order_by.return_value = mock_order_by
+
+        # Execute
+        history = weight_service.get_weight_history('customer_123', limit=5, start_after='weight_1')
+
+        # Assert
+        mock_db.collection.return_value.document.assert_called_once_with('weight_1')
+        mock_order_by.start_after.assert_called_once_with(mock_cursor_doc)
+        mock_order_by.start_after.return_value.limit.assert_called_once_with(5)
+        assert len(history) == 1
+        assert history[0]['id'] == 'weight_older'
+
+    @pytest.mark.parametrize('exists,owner', [(False, None), (True, 'customer_other')])
+    @patch('app.services.weight_service.get_db')
+    def test_get_weight_history_invalid_cursor(self, mock_get_db, exists, owner):
+        """Test that a missing or foreign cursor record raises instead of restarting from the top"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_cursor_doc = MagicMock()
+        mock_cursor_doc.exists = exists
+        mock_cursor_doc.to_dict.return_value = {'customer_id': owner}
+        mock_db.collection.return_value.document.return_value.get.return_value = mock_cursor_doc
+
+        with pytest.raises(weight_service.firestore_client.InvalidCursorError):
+            weight_service.get_weight_history('customer_123', limit=5, start_after='weight_1')
+
+        mock_db.collection.return_value.where.return_value.order_by.return_value.limit.assert_not_called()
+
+    @pytest.mark.parametrize('start_after', ['a/b', '..', '__id__'])
+    @patch('app.services.weight_service.get_db')
+    def test_get_weight_history_malformed_cursor(self, mock_get_db, start_after):
+        """Test that a cursor which is not a valid document ID is rejected before document()"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+
+        with pytest.raises(weight_service.firestore_client.InvalidCursorError):
+            weight_service.get_weight_history('customer_123', limit=5, start_after=start_after)
+
+        mock_db.collection.return_value.document.assert_not_called()
 
     @patch('app.services.weight_service.get_db')
     def test_add_weight_record_with_timestamp(self, mock_get_db):
@@ -56,6 +114,15 @@ class TestWeightService:
         mock_doc_ref = MagicMock()
         mock_doc_ref.id = 'weight_new'
         mock_db.collection.return_value.document.return_value = mock_doc_ref
+        mock_summary = MagicMock()
+        mock_summary.exists = True
+        mock_summary.to_dict.return_value = {
+            'customer_id': 'customer_123',
+            'first': {'id': 'weight_1', 'weight': 75.0, 'recorded_at': '2026-01-01T09:00:00'},
+            'latest': [{'id': 'weight_1', 'weight': 75.0, 'recorded_at': '2026-01-01T09:00:00'}]
+        }
+        mock_doc_ref.get.return_value = mock_summary
+        mock_transaction = mock_db.transaction.return_value
 
         # Execute
         record_id = weight_service.add_weight_record(
@@ -65,15 +132,20 @@ class TestWeightService:
             'テストメモ'
         )
 
-        # Assert
+        # Assert - 体重記録とサマリーを同じトランザクションで書き込む
         assert record_id == 'weight_new'
-        mock_doc_ref.set.assert_called_once()
-        call_data = mock_doc_ref.set.call_args[0][0]
+        assert mock_transaction.set.call_count == 2
+        call_data = mock_transaction.set.call_args_list[0][0][1]
         assert call_data['customer_id'] == 'customer_123'
         assert call_data['weight'] == 72.5
         assert call_data['recorded_at'] == '2026-01-04T09:00:00'
         assert call_data['note'] == 'テストメモ'
 
+        summary = mock_transaction.set.call_args_list[1][0][1]
+        assert summary['first']['id'] == 'weight_1'
+        assert [r['id'] for r in summary['latest']] == ['weight_new', 'weight_1']
+        mock_transaction.update.assert_called_once_with(mock_doc_ref, {'weight': 72.5})
+
     @patch('app.services.weight_service.get_db')
     def test_add_weight_record_without_timestamp(self, mock_get_db):
         """Test adding weight record without timestamp (uses current time)"""
@@ -83,19 +155,167 @@ class TestWeightService:
         mock_doc_ref = MagicMock()
         mock_doc_ref.id = 'weight_new'
         mock_db.collection.return_value.document.return_value = mock_doc_ref
+        # サマリー未作成・体重履歴なし
+        mock_doc_ref.get.return_value.exists = False
+        mock_db.collection.return_value.where.return_value.order_by.return_value\
+            .limit.return_value.stream.return_value = []
+        mock_transaction = mock_db.transaction.return_value
 
         # Execute
         record_id = weight_service.add_weight_record('customer_123', 71.0)
 
         # Assert
         assert record_id == 'weight_new'
-        mock_doc_ref.set.assert_called_once()
-        call_data = mock_doc_ref.set.call_args[0][0]
+        call_data = mock_transaction.set.call_args_list[0][0][1]
         assert call_data['customer_id'] == 'customer_123'
         assert call_data['weight'] == 71.0
         assert 'recorded_at' in call_data  # Should have timestamp
         assert call_data['note'] == ''
 
+        summary = mock_transaction.set.call_args_list[1][0][1]
+        assert summary['first']['id'] == 'weight_new'
+        assert summary['latest'] == [summary['first']]
+
+    def test_merge_into_summary_keeps_newest(self):
+        """Test that the summary keeps the newest records and the oldest one as first"""
+        summary = {}
+        for i in range(weight_service.SUMMARY_SIZE + 2):
+            summary = weight_service._merge_into_summary(
+                summary, 'customer_123', f'weight_{i}',
+                {'weight': 70.0 + i, 'recorded_at': f'2026-01-{i + 1:02d}T09:00:00'}
+            )
+        # 過去日付の記録を後から追加
+        summary = weight_service._merge_into_summary(
+            summary, 'customer_123', 'weight_old', {'weight': 80.0, 'recorded_at': '2025-12-01T09:00:00'}
+        )
+
+        assert len(summary['latest']) == weight_service.SUMMARY_SIZE
+        assert summary['latest'][0]['id'] == f'weight_{weight_service.SUMMARY_SIZE + 1}'
+        assert summary['first']['id'] == 'weight_old'
+
+    @patch('app.services.weight_service.get_db')
+    def test_get_latest_weights(self, mock_get_db):
+        """Test batch retrieval of latest weights from summaries"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+
+        def summary_doc(customer_id, exists=True):
+            doc = MagicMock()
+            doc.id = customer_id
+            doc.exists = exists
+            doc.to_dict.return_value = {
+                'first': {'id': f'{customer_id}_w1', 'weight': 75.0, 'recorded_at': '2026-01-01T09:00:00'},
+                'latest': [
+                    {'id': f'{customer_id}_w3', 'weight': 73.0, 'recorded_at': '2026-01-03T09:00:00'},
+                    {'id': f'{customer_id}_w2', 'weight': 74.0, 'recorded_at': '2026-01-02T09:00:00'}
+                ]
+            }
+            return doc
+
+        customer_ids = [f'customer_{i}' for i in range(150)]
+        mock_db.collection.return_value.document.side_effect = lambda customer_id: Mock(id=customer_id)
+        mock_db.get_all.side_effect = lambda refs: [summary_doc(ref.id) for ref in refs]
+
+        # Execute
+        result = weight_service.get_latest_weights(customer_ids, limit=1)
+
+        # Assert - 150件を100件ずつ2回で取得、体重履歴へのクエリなし
+        assert mock_db.get_all.call_count == 2
+        mock_db.collection.return_value.where.assert_not_called()
+        assert len(result) == 150
+        assert result['customer_149']['first']['weight'] == 75.0
+        assert result['customer_0']['latest'] == [
+            {'id': 'customer_0_w3', 'weight': 73.0, 'recorded_at': '2026-01-03T09:00:00'}
+        ]
+
+    @pytest.mark.parametrize('has_history,customer_exists,saved', [
+        (True, True, True),
+        (False, True, False),   # 体重記録なし
+        (True, False, False),   # 存在しない顧客
+    ])
+    @patch('app.services.weight_service.get_db')
+    def test_get_latest_weights_without_summary(self, mock_get_db, has_history, customer_exists, saved):
+        """Test building a missing summary from history, saved only for real customers with records"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_db.get_all.return_value = []
+        collections = {'weight_summaries': MagicMock(), 'weight_history': MagicMock(), 'customer': MagicMock()}
+        mock_db.collection.side_effect = lambda name: collections[name]
+        collections['weight_summaries'].document.return_value.get.return_value.exists = False
+        collections['customer'].document.return_value.get.return_value.exists = customer_exists
+
+        mock_doc = MagicMock()
+        mock_doc.id = 'weight_1'
+        mock_doc.to_dict.return_value = {'weight': 70.0, 'recorded_at': '2026-01-01T09:00:00'}
+        collections['weight_history'].where.return_value.order_by.return_value\
+            .limit.return_value.stream.return_value = [mock_doc] if has_history else []
+
+        result = weight_service.get_latest_weights(['customer_123'], limit=5)
+
+        assert result['customer_123']['first'] == ({'id': 'weight_1', 'weight': 70.0, 'recorded_at': '2026-01-01T09:00:00'}
+                                                   if has_history else None)
+        # 作成したサマリーを保存し、次回以降は体重履歴を読まない
+        transaction = mock_db.transaction.return_value
+        assert transaction.set.called is saved
+        if saved:
+            saved_summary = transaction.set.call_args[0][1]
+            assert saved_summary['customer_id'] == 'customer_123'
+            assert saved_summary['first']['id'] == 'weight_1'
+
+    @patch('app.services.weight_service.get_db')
+    def test_get_latest_weights_builds_missing_summaries_concurrently(self, mock_get_db):
+        """Test that only customers without a summary are built, each saved once"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_db.collection.return_value.document.side_effect = lambda customer_id: Mock(id=customer_id)
+
+        existing = MagicMock()
+        existing.id = 'customer_0'
+        existing.exists = True
+        existing.to_dict.return_value = {'first': None, 'latest': []}
+        mock_db.get_all.return_value = [existing]
+
+        built = []
+
+        def create_summary(db, customer_id):
+            built.append(customer_id)
+            return {'customer_id': customer_id, 'first': None, 'latest': [{'id': f'{customer_id}_w1'}]}
+
+        customer_ids = [f'customer_{i}' for i in range(4)]
+        with patch('app.services.weight_service._create_summary', side_effect=create_summary):
+            result = weight_service.get_latest_weights(customer_ids)
+
+        assert sorted(built) == ['customer_1', 'customer_2', 'customer_3']
+        assert result['customer_0']['latest'] == []
+        assert result['customer_3']['latest'] == [{'id': 'customer_3_w1'}]
+
+    @patch('app.services.weight_service.get_db')
+    def test_rebuild_weight_summaries(self, mock_get_db):
+        """Test rebuilding summaries from weight history"""
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        docs = []
+        for doc_id, customer_id, weight, recorded_at in [
+            ('w1', 'customer_1', 70.0, '2026-01-02T09:00:00'),
+            ('w2', 'customer_1', 71.0, '2026-01-01T09:00:00'),
+            ('w3', 'customer_2', 60.0, '2026-01-01T09:00:00'),
+        ]:
+            doc = MagicMock()
+            doc.id = doc_id
+            doc.to_dict.return_value = {'customer_id': customer_id, 'weight': weight, 'recorded_at': recorded_at}
+            docs.append(doc)
+        mock_db.collection.return_value.stream.return_value = docs
+        mock_batch = mock_db.batch.return_value
+
+        count = weight_service.rebuild_weight_summaries()
+
+        assert count == 2
+        assert mock_batch.set.call_count == 2
+        summaries = {c[0][1]['customer_id']: c[0][1] for c in mock_batch.set.call_args_list}
+        assert summaries['customer_1']['first']['id'] == 'w2'
+        assert [r['id'] for r in summaries['customer_1']['latest']] == ['w1', 'w2']
+        mock_batch.commit.assert_called_once()
+
     @patch('app.services.weight_service.get_db')
     def test_get_weight_history_empty(self, mock_get_db):
         """Test getting weight history with no records"""
@@ -17,6 +17,12 @@ export default function BackupPage() {
       if (response.ok) {
         const data = await response.json();
 
+        // 途中で中断されたバックアップ（完了マーカーなし）は保存しない
+        if (data.complete !== true) {
+          setMessage("❌ バックアップが途中で中断されました。再度実行してください。");
+          return;
+        }
+
         // JSONファイルとしてダウンロード
         const timestamp = new Date().toISOString().replace(/[:.]/g, "-");
         const filename = `michela_backup_${timestamp}.json`;
@@ -62,6 +68,12 @@ export default function BackupPage() {
       const fileContent = await file.text();
       const backupData = JSON.parse(fileContent);
 
+      // 完了マーカーのないファイル（1.0形式以外）は途中で中断されたバックアップ
+      if (backupData.version !== "1.0" && backupData.complete !== true) {
+        setMessage("❌ 不完全なバックアップファイルです。復元できません。");
+        return;
+      }
+
       const response = await fetch(API_ENDPOINTS.RESTORE_BACKUP, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
@@ -85,135 +85,104 @@ export default function CustomerDetail() {
   };
 
   useEffect(() => {
-    const fetchCustomer = async () => {
+    // 顧客情報・体重履歴・トレーニング・食事記録・栄養目標を1回のリクエストでまとめて取得
+    const fetchOverview = async () => {
       try {
-        const response = await fetch(API_ENDPOINTS.CUSTOMER(id));
-        if (response.ok) {
-          const data = await response.json();
-          setCustomer(data);
-        } else {
+        const response = await fetch(
+          API_ENDPOINTS.CUSTOMER_OVERVIEW(id, {
+            weightLimit: 30,
+            trainingLimit: 30,
+            mealLimit: 30,
+          })
+        );
+        if (!response.ok) {
           setError("顧客データの取得に失敗しました。");
+          return;
         }
-      } catch (err) {
-        setError("ネットワークエラーが発生しました。");
-        console.error("Error fetching customer:", err);
-      } finally {
-        setLoading(false);
-      }
-    };
-
-    const fetchWeightHistory = async () => {
-      try {
-        const response = await fetch(API_ENDPOINTS.WEIGHT_HISTORY(id, 5));
-        if (response.ok) {
-          const data = await response.json();
-          setWeightHistory(data);
-        }
-      } catch (err) {
-        console.error("Error fetching weight history:", err);
-      }
-    };
-
-    const fetchStats = async () => {
-      try {
-        // 体重履歴（グラフ用・30日分）
-        const weightChartResponse = await fetch(
-          API_ENDPOINTS.WEIGHT_HISTORY(id, 30)
+        const overview = await response.json();
+        setCustomer(overview.customer);
+
+        // 体重履歴（一覧は直近5件、グラフは30件）
+        const weightData: WeightHistory[] = overview.weight_history;
+        setWeightHistory(weightData.slice(0, 5));
+        setWeightHistoryForChart(
+          weightData.map((w) => ({
+            date: w.recorded_at,
+            weight: w.weight,
+          }))
         );
-        if (weightChartResponse.ok) {
-          const weightData = await weightChartResponse.json();
-          setWeightHistoryForChart(
-            weightData.map((w: any) => ({
-              date: w.recorded_at,
-              weight: w.weight,
-            }))
-          );
-        }
 
-        // トレーニングセッション取得
-        const trainingResponse = await fetch(
-          API_ENDPOINTS.TRAINING_SESSIONS(id, 30)
+        // トレーニングセッション
+        const trainingSessions = overview.training_sessions;
+        setTrainingSessions(trainingSessions);
+
+        // トレーニング統計計算
+        const totalVolume = trainingSessions.reduce(
+          (sum: number, session: any) => {
+            const sessionVolume = session.exercises.reduce(
+              (exSum: number, exercise: any) => {
+                const exerciseVolume = exercise.sets.reduce(
+                  (setSum: number, set: any) =>
+                    setSum + set.reps * set.weight,
+                  0
+                );
+                return exSum + exerciseVolume;
+              },
+              0
+            );
+            return sum + sessionVolume;
+          },
+          0
         );
-        if (trainingResponse.ok) {
-          const trainingSessions = await trainingResponse.json();
-          setTrainingSessions(trainingSessions);
-
-          // トレーニング統計計算
-          const totalVolume = trainingSessions.reduce(
-            (sum: number, session: any) => {
-              const sessionVolume = session.exercises.reduce(
-                (exSum: number, exercise: any) => {
-                  const exerciseVolume = exercise.sets.reduce(
-                    (setSum: number, set: any) =>
-                      setSum + set.reps * set.weight,
-                    0
-                  );
-                  return exSum + exerciseVolume;
-                },
-                0
-              );
-              return sum + sessionVolume;
-            },
+
+        // ユニークな日数を計算（同じ日に複数セッションがある場合も1日としてカウント）
+        const uniqueTrainingDays = new Set(
+          trainingSessions.map((s: any) => s.date.split("T")[0])
+        ).size;
+        const avgWeeklyTraining =
+          uniqueTrainingDays > 0 ? (uniqueTrainingDays / 30) * 7 : 0;
+
+        setStats((prev) => ({
+          ...prev,
+          totalTrainingSessions: trainingSessions.length,
+          avgWeeklyTraining: Math.round(avgWeeklyTraining * 10) / 10,
+          totalVolume: Math.round(totalVolume),
+        }));
+
+        // 食事記録
+        const mealRecords = overview.meal_records;
+        setMealRecords(mealRecords);
+
+        if (mealRecords.length > 0) {
+          const totalCalories = mealRecords.reduce(
+            (sum: number, r: any) => sum + r.total_calories,
             0
           );
-
-          // ユニークな日数を計算（同じ日に複数セッションがある場合も1日としてカウント）
-          const uniqueDays = new Set(
-            trainingSessions.map((s: any) => s.date.split("T")[0])
-          ).size;
-          const avgWeeklyTraining = uniqueDays > 0 ? (uniqueDays / 30) * 7 : 0;
+          const totalProtein = mealRecords.reduce(
+            (sum: number, r: any) => sum + r.total_protein,
+            0
+          );
+          const uniqueDays = new Set(mealRecords.map((r: any) => r.date)).size;
 
           setStats((prev) => ({
             ...prev,
-            totalTrainingSessions: trainingSessions.length,
-            avgWeeklyTraining: Math.round(avgWeeklyTraining * 10) / 10,
-            totalVolume: Math.round(totalVolume),
+            avgCalories: Math.round(totalCalories / uniqueDays),
+            avgProtein: Math.round(totalProtein / uniqueDays),
           }));
         }
 
-        // 食事記録取得
-        const mealResponse = await fetch(
-          API_ENDPOINTS.MEAL_RECORDS(id, undefined, undefined, 30)
-        );
-        if (mealResponse.ok) {
-          const mealRecords = await mealResponse.json();
-          setMealRecords(mealRecords);
-
-          if (mealRecords.length > 0) {
-            const totalCalories = mealRecords.reduce(
-              (sum: number, r: any) => sum + r.total_calories,
-              0
-            );
-            const totalProtein = mealRecords.reduce(
-              (sum: number, r: any) => sum + r.total_protein,
-              0
-            );
-            const uniqueDays = new Set(mealRecords.map((r: any) => r.date))
-              .size;
-
-            setStats((prev) => ({
-              ...prev,
-              avgCalories: Math.round(totalCalories / uniqueDays),
-              avgProtein: Math.round(totalProtein / uniqueDays),
-            }));
-          }
-        }
-
-        // 栄養目標取得
-        const goalResponse = await fetch(API_ENDPOINTS.NUTRITION_GOAL(id));
-        if (goalResponse.ok) {
-          const goalData = await goalResponse.json();
-          setNutritionGoal(goalData);
-        }
+        // 栄養目標
+        setNutritionGoal(overview.nutrition_goal);
       } catch (err) {
-        console.error("Error fetching stats:", err);
+        setError("ネットワークエラーが発生しました。");
+        console.error("Error fetching customer overview:", err);
+      } finally {
+        setLoading(false);
       }
     };
 
     if (id) {
-      fetchCustomer();
-      fetchWeightHistory();
-      fetchStats();
+      fetchOverview();
     }
   }, [id]);
 
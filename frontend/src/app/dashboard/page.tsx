@@ -26,6 +26,11 @@ interface WeightRecord {
   note?: string;
 }
 
+interface LatestWeights {
+  first: WeightRecord | null;
+  latest: WeightRecord[];
+}
+
 interface CustomerWithWeightData extends Customer {
   firstWeight: number | null;
   currentWeight: number | null;
@@ -78,93 +83,49 @@ export default function Dashboard() {
         if (response.ok) {
           const data = await response.json();
 
-          // 各顧客の体重履歴を取得
-          const customersWithData = await Promise.all(
-            data.map(async (customer: Customer) => {
-              try {
-                const weightResponse = await fetch(
-                  API_ENDPOINTS.WEIGHT_HISTORY(customer.id, 1000)
-                );
-
-                if (weightResponse.ok) {
-                  const weightHistory: WeightRecord[] =
-                    await weightResponse.json();
-
-                  // 体重履歴を日付順にソート（古い順）
-                  const sortedHistory = [...weightHistory].sort(
-                    (a, b) =>
-                      new Date(a.recorded_at).getTime() -
-                      new Date(b.recorded_at).getTime()
-                  );
-
-                  const firstWeight =
-                    sortedHistory.length > 0
-                      ? sortedHistory[0].weight
-                      : customer.weight;
-                  const currentWeight =
-                    sortedHistory.length > 0
-                      ? sortedHistory[sortedHistory.length - 1].weight
-                      : customer.weight;
-                  const weightDiff = currentWeight - firstWeight;
-                  const lastUpdated =
-                    sortedHistory.length > 0
-                      ? sortedHistory[sortedHistory.length - 1].recorded_at
-                      : null;
+          // 全顧客の最初の体重・最新体重を1回のリクエストでまとめて取得
+          let latestWeights: Record<string, LatestWeights> = {};
+          try {
+            const weightResponse = await fetch(API_ENDPOINTS.LATEST_WEIGHTS, {
+              method: "POST",
+              headers: { "Content-Type": "application/json" },
+              body: JSON.stringify({
+                customer_ids: data.map((customer: Customer) => customer.id),
+                limit: 1,
+              }),
+            });
+            if (weightResponse.ok) {
+              latestWeights = await weightResponse.json();
+            }
+          } catch (error) {
+            // 取得できない場合は登録時の体重を使用
+            console.error("Error fetching latest weights:", error);
+          }
 
-                  // 完了予定日から残り日数を計算
-                  const completionDate = new Date(customer.completion_date);
-                  const today = new Date();
-                  const diffTime = completionDate.getTime() - today.getTime();
-                  const daysRemaining = Math.ceil(
-                    diffTime / (1000 * 60 * 60 * 24)
-                  );
+          const customersWithData = data.map((customer: Customer) => {
+            const weights = latestWeights[customer.id];
+            const latest = weights?.latest[0];
 
-                  return {
-                    ...customer,
-                    firstWeight,
-                    currentWeight,
-                    weightDiff,
-                    daysRemaining,
-                    lastUpdated,
-                  };
-                } else {
-                  // 体重履歴が取得できない場合は登録時の体重を使用
-                  const completionDate = new Date(customer.completion_date);
-                  const today = new Date();
-                  const diffTime = completionDate.getTime() - today.getTime();
-                  const daysRemaining = Math.ceil(
-                    diffTime / (1000 * 60 * 60 * 24)
-                  );
+            const firstWeight = weights?.first?.weight ?? customer.weight;
+            const currentWeight = latest?.weight ?? customer.weight;
+            const weightDiff = currentWeight - firstWeight;
+            const lastUpdated = latest?.recorded_at ?? null;
 
-                  return {
-                    ...customer,
-                    firstWeight: customer.weight,
-                    currentWeight: customer.weight,
-                    weightDiff: 0,
-                    daysRemaining,
-                    lastUpdated: null,
-                  };
-                }
-              } catch (error) {
-                // エラー時も登録時の体重を使用
-                const completionDate = new Date(customer.completion_date);
-                const today = new Date();
-                const diffTime = completionDate.getTime() - today.getTime();
-                const daysRemaining = Math.ceil(
-                  diffTime / (1000 * 60 * 60 * 24)
-                );
+            // 完了予定日から残り日数を計算
+            const completionDate = new Date(customer.completion_date);
+            const today = new Date();
+            const diffTime = completionDate.getTime() - today.getTime();
+            const daysRemaining = Math.ceil(diffTime / (1000 * 60 * 60 * 24));
 
-                return {
-                  ...customer,
-                  firstWeight: customer.weight,
-                  currentWeight: customer.weight,
-                  weightDiff: 0,
-                  daysRemaining,
-                  lastUpdated: null,
-                };
-              }
-            })
-          );
+            return {
+              ...customer,
+              firstWeight,
+              currentWeight,
+              weightDiff,
+              daysRemaining,
+              lastUpdated,
+            };
+          });
 
           setCustomersWithWeightData(customersWithData);
           setCustomers(data);
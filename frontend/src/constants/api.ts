@@ -22,11 +22,23 @@ export const API_ENDPOINTS = {
     REGISTER_CUSTOMER: `${API_BASE_URL}/register_customer`,
     UPDATE_CUSTOMER: (id: string) => `${API_BASE_URL}/update_customer/${id}`,
     DELETE_CUSTOMER: (id: string) => `${API_BASE_URL}/delete_customer/${id}`,
+    CUSTOMER_OVERVIEW: (
+        id: string,
+        limits?: { weightLimit?: number; trainingLimit?: number; mealLimit?: number }
+    ) => {
+        const params = new URLSearchParams();
+        if (limits?.weightLimit !== undefined) params.append('weight_limit', limits.weightLimit.toString());
+        if (limits?.trainingLimit !== undefined) params.append('training_limit', limits.trainingLimit.toString());
+        if (limits?.mealLimit !== undefined) params.append('meal_limit', limits.mealLimit.toString());
+        const queryString = params.toString();
+        return `${API_BASE_URL}/customer_overview/${id}${queryString ? `?${queryString}` : ''}`;
+    },
 
     // 体重履歴
     WEIGHT_HISTORY: (customerId: string, limit?: number) =>
         `${API_BASE_URL}/get_weight_history/${customerId}${limit ? `?limit=${limit}` : ''}`,
     ADD_WEIGHT_RECORD: (customerId: string) => `${API_BASE_URL}/add_weight_record/${customerId}`,
+    LATEST_WEIGHTS: `${API_BASE_URL}/get_latest_weights`,
 
     // トレーニング記録
     EXERCISE_PRESETS: `${API_BASE_URL}/get_exercise_presets`,